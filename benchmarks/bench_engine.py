@@ -0,0 +1,312 @@
+"""
+Meal-plan engine benchmark suite.
+
+Times the master engine (generate_enhanced_meal_plan, build_meal_plan with
+and without rainbow preferences, MealPlan.to_dict, get_enhanced_recommended_pdfs,
+calculate_flavor_balance_index) over a fixed corpus of profiles, and the
+catalog engine (select_foods, generate_daily_meal_plan) over seeded synthetic
+catalogs of 1k-100k foods, both as JSON-style dicts and compiled into a
+catalog store, plus per-plan nutrient totals and batch scoring of candidate
+plans on the store, shopping-list aggregation and streaming for 7- and 14-day
+family plans, and the results payload built by an engine run versus from a
+pooled plan (plan_pool.py).
+
+Each run is written to benchmarks/results/<timestamp>.json. Pass --baseline to
+compare against an earlier run; cases slower by more than --threshold are
+flagged and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_engine.py [--quick] [--sizes 1000,10000,100000]
+    python benchmarks/bench_engine.py --baseline benchmarks/results/baseline.json
+    python benchmarks/bench_engine.py --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import catalog_engine  # noqa: E402
+import catalog_store  # noqa: E402
+import plan_results  # noqa: E402
+import preferences  # noqa: E402
+import shopping_list  # noqa: E402
+from data_registry import registry  # noqa: E402
+from master_engine import (  # noqa: E402
+    build_meal_plan, calculate_flavor_balance_index, generate_enhanced_meal_plan,
+    get_enhanced_recommended_pdfs,
+)
+
+RESULTS_DIR = Path(ROOT) / "benchmarks" / "results"
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# -----------------------------
+# FIXED CORPUS
+# -----------------------------
+CONDITIONS = {
+    "none": [],
+    "glp1": ["GLP-1 medication"],
+    "bariatric": ["Bariatric surgery"],
+    "breastfeeding": ["Breastfeeding"],
+}
+GOALS = ["blood_sugar", "blood pressure", "weight loss", "digestive health", "general_wellness"]
+DURATIONS = (3, 7, 14)
+
+
+def profile_corpus():
+    """Every cuisine × condition × duration, with goals rotated deterministically."""
+    profiles = []
+    for cuisine in sorted(registry.current().cuisine_meals):
+        for condition, special in CONDITIONS.items():
+            for duration in DURATIONS:
+                profiles.append({
+                    "name": "Bench",
+                    "cuisines": [cuisine],
+                    "health_goal": GOALS[len(profiles) % len(GOALS)],
+                    "special_conditions": special,
+                    "plan_duration": duration,
+                    # catalog engine fields
+                    "culture": cuisine,
+                    "is_glp1": condition == "glp1",
+                    "is_bariatric": condition == "bariatric",
+                })
+    return profiles
+
+
+CANDIDATES = 256
+FAMILY_SIZE = 6
+
+
+def plan_totals(plan):
+    """The dict-path nutrient checks generate_daily_meal_plan runs on a plan."""
+    return (catalog_engine.check_rainbow_coverage(plan), catalog_engine.check_fiber_target(plan),
+            catalog_engine.check_protein_target(plan))
+
+
+FOOD_TYPES = ["vegetable", "vegetable", "fruit", "protein", "carbohydrate", "dairy", "snack"]
+COLORS = ["red", "orange", "yellow", "green", "purple", "white"]
+HEALTH_TAGS = ["fiber-rich", "heart-healthy", "low-sodium", "high-protein", "low-gi", "probiotic"]
+
+
+def synthetic_catalog(size, seed=42):
+    """Deterministic catalog with the field mix the catalog engine filters on."""
+    rng = random.Random(seed)
+    cultures = sorted(registry.current().cuisine_meals) + [catalog_engine.UNIVERSAL_CULTURE]
+    foods = []
+    for i in range(size):
+        food_type = rng.choice(FOOD_TYPES)
+        foods.append({
+            "name": f"food-{i}",
+            "type": food_type,
+            "color": rng.choice(COLORS),
+            "cultures": rng.sample(cultures, rng.randint(1, 3)),
+            "glp1_friendly": rng.random() < 0.7,
+            "health_tags": rng.sample(HEALTH_TAGS, rng.randint(0, 3)),
+            "fiber_g": round(rng.uniform(0, 12), 1),
+            "protein_g": round(rng.uniform(0, 35 if food_type == "protein" else 8), 1),
+        })
+    return foods
+
+
+# -----------------------------
+# TIMING
+# -----------------------------
+def measure(func, args_list, min_time, max_rounds=1000):
+    """Call func over args_list repeatedly for at least min_time seconds.
+
+    Returns per-call statistics in microseconds, taken over rounds of one pass
+    through args_list each.
+    """
+    random.seed(1234)
+    func(*args_list[0])  # warm-up
+    rounds = []
+    deadline = time.perf_counter() + min_time
+    while len(rounds) < 3 or (time.perf_counter() < deadline and len(rounds) < max_rounds):
+        start = time.perf_counter_ns()
+        for args in args_list:
+            func(*args)
+        rounds.append((time.perf_counter_ns() - start) / 1000 / len(args_list))
+    rounds.sort()
+    return {
+        "median_us": round(statistics.median(rounds), 3),
+        "min_us": round(rounds[0], 3),
+        "p95_us": round(rounds[min(len(rounds) - 1, int(len(rounds) * 0.95))], 3),
+        "rounds": len(rounds),
+        "calls_per_round": len(args_list),
+    }
+
+
+def run_suite(sizes, min_time):
+    profiles = profile_corpus()
+    results = {}
+
+    plans = [generate_enhanced_meal_plan(p) for p in profiles]
+    results["master.generate_enhanced_meal_plan"] = measure(
+        generate_enhanced_meal_plan, [(p,) for p in profiles], min_time)
+    results["master.get_enhanced_recommended_pdfs"] = measure(
+        get_enhanced_recommended_pdfs, [(p,) for p in profiles], min_time)
+    results["master.calculate_flavor_balance_index"] = measure(
+        calculate_flavor_balance_index, [(p,) for p in plans], min_time)
+    for duration in DURATIONS:
+        subset = [(p,) for p in profiles if p["plan_duration"] == duration]
+        results[f"master.generate_enhanced_meal_plan[{duration}d]"] = measure(
+            generate_enhanced_meal_plan, subset, min_time)
+
+    # The plan objects on their own: building one, and rendering it to the template dict
+    results["master.build_meal_plan"] = measure(build_meal_plan, [(p,) for p in profiles], min_time)
+    # Every sixth rainbow food liked, rotated per profile
+    liked = [dict(p, rainbow_preferences=preferences.rainbow_preferences(
+        sum(1 << j for j in range(i % 6, len(preferences.RAINBOW_FOODS), 6)))) for i, p in enumerate(profiles)]
+    results["master.build_meal_plan[preferences]"] = measure(build_meal_plan, [(p,) for p in liked], min_time)
+    random.seed(0)
+    plan_objects = [(build_meal_plan(p),) for p in profiles]
+    results["plan.to_dict"] = measure(lambda plan: plan.to_dict(), plan_objects, min_time)
+
+    # Shopping lists: aggregation without the cache, the cached lookup, and each streamed format
+    table = registry.current().index("shopping_list")
+    for duration in (7, 14):
+        subset = [plan for (plan,) in plan_objects if plan.plan_duration == duration]
+        results[f"shopping.aggregate[{duration}d]"] = measure(
+            table.aggregate, [(plan, FAMILY_SIZE) for plan in subset], min_time)
+    long_plans = [(plan, FAMILY_SIZE) for (plan,) in plan_objects if plan.plan_duration == 14]
+    results["shopping.build_shopping_list[cached]"] = measure(shopping_list.build_shopping_list, long_plans, min_time)
+    lists = [(table.aggregate(*args),) for args in long_plans]
+    for fmt in shopping_list.FORMATS:
+        results[f"shopping.stream[{fmt}]"] = measure(
+            lambda sl, fmt=fmt: "".join(shopping_list.stream(sl, fmt)), lists, min_time)
+
+    # Results payloads: a full engine run, and a pooled plan whose display dict was built ahead
+    data = registry.current()
+    results["results.generate_payload"] = measure(
+        plan_results.generate_payload, [(p, data, i) for i, p in enumerate(profiles)], min_time)
+    pooled = []
+    for i, p in enumerate(profiles):
+        plan, flavor_balance_index = plan_results.build_plan(p, data, i)
+        pooled.append((plan, flavor_balance_index, p, data, i, None, plan.to_dict()))
+    results["results.plan_payload[pooled]"] = measure(plan_results.plan_payload, pooled, min_time)
+
+    # The catalog engine scans the whole catalog per selection, so a sample of
+    # the corpus (one profile per cuisine/condition) keeps large sizes tractable.
+    daily_profiles = [p for p in profiles if p["plan_duration"] == 3]
+    for size in sizes:
+        catalog = synthetic_catalog(size)
+        budget = min_time if size <= 10000 else min_time / 2
+        results[f"catalog.select_foods[{size}]"] = measure(
+            catalog_engine.select_foods,
+            [(catalog, "vegetable", 2, {"glp1_friendly": True, "culture": p["culture"]}) for p in daily_profiles],
+            budget)
+        results[f"catalog.generate_daily_meal_plan[{size}]"] = measure(
+            catalog_engine.generate_daily_meal_plan, [(p, catalog) for p in daily_profiles], budget, max_rounds=50)
+        random.seed(0)
+        dict_plans = [(catalog_engine.generate_daily_meal_plan(p, catalog),) for p in daily_profiles]
+        results[f"catalog.plan_totals[{size}]"] = measure(plan_totals, dict_plans, budget)
+
+        # The same catalog compiled and memory-mapped (catalog_store.py)
+        with tempfile.TemporaryDirectory() as directory:
+            catalog_store.build_store(catalog, directory)
+            store = catalog_store.CatalogStore(directory)
+            results[f"store.select_foods[{size}]"] = measure(
+                catalog_engine.select_foods,
+                [(store, "vegetable", 2, {"glp1_friendly": True, "culture": p["culture"]}) for p in daily_profiles],
+                budget)
+            results[f"store.generate_daily_meal_plan[{size}]"] = measure(
+                catalog_engine.generate_daily_meal_plan, [(p, store) for p in daily_profiles], budget, max_rounds=50)
+            random.seed(0)
+            id_arrays = [catalog_engine.generate_daily_meal_plan(p, store)["food_ids"] for p in daily_profiles]
+            results[f"store.plan_totals[{size}]"] = measure(
+                catalog_engine.nutrient_totals, [(store, ids) for ids in id_arrays], budget)
+            # Scoring many candidate plans at once: one row of food ids per candidate
+            candidates = catalog_engine.stack_food_ids((id_arrays * (CANDIDATES // len(id_arrays) + 1))[:CANDIDATES])
+            results[f"store.score_candidates[{CANDIDATES}][{size}]"] = measure(
+                catalog_engine.nutrient_totals, [(store, candidates)], budget)
+            del store
+    return results
+
+
+# -----------------------------
+# RESULTS
+# -----------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Return [(case, baseline_us, current_us, change)] for cases slower than threshold."""
+    regressions = []
+    for case, stats in current.items():
+        before = baseline.get(case)
+        if not before:
+            continue
+        change = stats["median_us"] / before["median_us"] - 1 if before["median_us"] else 0.0
+        if change > threshold:
+            regressions.append((case, before["median_us"], stats["median_us"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="catalog sizes")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per case")
+    parser.add_argument("--quick", action="store_true", help="short run (1k and 10k catalogs, 0.2s per case)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold (0.10 = 10%% slower)")
+    parser.add_argument("--save-baseline", action="store_true", help="also write results/baseline.json")
+    parser.add_argument("--output", help="results file (default results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    min_time = args.min_time
+    if args.quick:
+        sizes = [s for s in sizes if s <= 10000]
+        min_time = 0.2
+
+    results = run_suite(sizes, min_time)
+    run = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus_profiles": len(profile_corpus()),
+        "results": results,
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(run, indent=2))
+    if args.save_baseline:
+        (RESULTS_DIR / "baseline.json").write_text(json.dumps(run, indent=2))
+
+    width = max(len(case) for case in results)
+    print(f"{'case':<{width}}  {'median µs':>12}  {'p95 µs':>12}")
+    for case, stats in results.items():
+        print(f"{case:<{width}}  {stats['median_us']:12.1f}  {stats['p95_us']:12.1f}")
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regression(s) vs {args.baseline} (commit {baseline.get('commit')}):")
+            for case, before, after, change in regressions:
+                print(f"  {case:<{width}}  {before:12.1f} → {after:12.1f} µs  (+{change * 100:.0f}%)")
+            sys.exit(1)
+        print(f"\n✅ No regressions over {args.threshold * 100:.0f}% vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
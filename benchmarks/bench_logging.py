@@ -0,0 +1,136 @@
+"""
+Logging overhead micro-benchmark.
+
+Replays the records one /webhook/quiz request logs through a file-style and a
+console-style handler (writing to memory) and reports the cost per request for
+the previous per-handler, four-regex PIIMaskedFormatter and the current
+single-pass formatter. Also checks that both produce identical output.
+
+Usage:
+    python benchmarks/bench_logging.py [--requests 20000]
+"""
+
+import argparse
+import io
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_utils import PIIMaskedFormatter  # noqa: E402
+
+
+class LegacyPIIMaskedFormatter(logging.Formatter):
+    """The formatter as it was before single-pass masking, kept for comparison."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+        self.phone_pattern = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+
+    def mask_name_fields(self, text):
+        text = re.sub(r'"(name|firstName|lastName)"\s*:\s*"(?:[^"\\]|\\.)*"',
+                      lambda m: f'"{m.group(1)}": "[REDACTED]"', text)
+        text = re.sub(r"'(name|firstName|lastName)'\s*:\s*'(?:[^'\\]|\\.)*'",
+                      lambda m: f"'{m.group(1)}': '[REDACTED]'", text)
+        return text
+
+    def format(self, record):
+        original = super().format(record)
+        masked = self.email_pattern.sub(lambda m: self.mask_email(m.group()), original)
+        masked = self.phone_pattern.sub('***-***-****', masked)
+        return self.mask_name_fields(masked)
+
+    def mask_email(self, email):
+        parts = email.split('@')
+        if len(parts) == 2:
+            username, domain = parts
+            if len(username) > 2:
+                username = username[0] + '*' * (len(username) - 2) + username[-1]
+            else:
+                username = '*' * len(username)
+            return f"{username}@{domain}"
+        return email
+
+
+PAYLOAD = {
+    "email": "jane.doe@example.com", "name": "Jane O'Doe", "phone": "555-123-4567",
+    "cuisines": ["Caribbean", "Mediterranean"], "health_goal": "blood_sugar",
+    "special_conditions": ["glp1"], "plan_duration": 7,
+}
+
+# What one webhook request logs today (mirrors main.py and ghl_integration.py)
+REQUEST_MESSAGES = [
+    f"Received quiz webhook: {PAYLOAD}",
+    "Contact found for email: jane.doe@example.com",
+    "User status: returning for email: jane.doe@example.com",
+    "Tag 'Freemium-Used' added to contact abc123XYZ",
+    "Email sent to jane.doe@example.com",
+    "Email sent to admin@welforehealth.com",
+    "Free plan delivered to returning user: jane.doe@example.com",
+    "Rate limit (ip) exceeded on /webhook/quiz; retry after 3s",
+    "WelFore Health App started",
+]
+
+
+def make_logger(formatter_cls, name):
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    stream_a, stream_b = io.StringIO(), io.StringIO()
+    file_handler = logging.StreamHandler(stream_a)
+    file_handler.setFormatter(formatter_cls('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    console_handler = logging.StreamHandler(stream_b)
+    console_handler.setFormatter(formatter_cls('%(levelname)s: %(message)s'))
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger, stream_a, stream_b
+
+
+def run(formatter_cls, name, requests):
+    logger, stream_a, stream_b = make_logger(formatter_cls, name)
+    start = time.perf_counter()
+    for _ in range(requests):
+        for message in REQUEST_MESSAGES:
+            logger.info(message)
+        if stream_a.tell() > 1 << 22:
+            stream_a.seek(0)
+            stream_a.truncate()
+            stream_b.seek(0)
+            stream_b.truncate()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def check_equivalence():
+    legacy = LegacyPIIMaskedFormatter('%(levelname)s: %(message)s')
+    current = PIIMaskedFormatter('%(levelname)s: %(message)s')
+    for message in REQUEST_MESSAGES:
+        a = legacy.format(logging.makeLogRecord({"msg": message, "levelname": "INFO"}))
+        b = current.format(logging.makeLogRecord({"msg": message, "levelname": "INFO"}))
+        if a != b:
+            raise SystemExit(f"Masking mismatch:\n  legacy:  {a}\n  current: {b}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    check_equivalence()
+    run(PIIMaskedFormatter, "bench.warmup", 200)
+
+    legacy = run(LegacyPIIMaskedFormatter, "bench.legacy", args.requests)
+    current = run(PIIMaskedFormatter, "bench.current", args.requests)
+
+    print(f"Logging overhead per webhook request ({len(REQUEST_MESSAGES)} records, 2 handlers):")
+    print(f"  legacy formatter:      {legacy:8.1f} µs")
+    print(f"  single-pass formatter: {current:8.1f} µs")
+    print(f"  reduction:             {(1 - current / legacy) * 100:8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
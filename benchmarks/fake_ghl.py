@@ -0,0 +1,163 @@
+"""
+Fake GoHighLevel REST server for load tests.
+
+Implements the three contact calls ghl_integration.py makes:
+    GET  /contacts/?email=...   lookup
+    POST /contacts/             create
+    PUT  /contacts/{id}         add tags
+
+Contacts are kept in memory. Addresses starting with "returning" exist
+without tags and addresses starting with "repeat" exist with the
+Freemium-Used tag, so the new/returning/repeat flows can be driven without
+any seeding. Every response waits --ghl-latency-ms (± --ghl-jitter-ms) and
+fails with a 500 at --ghl-error-rate.
+
+Usage:
+    python benchmarks/fake_ghl.py [--port 8765] [--ghl-latency-ms 120] [--ghl-error-rate 0.01]
+    GHL_API_URL=http://127.0.0.1:8765 python launcher.py
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGHL:
+    def __init__(self, latency_ms=100.0, jitter_ms=20.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.contacts = {}     # id -> contact
+        self.by_email = {}     # email -> id
+        self.ids = itertools.count(1)
+        self.calls = {"lookup": 0, "create": 0, "tag": 0, "errors": 0}
+
+    def delay(self) -> bool:
+        """Sleep for the configured latency; returns True when this call should fail."""
+        with self.lock:
+            wait = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.calls["errors"] += 1
+        time.sleep(wait)
+        return fail
+
+    def _add(self, email, name="", tags=()):
+        contact_id = f"fake{next(self.ids):08d}"
+        contact = {"id": contact_id, "email": email, "name": name, "tags": list(tags)}
+        self.contacts[contact_id] = contact
+        self.by_email[email] = contact_id
+        return contact
+
+    def lookup(self, email):
+        with self.lock:
+            self.calls["lookup"] += 1
+            contact_id = self.by_email.get(email)
+            if contact_id is None and email.startswith("returning"):
+                return [dict(self._add(email))]
+            if contact_id is None and email.startswith("repeat"):
+                return [dict(self._add(email, tags=["Freemium-Used"]))]
+            return [dict(self.contacts[contact_id])] if contact_id else []
+
+    def create(self, email, name):
+        with self.lock:
+            self.calls["create"] += 1
+            existing = self.by_email.get(email)
+            return dict(self.contacts[existing]) if existing else dict(self._add(email, name))
+
+    def tag(self, contact_id, tags):
+        with self.lock:
+            self.calls["tag"] += 1
+            contact = self.contacts.get(contact_id)
+            if contact is None:
+                return None
+            contact["tags"] = sorted(set(contact["tags"]) | set(tags))
+            return dict(contact)
+
+    def serve(self, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+        """Start serving on a daemon thread; returns the server (server.server_port is the bound port)."""
+        server = ThreadingHTTPServer((host, port), make_handler(self))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-ghl", daemon=True).start()
+        return server
+
+
+def make_handler(ghl: FakeGHL):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                return self.reply(200, {**ghl.calls, "contacts": len(ghl.contacts)})
+            if ghl.delay():
+                return self.reply(500, {"error": "injected failure"})
+            if url.path.rstrip("/") == "/contacts":
+                email = (parse_qs(url.query).get("email") or [""])[0].lower()
+                return self.reply(200, {"contacts": ghl.lookup(email)})
+            self.reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            data = self.read_json()
+            if ghl.delay():
+                return self.reply(500, {"error": "injected failure"})
+            if urlparse(self.path).path.rstrip("/") == "/contacts":
+                contact = ghl.create(data.get("email", "").lower(), data.get("name", ""))
+                return self.reply(201, {"contact": contact})
+            self.reply(404, {"error": "not found"})
+
+        def do_PUT(self):
+            data = self.read_json()
+            if ghl.delay():
+                return self.reply(500, {"error": "injected failure"})
+            path = urlparse(self.path).path.rstrip("/")
+            if path.startswith("/contacts/"):
+                contact = ghl.tag(path.rsplit("/", 1)[-1], data.get("tags", []))
+                if contact is None:
+                    return self.reply(404, {"error": "contact not found"})
+                return self.reply(200, {"contact": contact})
+            self.reply(404, {"error": "not found"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def add_arguments(parser):
+    parser.add_argument("--ghl-latency-ms", type=float, default=100.0)
+    parser.add_argument("--ghl-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--ghl-error-rate", type=float, default=0.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = FakeGHL(args.ghl_latency_ms, args.ghl_jitter_ms, args.ghl_error_rate)
+    server = fake.serve(port=args.port)
+    print(f"Fake GHL listening on http://127.0.0.1:{server.server_port} (stats at /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
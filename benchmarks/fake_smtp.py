@@ -0,0 +1,116 @@
+"""
+Fake SMTP server for load tests.
+
+Speaks enough SMTP for smtplib's send_message(): EHLO/HELO, AUTH (any
+credentials accepted), MAIL, RCPT, DATA, RSET, NOOP and QUIT. It does not
+offer STARTTLS, so run the app with SMTP_STARTTLS=false. Messages are
+counted, not stored. DATA is acknowledged after --smtp-latency-ms
+(± --smtp-jitter-ms) and rejected with 451 at --smtp-error-rate.
+
+Usage:
+    python benchmarks/fake_smtp.py [--port 8025] [--smtp-latency-ms 200] [--smtp-error-rate 0.01]
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=false python launcher.py
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class FakeSMTP:
+    def __init__(self, latency_ms=150.0, jitter_ms=30.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"connections": 0, "messages": 0, "rejected": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def deliver(self) -> bool:
+        """Wait like a relay would; returns False when this message should be rejected."""
+        with self.lock:
+            wait = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            ok = self.rng.random() >= self.error_rate
+            self.stats["messages" if ok else "rejected"] += 1
+        time.sleep(wait)
+        return ok
+
+    def serve(self, host="127.0.0.1", port=0) -> socketserver.ThreadingTCPServer:
+        """Start serving on a daemon thread; returns the server (server.server_address[1] is the port)."""
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer((host, port), make_handler(self))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-smtp", daemon=True).start()
+        return server
+
+
+def make_handler(smtp: FakeSMTP):
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(line.encode() + b"\r\n")
+
+        def handle(self):
+            smtp.count("connections")
+            self.reply("220 fake-smtp ESMTP ready")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode("latin-1").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    self.wfile.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif verb == "HELO":
+                    self.reply("250 fake-smtp")
+                elif verb == "AUTH":
+                    if command.upper().startswith("AUTH LOGIN"):
+                        # username and password prompts, any values accepted
+                        if len(command.split()) < 3:
+                            self.reply("334 VXNlcm5hbWU6")
+                            self.rfile.readline()
+                        self.reply("334 UGFzc3dvcmQ6")
+                        self.rfile.readline()
+                    self.reply("235 2.7.0 Authentication successful")
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    self.reply("250 OK")
+                elif verb == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                        pass
+                    if smtp.deliver():
+                        self.reply("250 OK queued")
+                    else:
+                        self.reply("451 4.3.0 Injected failure")
+                elif verb == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("502 Command not implemented")
+
+    return Handler
+
+
+def add_arguments(parser):
+    parser.add_argument("--smtp-latency-ms", type=float, default=150.0)
+    parser.add_argument("--smtp-jitter-ms", type=float, default=30.0)
+    parser.add_argument("--smtp-error-rate", type=float, default=0.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8025)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = FakeSMTP(args.smtp_latency_ms, args.smtp_jitter_ms, args.smtp_error_rate)
+    server = fake.serve(port=args.port)
+    print(f"Fake SMTP listening on 127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,295 @@
+"""
+Concurrent load test against local GHL and SMTP stand-ins.
+
+Starts the fake GHL server and fake SMTP server (benchmarks/fake_ghl.py and
+fake_smtp.py) in this process, launches the app through launcher.py pointed
+at them, then drives the webhook scenarios from a pool of client threads:
+
+    new        unknown email            -> create contact, tag, free plan + admin email
+    returning  known email, no tag      -> tag, free plan + admin email
+    repeat     known email, tagged      -> upsell email
+    missing    no email                 -> 400
+
+Each scenario sends fresh addresses (e.g. new-17@load.test), so the mix stays
+the same throughout the run. Reports throughput and p50/p95/p99 latency per
+endpoint and scenario, and how many responses did not match the expected
+outcome. Results are written to benchmarks/results/load-<timestamp>.json.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --requests 2000
+    python benchmarks/load_test.py --duration 30 --workers 2 --ghl-latency-ms 250 --ghl-error-rate 0.02
+    python benchmarks/load_test.py --endpoint /freemium-check --mix new=1,repeat=1
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_ghl  # noqa: E402
+import fake_smtp  # noqa: E402
+
+RESULTS_DIR = Path(ROOT) / "benchmarks" / "results"
+
+# scenario -> (email prefix or None, expected status, expected "status" field per endpoint)
+SCENARIOS = {
+    "new": ("new", 200, {"/webhook/quiz": "delivered", "/freemium-check": "ok"}),
+    "returning": ("returning", 200, {"/webhook/quiz": "delivered", "/freemium-check": "ok"}),
+    "repeat": ("repeat", 200, {"/webhook/quiz": "blocked", "/freemium-check": "blocked"}),
+    "missing": (None, 400, {}),
+}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name.strip()] = int(weight or 1)
+    return [name for name, weight in mix.items() for _ in range(weight)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# -----------------------------
+# APP PROCESS
+# -----------------------------
+def start_app(port, ghl_port, smtp_port, workers, keep_rate_limits, extra_env=None):
+    env = dict(os.environ,
+               PORT=str(port), HOST="127.0.0.1", WEB_CONCURRENCY=str(workers),
+               GHL_API_URL=f"http://127.0.0.1:{ghl_port}", GHL_API_KEY="load-test", GHL_LOCATION_ID="load-test",
+               SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp_port), SMTP_STARTTLS="false",
+               SMTP_USER="app@load.test", SMTP_PASSWORD="load-test", ADMIN_EMAIL="admin@load.test")
+    if not keep_rate_limits:
+        env["RATE_LIMIT_ENABLED"] = "false"   # every request comes from one IP
+    env.update(extra_env or {})
+    # App output goes to a file: an unread pipe would fill up and stall the log writer thread
+    output = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, "launcher.py"], cwd=ROOT, env=env,
+                               stdout=output, stderr=subprocess.STDOUT, start_new_session=True)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            output.seek(0)
+            raise SystemExit(f"App exited during startup:\n{output.read().decode(errors='replace')[-2000:]}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            time.sleep(0.2)
+    stop_app(process)
+    raise SystemExit("App did not become healthy within 30s")
+
+
+def stop_app(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=40)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+# -----------------------------
+# CLIENTS
+# -----------------------------
+class LoadClient:
+    """Sends requests over one keep-alive connection per thread."""
+
+    def __init__(self, port, endpoint, timeout):
+        self.port = port
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.local = threading.local()
+        self.counter = itertools.count()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, scenario):
+        prefix, expected_status, expected_body = SCENARIOS[scenario]
+        n = next(self.counter)
+        payload = {"name": f"Load Tester {n}"}
+        if prefix:
+            payload["email"] = f"{prefix}-{n}-{os.getpid()}@load.test"
+        body = json.dumps(payload)
+
+        start = time.perf_counter()
+        try:
+            conn = self.connection()
+            conn.request("POST", self.endpoint, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.local.conn = None
+            return scenario, time.perf_counter() - start, 0, False
+        elapsed = time.perf_counter() - start
+
+        ok = status == expected_status
+        expected = expected_body.get(self.endpoint)
+        if ok and expected:
+            try:
+                ok = json.loads(data).get("status") == expected
+            except ValueError:
+                ok = False
+        return scenario, elapsed, status, ok
+
+
+def run_load(client, mix, concurrency, total, duration):
+    samples = {name: [] for name in set(mix)}
+    failures = {name: 0 for name in set(mix)}
+    statuses = {}
+    lock = threading.Lock()
+    picks = itertools.cycle(mix)
+    stop_at = time.monotonic() + duration if duration else None
+    remaining = itertools.count()
+
+    def worker():
+        while True:
+            if stop_at is not None:
+                if time.monotonic() >= stop_at:
+                    return
+            elif next(remaining) >= total:
+                return
+            with lock:
+                scenario = next(picks)
+            name, elapsed, status, ok = client.send(scenario)
+            with lock:
+                samples[name].append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if not ok:
+                    failures[name] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return samples, failures, statuses, time.perf_counter() - start
+
+
+def summarize(samples, failures, wall_time):
+    report = {}
+    everything = []
+    for name, values in sorted(samples.items()):
+        values.sort()
+        everything.extend(values)
+        report[name] = {
+            "requests": len(values),
+            "unexpected": failures[name],
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+    everything.sort()
+    report["all"] = {
+        "requests": len(everything),
+        "unexpected": sum(failures.values()),
+        "throughput_rps": round(len(everything) / wall_time, 1) if wall_time else 0.0,
+        "p50_ms": round(percentile(everything, 50) * 1000, 2),
+        "p95_ms": round(percentile(everything, 95) * 1000, 2),
+        "p99_ms": round(percentile(everything, 99) * 1000, 2),
+        "max_ms": round(everything[-1] * 1000, 2) if everything else 0.0,
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", action="append", choices=["/webhook/quiz", "/freemium-check"],
+                        help="endpoint to drive (repeatable; default /webhook/quiz)")
+    parser.add_argument("--mix", default="new=3,returning=2,repeat=4,missing=1", help="scenario weights")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per endpoint (overrides --requests)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="app workers (WEB_CONCURRENCY)")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="leave admission control on")
+    parser.add_argument("--output", help="results file (default results/load-<timestamp>.json)")
+    fake_ghl.add_arguments(parser)
+    fake_smtp.add_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = args.endpoint or ["/webhook/quiz"]
+    mix = parse_mix(args.mix)
+
+    ghl = fake_ghl.FakeGHL(args.ghl_latency_ms, args.ghl_jitter_ms, args.ghl_error_rate, seed=1)
+    ghl_server = ghl.serve()
+    smtp = fake_smtp.FakeSMTP(args.smtp_latency_ms, args.smtp_jitter_ms, args.smtp_error_rate, seed=2)
+    smtp_server = smtp.serve()
+    port = free_port()
+    app = start_app(port, ghl_server.server_port, smtp_server.server_address[1], args.workers, args.keep_rate_limits)
+
+    print(f"App on :{port} ({args.workers} worker(s)); fake GHL {args.ghl_latency_ms:.0f}ms "
+          f"err={args.ghl_error_rate:.1%}; fake SMTP {args.smtp_latency_ms:.0f}ms err={args.smtp_error_rate:.1%}; "
+          f"concurrency={args.concurrency}")
+
+    results = {}
+    try:
+        for endpoint in endpoints:
+            client = LoadClient(port, endpoint, args.timeout)
+            samples, failures, statuses, wall = run_load(client, mix, args.concurrency, args.requests, args.duration)
+            report = summarize(samples, failures, wall)
+            report["status_codes"] = {str(k): v for k, v in sorted(statuses.items())}
+            results[endpoint] = report
+
+            print(f"\n{endpoint}  {report['all']['requests']} requests in {wall:.1f}s "
+                  f"= {report['all']['throughput_rps']} req/s  status codes {report['status_codes']}")
+            print(f"  {'scenario':<10} {'requests':>8} {'unexpected':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+            for name, row in report.items():
+                if name == "status_codes":
+                    continue
+                print(f"  {name:<10} {row['requests']:>8} {row['unexpected']:>10} {row['p50_ms']:>9.1f} "
+                      f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    finally:
+        stop_app(app)
+        ghl_server.shutdown()
+        smtp_server.shutdown()
+
+    print(f"\nFake GHL calls: {ghl.calls}   Fake SMTP: {smtp.stats}")
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps({
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+        "fake_ghl": ghl.calls,
+        "fake_smtp": smtp.stats,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Memory soak test.
+
+Runs the app (one worker, MEMORY_TRACKING=true) against the fake GHL and
+SMTP servers, sends load in fixed-size windows and reads /admin/memory after
+each window. The first --warmup windows fill caches and pools. Over the rest,
+traced memory and RSS are fitted with a straight line, and the run fails
+(exit 1) when steady-state growth exceeds the limits.
+
+The top allocation sites that grew during the steady-state windows are
+printed, so a failure points at the code responsible.
+
+Usage:
+    python benchmarks/soak_test.py [--windows 10] [--window-requests 500] [--warmup 3]
+    python benchmarks/soak_test.py --max-traced-kb-per-1k 64 --max-rss-mb-per-1k 1
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_ghl  # noqa: E402
+import fake_smtp  # noqa: E402
+from load_test import LoadClient, free_port, parse_mix, run_load, start_app, stop_app  # noqa: E402
+
+ADMIN_TOKEN = "soak-test"
+
+
+def memory_report(port, limit=10):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", f"/admin/memory?snapshot=true&limit={limit}", headers={"X-Admin-Token": ADMIN_TOKEN})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    if response.status != 200:
+        raise SystemExit(f"/admin/memory returned {response.status}: {body[:200]!r}")
+    return json.loads(body)
+
+
+def slope(xs, ys):
+    """Least-squares slope of ys over xs (0 when there are too few points)."""
+    if len(xs) < 2:
+        return 0.0
+    return statistics.linear_regression(xs, ys).slope
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=int, default=10, help="measurement windows after warm-up")
+    parser.add_argument("--warmup", type=int, default=3, help="warm-up windows (not judged)")
+    parser.add_argument("--window-requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoint", default="/webhook/quiz", choices=["/webhook/quiz", "/freemium-check"])
+    parser.add_argument("--mix", default="new=3,returning=2,repeat=4,missing=1")
+    parser.add_argument("--max-traced-kb-per-1k", type=float, default=64.0,
+                        help="allowed traced-memory growth in KiB per 1000 requests")
+    parser.add_argument("--max-rss-mb-per-1k", type=float, default=1.0,
+                        help="allowed RSS growth in MiB per 1000 requests")
+    fake_ghl.add_arguments(parser)
+    fake_smtp.add_arguments(parser)
+    parser.set_defaults(ghl_latency_ms=5.0, ghl_jitter_ms=2.0, smtp_latency_ms=5.0, smtp_jitter_ms=2.0)
+    args = parser.parse_args()
+
+    ghl = fake_ghl.FakeGHL(args.ghl_latency_ms, args.ghl_jitter_ms, args.ghl_error_rate, seed=1)
+    ghl_server = ghl.serve()
+    smtp = fake_smtp.FakeSMTP(args.smtp_latency_ms, args.smtp_jitter_ms, args.smtp_error_rate, seed=2)
+    smtp_server = smtp.serve()
+    port = free_port()
+    app = start_app(port, ghl_server.server_port, smtp_server.server_address[1], workers=1, keep_rate_limits=False,
+                    extra_env={"MEMORY_TRACKING": "true", "ADMIN_TOKEN": ADMIN_TOKEN,
+                               "MEMORY_SNAPSHOT_INTERVAL": "86400", "MAX_REQUESTS": "0"})
+
+    client = LoadClient(port, args.endpoint, timeout=60)
+    mix = parse_mix(args.mix)
+    points = []   # (requests so far, traced bytes, rss bytes)
+    sent = 0
+    print(f"{'window':>6} {'requests':>9} {'traced KiB':>11} {'RSS MiB':>9}")
+    try:
+        steady_start = None
+        for window in range(args.warmup + args.windows):
+            run_load(client, mix, args.concurrency, args.window_requests, 0)
+            sent += args.window_requests
+            report = memory_report(port)
+            if window == args.warmup - 1 or (args.warmup == 0 and window == 0):
+                steady_start = report
+            label = "warm" if window < args.warmup else str(window - args.warmup + 1)
+            print(f"{label:>6} {sent:>9} {report['traced_bytes'] / 1024:>11.1f} "
+                  f"{(report['rss_bytes'] or 0) / 1048576:>9.1f}")
+            if window >= args.warmup:
+                points.append((sent, report["traced_bytes"], report["rss_bytes"] or 0))
+        final = memory_report(port, limit=10)
+    finally:
+        stop_app(app)
+        ghl_server.shutdown()
+        smtp_server.shutdown()
+
+    xs = [p[0] for p in points]
+    traced_kb_per_1k = slope(xs, [p[1] for p in points]) * 1000 / 1024
+    rss_mb_per_1k = slope(xs, [p[2] for p in points]) * 1000 / 1048576
+
+    print("\nPer-route retained bytes (all windows):")
+    for route, stats in final["routes"].items():
+        print(f"  {route:<20} {stats['requests']:>8} requests  {stats['retained_per_request']:>10.1f} B/request")
+
+    if steady_start is not None:
+        # Sites that grew since the end of warm-up, from the app's own snapshots
+        before = {s["site"]: s["size_bytes"] for s in steady_start.get("top_sites", [])}
+        print("\nTop allocation sites at end of run (KiB, change since warm-up):")
+        for site in final.get("top_sites", []):
+            change = (site["size_bytes"] - before.get(site["site"], 0)) / 1024
+            print(f"  {site['size_bytes'] / 1024:>9.1f} {change:>+9.1f}  {site['site']}")
+
+    print(f"\nSteady-state growth: traced {traced_kb_per_1k:+.1f} KiB/1k requests "
+          f"(limit {args.max_traced_kb_per_1k}), RSS {rss_mb_per_1k:+.2f} MiB/1k requests "
+          f"(limit {args.max_rss_mb_per_1k})")
+    failed = traced_kb_per_1k > args.max_traced_kb_per_1k or rss_mb_per_1k > args.max_rss_mb_per_1k
+    if failed:
+        print("❌ Memory grows under steady load")
+        sys.exit(1)
+    print("✅ Memory is flat under steady load")
+
+
+if __name__ == "__main__":
+    main()
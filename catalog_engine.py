@@ -0,0 +1,347 @@
+"""
+WelFore Health Catalog Engine
+Assembles a daily meal plan from a food catalog following MyPlate ratios
+(½ vegetables, ¼ protein, ¼ carbohydrate + fruit + hydration), with rainbow,
+fiber and protein safety nets and GLP-1 / bariatric adaptations.
+
+Catalog foods are dicts such as:
+    {"name": "Collard greens", "type": "vegetable", "color": "green",
+     "cultures": ["African American"], "glp1_friendly": True,
+     "health_tags": ["fiber-rich"], "fiber_g": 5, "protein_g": 4}
+
+The catalog may also be a compiled CatalogStore (catalog_store.py), whose foods
+are read-only FoodViews; selection then filters its columns with NumPy, and
+nutrient totals are gathered from per-food vectors by food id.
+"""
+
+import importlib.util
+import json
+import os
+import random
+from collections.abc import Mapping
+from typing import Any, Dict, List
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+if HAS_NUMPY:
+    import numpy as np
+    from catalog_store import CatalogStore, open_store, popcount
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog.json")
+UNIVERSAL_CULTURE = "Universal_GLP1_Friendly"
+RAINBOW_REQUIRED = {"red", "orange", "yellow", "green", "purple"}
+
+# Per-food nutrient vector columns of a compiled catalog
+NUTRIENT_FIELDS = ("fiber_g", "protein_g", "calories")
+FIBER, PROTEIN, CALORIES = range(len(NUTRIENT_FIELDS))
+
+
+def load_catalog(path: str = CATALOG_PATH):
+    """The compiled, memory-mapped store for `path` when an up-to-date one
+    exists, otherwise the foods from the JSON file."""
+    if HAS_NUMPY:
+        store = open_store(source=path)
+        if store is not None:
+            return store
+    with open(path) as f:
+        data = json.load(f)
+    return data["foods"] if isinstance(data, dict) else data
+
+
+# -----------------------------
+# CORE GENERATOR
+# -----------------------------
+def generate_daily_meal_plan(user_profile: Dict[str, Any], food_catalog: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generates a culturally sensitive daily meal plan with MyPlate ratios,
+    rainbow coverage, fiber + protein targets, and GLP-1/bariatric adaptations."""
+    if HAS_NUMPY and isinstance(food_catalog, CatalogStore):
+        return _generate_from_store(user_profile, food_catalog)
+
+    plan = {
+        "breakfast": assemble_meal("breakfast", user_profile, food_catalog),
+        "lunch": assemble_meal("lunch", user_profile, food_catalog),
+        "dinner": assemble_meal("dinner", user_profile, food_catalog),
+        "snack1": assemble_snack(user_profile, food_catalog),
+        "snack2": assemble_snack(user_profile, food_catalog)
+    }
+
+    # Rainbow coverage
+    if not check_rainbow_coverage(plan):
+        plan = rebalance_colors(plan, food_catalog)
+
+    # Fiber & protein safety nets
+    if not check_fiber_target(plan, min_fiber=20):
+        plan = add_fiber_food(plan, food_catalog)
+    if not check_protein_target(plan, min_protein=60):
+        plan = add_protein_food(plan, food_catalog)
+
+    # GLP-1 / bariatric adaptations
+    if user_profile.get("is_glp1") or user_profile.get("is_bariatric"):
+        plan = adapt_glp1_bariatric(plan)
+
+    return plan
+
+
+def _generate_from_store(user_profile: Dict[str, Any], store) -> Dict[str, Any]:
+    """generate_daily_meal_plan over a compiled catalog.
+
+    The plan's foods are tracked as an array of food ids, so the rainbow, fiber
+    and protein checks are gathers from the store's per-food vectors instead of
+    walks over the plan. Extras are chosen exactly as on the dict path. The
+    plan also gets `food_ids` and its `nutrients` totals.
+    """
+    plan = {
+        "breakfast": assemble_meal("breakfast", user_profile, store),
+        "lunch": assemble_meal("lunch", user_profile, store),
+        "dinner": assemble_meal("dinner", user_profile, store),
+        "snack1": assemble_snack(user_profile, store),
+        "snack2": assemble_snack(user_profile, store)
+    }
+    ids = [food.id for food in _plan_foods(plan)]
+    matrix = store.nutrient_matrix(NUTRIENT_FIELDS)
+
+    # Rainbow coverage: distinct colors = set bits of the OR of the foods' color bits
+    seen = int(np.bitwise_or.reduce(store.category_bits("color")[ids]))
+    if int(popcount(np.uint64(seen))) < 5:
+        colors_seen = set(store.decode_bits("color", seen))
+        produce = store.category_mask("type", ["fruit", "vegetable"])
+        for color in RAINBOW_REQUIRED - colors_seen:
+            candidates = (produce & store.category_mask("color", [color])).nonzero()[0]
+            if len(candidates):
+                _add_extras(plan, "snack1", store, ids, candidates[:1])
+
+    # Fiber & protein safety nets
+    total_fiber = matrix[ids, FIBER].sum()
+    if total_fiber < 20:
+        fiber_rich = store.tag_mask("health_tags", "fiber-rich").nonzero()[0]
+        _add_extras(plan, "snack2", store, ids, _top_up(store.numeric("fiber_g"), fiber_rich, total_fiber, 20))
+    total_protein = matrix[ids, PROTEIN].sum()
+    if total_protein < 60:
+        proteins = (store.category_mask("type", ["protein"]) & store.bool_mask("glp1_friendly", True)).nonzero()[0]
+        _add_extras(plan, "dinner", store, ids,
+                    _top_up(store.numeric("protein_g", default=20), proteins, total_protein, 60))
+
+    # GLP-1 / bariatric adaptations
+    if user_profile.get("is_glp1") or user_profile.get("is_bariatric"):
+        plan = adapt_glp1_bariatric(plan)
+
+    plan["food_ids"] = np.array(ids, dtype=np.int32)
+    plan["nutrients"] = nutrient_totals(store, plan["food_ids"])
+    return plan
+
+
+def _top_up(values, candidates, total, target):
+    """Candidates in descending `values` order (stable), up to the first one that brings total to target."""
+    order = candidates[np.argsort(-values[candidates], kind="stable")]
+    reached = total + np.cumsum(values[order]) >= target
+    return order[:int(reached.argmax()) + 1] if reached.any() else order
+
+
+def _add_extras(plan, meal, store, ids, food_ids):
+    extras = plan[meal].setdefault("extras", [])
+    for food_id in food_ids:
+        ids.append(int(food_id))
+        extras.append(store[int(food_id)])
+
+
+def nutrient_totals(store, food_ids) -> Dict[str, Any]:
+    """Fiber, protein and calorie totals and distinct colors of a set of foods.
+
+    One gather-and-sum over the store's per-food vectors. `food_ids` may also
+    be 2-D, one row per day or per candidate plan padded with -1 (see
+    stack_food_ids), giving one array entry per row.
+    """
+    ids = np.asarray(food_ids, dtype=np.intp)
+    totals = store.nutrient_matrix(NUTRIENT_FIELDS)[ids].sum(axis=-2)
+    colors = popcount(np.bitwise_or.reduce(store.category_bits("color")[ids], axis=-1))
+    if ids.ndim == 1:
+        return {"fiber_g": float(totals[FIBER]), "protein_g": float(totals[PROTEIN]),
+                "calories": float(totals[CALORIES]), "colors": int(colors)}
+    return {"fiber_g": totals[..., FIBER], "protein_g": totals[..., PROTEIN],
+            "calories": totals[..., CALORIES], "colors": colors.astype(np.int64)}
+
+
+def stack_food_ids(id_arrays) -> "np.ndarray":
+    """2-D array of the given food id arrays, padded with -1 (which gathers zeros)."""
+    width = max((len(a) for a in id_arrays), default=0)
+    stacked = np.full((len(id_arrays), width), -1, dtype=np.int32)
+    for row, ids in enumerate(id_arrays):
+        stacked[row, :len(ids)] = ids
+    return stacked
+
+
+# -----------------------------
+# MEAL BUILDERS
+# -----------------------------
+def assemble_meal(meal_type: str, user_profile: Dict[str, Any], food_catalog: List[Dict[str, Any]]) -> Dict[str, Any]:
+    criteria = {"glp1_friendly": True, "culture": user_profile.get("culture")}
+    return {
+        "vegetables": select_foods(food_catalog, type="vegetable", count=2, criteria=criteria),   # ½ plate
+        "protein": select_foods(food_catalog, type="protein", count=1, criteria=criteria),        # ¼ plate
+        "carb": select_foods(food_catalog, type="carbohydrate", count=1, criteria=criteria),      # ¼ plate
+        "fruit": select_foods(food_catalog, type="fruit", count=1, criteria=criteria),
+        "beverage": "Water, Sparkling Water, or Unsweetened Tea",
+    }
+
+
+def assemble_snack(user_profile: Dict[str, Any], food_catalog: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Always pair protein + fiber
+    return {
+        "protein_or_dairy": select_foods(food_catalog, type=["protein", "dairy", "snack"], count=1,
+                                         criteria={"glp1_friendly": True}),
+        "fruit_or_veg": select_foods(food_catalog, type=["fruit", "vegetable"], count=1,
+                                     criteria={"glp1_friendly": True}),
+    }
+
+
+# -----------------------------
+# FOOD SELECTION
+# -----------------------------
+def select_foods(food_catalog, type, count=1, criteria=None):
+    if isinstance(type, str):
+        type = [type]
+    if HAS_NUMPY and isinstance(food_catalog, CatalogStore):
+        return _select_from_store(food_catalog, type, count, criteria)
+
+    filtered = [f for f in food_catalog if f["type"] in type]
+
+    # Cultural preference
+    if criteria and "culture" in criteria:
+        culture = criteria["culture"]
+        cultural_match = [f for f in filtered if culture in f.get("cultures", [])]
+        if cultural_match:
+            filtered = cultural_match
+
+    # GLP-1 filter
+    if criteria and "glp1_friendly" in criteria:
+        filtered = [f for f in filtered if f.get("glp1_friendly", False) == criteria["glp1_friendly"]]
+
+    # Health tag filters
+    if criteria:
+        for key, value in criteria.items():
+            if key not in ["culture", "glp1_friendly"]:
+                filtered = [f for f in filtered if value in f.get("health_tags", [])]
+
+    # Fallback (foods may carry a single "culture" or a "cultures" list)
+    if not filtered:
+        filtered = [f for f in food_catalog
+                    if f["type"] in type
+                    and (f.get("culture") == UNIVERSAL_CULTURE or UNIVERSAL_CULTURE in f.get("cultures", []))]
+
+    return random.sample(filtered, min(count, len(filtered)))
+
+
+def _select_from_store(store, types, count, criteria):
+    """select_foods over a compiled catalog: the same filters as column masks.
+
+    Samples positions the same way random.sample samples the list, so a seeded
+    run picks the same foods as it would from the JSON catalog.
+    """
+    mask = store.category_mask("type", types)
+
+    if criteria and "culture" in criteria:
+        cultural_match = mask & store.tag_mask("cultures", criteria["culture"])
+        if cultural_match.any():
+            mask = cultural_match
+
+    if criteria and "glp1_friendly" in criteria:
+        mask = mask & store.bool_mask("glp1_friendly", bool(criteria["glp1_friendly"]))
+
+    if criteria:
+        for key, value in criteria.items():
+            if key not in ["culture", "glp1_friendly"]:
+                mask = mask & store.tag_mask("health_tags", value)
+
+    ids = mask.nonzero()[0]
+    if not len(ids):
+        universal = store.tag_mask("cultures", UNIVERSAL_CULTURE)
+        if "culture" in store.fields:
+            universal = universal | store.category_mask("culture", [UNIVERSAL_CULTURE])
+        ids = (store.category_mask("type", types) & universal).nonzero()[0]
+
+    return [store[int(ids[i])] for i in random.sample(range(len(ids)), min(count, len(ids)))]
+
+
+# -----------------------------
+# NUTRIENT COVERAGE CHECKS
+# -----------------------------
+def _plan_foods(plan):
+    for meal in plan.values():
+        if not isinstance(meal, dict):
+            continue
+        for item in meal.values():
+            for food in (item if isinstance(item, list) else [item]):
+                if isinstance(food, Mapping):
+                    yield food
+
+
+def check_rainbow_coverage(plan) -> bool:
+    return len({f["color"] for f in _plan_foods(plan)}) >= 5
+
+
+def check_fiber_target(plan, min_fiber=20) -> bool:
+    return sum(f.get("fiber_g", 0) for f in _plan_foods(plan)) >= min_fiber
+
+
+def check_protein_target(plan, min_protein=60) -> bool:
+    return sum(f.get("protein_g", 0) for f in _plan_foods(plan)) >= min_protein
+
+
+# -----------------------------
+# NUTRIENT SAFETY NETS
+# -----------------------------
+def rebalance_colors(plan, food_catalog):
+    colors_seen = {f["color"] for f in _plan_foods(plan)}
+    for color in RAINBOW_REQUIRED - colors_seen:
+        candidate_foods = [f for f in food_catalog if f["type"] in ["fruit", "vegetable"] and f["color"] == color]
+        if candidate_foods:
+            plan["snack1"].setdefault("extras", []).append(candidate_foods[0])
+    return plan
+
+
+def add_fiber_food(plan, food_catalog, min_fiber=20):
+    fiber_foods = sorted(
+        [f for f in food_catalog if "fiber-rich" in f.get("health_tags", [])],
+        key=lambda x: x.get("fiber_g", 0),
+        reverse=True
+    )
+    total_fiber = sum(f.get("fiber_g", 0) for f in _plan_foods(plan))
+    for food in fiber_foods:
+        if total_fiber >= min_fiber:
+            break
+        plan["snack2"].setdefault("extras", []).append(food)
+        total_fiber += food.get("fiber_g", 0)
+    return plan
+
+
+def add_protein_food(plan, food_catalog, min_protein=60):
+    protein_foods = sorted(
+        [f for f in food_catalog if f["type"] == "protein" and f.get("glp1_friendly", False)],
+        key=lambda x: x.get("protein_g", 20),
+        reverse=True
+    )
+    total_protein = sum(f.get("protein_g", 0) for f in _plan_foods(plan))
+    for food in protein_foods:
+        if total_protein >= min_protein:
+            break
+        plan["dinner"].setdefault("extras", []).append(food)
+        total_protein += food.get("protein_g", 20)
+    return plan
+
+
+# -----------------------------
+# GLP-1 / BARIATRIC ADAPTATIONS
+# -----------------------------
+def adapt_glp1_bariatric(plan):
+    """Marks portions reduced ~30% and enforces protein-first eating order.
+
+    Foods are copied before being tagged so the shared catalog is not modified.
+    """
+    for meal in plan.values():
+        for key, item in meal.items():
+            if isinstance(item, list):
+                meal[key] = [{**food, "portion_adjusted": "70%"} for food in item]
+            elif isinstance(item, Mapping):
+                meal[key] = {**item, "portion_adjusted": "70%"}
+
+    plan["protein_priority"] = True
+    return plan
@@ -0,0 +1,454 @@
+"""
+WelFore Health Catalog Store
+Compiled, memory-mapped food catalog.
+
+`python catalog_store.py build` compiles catalog.json into CATALOG_STORE_DIR:
+  foods-<stamp>.npy    one fixed-size record per food (NumPy structured array)
+  strings-<stamp>.bin  UTF-8 text of free-text fields such as names
+  meta.json            schema, category vocabularies, and the size/mtime of the source
+
+Each field's encoding is chosen from the values found in the catalog:
+  bool / int / float  numeric columns
+  category            low-cardinality strings (type, color) as small integer codes
+  text                other strings as an (offset, length) into the strings file
+  tags                lists of strings (cultures, health_tags) as a uint64 bitset
+A per-food presence bitmask records which fields each food actually has.
+
+Workers open the record file with mmap, so every worker shares one copy in the
+OS page cache and opening it costs next to nothing. `FoodView` gives each food
+the read-only dict interface the catalog engine already uses, and the column
+masks let the engine filter the whole catalog with NumPy instead of a Python loop.
+
+A rebuild writes new stamped files and then replaces meta.json, so processes
+that already have the old files mapped keep reading them until they reopen.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog.json")
+CATALOG_STORE_DIR = os.getenv("CATALOG_STORE_DIR", "catalog_store")
+
+STORE_FORMAT = 1
+META_FILE = "meta.json"
+MAX_FIELDS = 64          # presence bitmask is one uint64
+MAX_TAGS = 64            # tag vocabularies are one uint64 bitset
+MAX_CATEGORIES = 65535   # larger string vocabularies are stored as text
+
+_INT_DTYPES = ((np.iinfo(np.int32), "<i4"), (np.iinfo(np.int64), "<i8"))
+
+
+# -----------------------------
+# SCHEMA
+# -----------------------------
+def _field_kind(name: str, values: List[Any], count: int) -> Dict[str, Any]:
+    """Encoding for one field, from every non-null value it takes in the catalog."""
+    if all(isinstance(v, bool) for v in values):
+        return {"name": name, "kind": "bool"}
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        low, high = min(values), max(values)
+        dtype = next((d for info, d in _INT_DTYPES if info.min <= low and high <= info.max), None)
+        if dtype is None:
+            raise ValueError(f"Field {name!r} has integers outside the int64 range")
+        return {"name": name, "kind": "int", "dtype": dtype}
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return {"name": name, "kind": "float"}
+    if all(isinstance(v, str) for v in values):
+        vocab = sorted(set(values))
+        if len(vocab) <= MAX_CATEGORIES and len(vocab) <= max(256, count // 4):
+            return {"name": name, "kind": "category", "vocab": vocab}
+        return {"name": name, "kind": "text"}
+    if all(isinstance(v, list) and all(isinstance(t, str) for t in v) for v in values):
+        vocab = sorted({t for v in values for t in v})
+        if len(vocab) > MAX_TAGS:
+            raise ValueError(f"Field {name!r} has {len(vocab)} distinct tags (max {MAX_TAGS})")
+        return {"name": name, "kind": "tags", "vocab": vocab}
+    raise ValueError(f"Field {name!r} mixes value types or holds nested data; it cannot be compiled")
+
+
+def infer_schema(foods: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    values: Dict[str, List[Any]] = {}
+    for food in foods:
+        for key, value in food.items():
+            if value is not None:
+                values.setdefault(key, []).append(value)
+    if len(values) > MAX_FIELDS:
+        raise ValueError(f"Catalog has {len(values)} fields (max {MAX_FIELDS})")
+    schema = [_field_kind(name, vals, len(foods)) for name, vals in values.items()]
+    for bit, field in enumerate(schema):
+        field["bit"] = bit
+    return schema
+
+
+def _columns(field: Dict[str, Any]) -> List[Tuple[str, str]]:
+    name, kind = field["name"], field["kind"]
+    if kind == "bool":
+        return [(name, "u1")]
+    if kind == "int":
+        return [(name, field["dtype"])]
+    if kind == "float":
+        return [(name, "<f8")]
+    if kind == "category":
+        return [(name, "u1" if len(field["vocab"]) <= 256 else "<u2")]
+    if kind == "text":
+        return [(name + ".offset", "<u8"), (name + ".length", "<u4")]
+    return [(name, "<u8")]   # tags
+
+
+def record_dtype(schema: List[Dict[str, Any]]) -> np.dtype:
+    return np.dtype([("_present", "<u8")] + [col for field in schema for col in _columns(field)])
+
+
+# -----------------------------
+# BUILD
+# -----------------------------
+def build_store(foods: List[Dict[str, Any]], directory: str = CATALOG_STORE_DIR,
+                source: Optional[str] = None) -> Dict[str, Any]:
+    """Compile `foods` into `directory` and return the new meta.json contents."""
+    schema = infer_schema(foods)
+    rows = np.zeros(len(foods), dtype=record_dtype(schema))
+    strings = bytearray()
+    present = np.zeros(len(foods), dtype=np.uint64)
+
+    for field in schema:
+        name, kind, bit = field["name"], field["kind"], np.uint64(1 << field["bit"])
+        codes = {v: i for i, v in enumerate(field.get("vocab", ()))}
+        for i, food in enumerate(foods):
+            value = food.get(name)
+            if value is None:
+                continue
+            present[i] |= bit
+            if kind == "category":
+                rows[name][i] = codes[value]
+            elif kind == "tags":
+                rows[name][i] = sum(1 << codes[t] for t in set(value))
+            elif kind == "text":
+                encoded = value.encode("utf-8")
+                rows[name + ".offset"][i] = len(strings)
+                rows[name + ".length"][i] = len(encoded)
+                strings += encoded
+            else:
+                rows[name][i] = value
+    rows["_present"] = present
+
+    os.makedirs(directory, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.perf_counter_ns() % 1000000:06d}"
+    files = {"rows": f"foods-{stamp}.npy", "strings": f"strings-{stamp}.bin"}
+    np.save(os.path.join(directory, files["rows"]), rows, allow_pickle=False)
+    with open(os.path.join(directory, files["strings"]), "wb") as f:
+        f.write(strings)
+
+    meta = {
+        "format": STORE_FORMAT,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "count": len(foods),
+        "record_bytes": rows.dtype.itemsize,
+        "files": files,
+        "fields": schema,
+        "source": _source_info(source) if source else None,
+    }
+    tmp = os.path.join(directory, f".{META_FILE}.{os.getpid()}")
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, os.path.join(directory, META_FILE))
+
+    # Old generations stay readable by processes that already mapped them
+    for entry in os.listdir(directory):
+        if entry.startswith(("foods-", "strings-")) and entry not in files.values():
+            try:
+                os.remove(os.path.join(directory, entry))
+            except OSError:
+                pass
+    return meta
+
+
+def build_from_file(source: str = CATALOG_PATH, directory: str = CATALOG_STORE_DIR) -> Dict[str, Any]:
+    with open(source) as f:
+        data = json.load(f)
+    foods = data["foods"] if isinstance(data, dict) else data
+    return build_store(foods, directory, source=source)
+
+
+def _source_info(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# -----------------------------
+# READ
+# -----------------------------
+class CatalogStore(Sequence):
+    """Memory-mapped catalog; indexing and iteration yield FoodViews."""
+
+    def __init__(self, directory: str = CATALOG_STORE_DIR):
+        self.directory = directory
+        for attempt in range(2):
+            with open(os.path.join(directory, META_FILE)) as f:
+                self.meta = json.load(f)
+            try:
+                self._open(self.meta["files"])
+                break
+            except FileNotFoundError:
+                if attempt:      # a rebuild replaced the files between reading meta and opening them
+                    raise
+        self.fields: Dict[str, Dict[str, Any]] = {f["name"]: f for f in self.meta["fields"]}
+        self._codes = {name: {v: i for i, v in enumerate(f["vocab"])}
+                       for name, f in self.fields.items() if "vocab" in f}
+        self._tag_lists: Dict[Tuple[str, int], Tuple[str, ...]] = {}
+        self._masks: Dict[Tuple, np.ndarray] = {}
+
+    def _open(self, files: Dict[str, str]):
+        rows_path = os.path.join(self.directory, files["rows"])
+        strings_path = os.path.join(self.directory, files["strings"])
+        if self.meta["count"]:
+            self.rows = np.load(rows_path, mmap_mode="r", allow_pickle=False)
+        else:
+            self.rows = np.load(rows_path, allow_pickle=False)   # mmap cannot map an empty array
+        if os.path.getsize(strings_path):
+            self.strings = np.memmap(strings_path, dtype=np.uint8, mode="r")
+        else:
+            self.strings = np.zeros(0, dtype=np.uint8)
+        self.columns = {name: self.rows[name] for name in self.rows.dtype.names}
+        self.present = self.columns["_present"]
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes + self.strings.nbytes
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [FoodView(self, i) for i in range(*index.indices(len(self.rows)))]
+        if index < 0:
+            index += len(self.rows)
+        if not 0 <= index < len(self.rows):
+            raise IndexError("catalog index out of range")
+        return FoodView(self, index)
+
+    def __iter__(self) -> Iterator["FoodView"]:
+        return (FoodView(self, i) for i in range(len(self.rows)))
+
+    def has(self, index: int, name: str) -> bool:
+        field = self.fields.get(name)
+        return field is not None and bool((int(self.present[index]) >> field["bit"]) & 1)
+
+    def value(self, index: int, name: str) -> Any:
+        """Decoded value of one field of one food (KeyError when the food lacks it)."""
+        if not self.has(index, name):
+            raise KeyError(name)
+        field = self.fields[name]
+        kind = field["kind"]
+        if kind == "category":
+            return field["vocab"][self.columns[name][index]]
+        if kind == "tags":
+            return list(self._tags(name, int(self.columns[name][index])))
+        if kind == "text":
+            offset = int(self.columns[name + ".offset"][index])
+            return self.strings[offset:offset + int(self.columns[name + ".length"][index])].tobytes().decode("utf-8")
+        if kind == "bool":
+            return bool(self.columns[name][index])
+        return self.columns[name][index].item()
+
+    def _tags(self, name: str, bits: int) -> Tuple[str, ...]:
+        tags = self._tag_lists.get((name, bits))
+        if tags is None:
+            vocab = self.fields[name]["vocab"]
+            tags = self._tag_lists[(name, bits)] = tuple(t for i, t in enumerate(vocab) if bits >> i & 1)
+        return tags
+
+    # -----------------------------
+    # COLUMN MASKS (boolean arrays over all foods)
+    # -----------------------------
+    def present_mask(self, name: str) -> np.ndarray:
+        field = self.fields.get(name)
+        if field is None:
+            return np.zeros(len(self.rows), dtype=bool)
+        return self._cached(("present", name), lambda: (self.present & np.uint64(1 << field["bit"])) != 0)
+
+    def category_mask(self, name: str, values) -> np.ndarray:
+        """Foods whose category field `name` is one of `values`."""
+        codes = self._codes.get(name, {})
+        wanted = tuple(sorted(codes[v] for v in set(values) if v in codes))
+        if not wanted or self.fields[name]["kind"] != "category":
+            return np.zeros(len(self.rows), dtype=bool)
+        return self._cached(("category", name, wanted),
+                            lambda: np.isin(self.columns[name], wanted) & self.present_mask(name))
+
+    def tag_mask(self, name: str, tag: str) -> np.ndarray:
+        """Foods whose tags field `name` contains `tag`."""
+        code = self._codes.get(name, {}).get(tag)
+        if code is None or self.fields[name]["kind"] != "tags":
+            return np.zeros(len(self.rows), dtype=bool)
+        return self._cached(("tag", name, code), lambda: (self.columns[name] & np.uint64(1 << code)) != 0)
+
+    def bool_mask(self, name: str, value: bool) -> np.ndarray:
+        """Foods where bool field `name` equals `value` (a missing field counts as False)."""
+        field = self.fields.get(name)
+        if field is None or field["kind"] != "bool":
+            return np.full(len(self.rows), not value)
+        true = self._cached(("bool", name), lambda: (self.columns[name] != 0) & self.present_mask(name))
+        return true if value else ~true
+
+    # -----------------------------
+    # PER-FOOD VECTORS (gather with an array of food ids)
+    # -----------------------------
+    def numeric(self, name: str, default: float = 0.0) -> np.ndarray:
+        """Numeric field as float64 per food, `default` where a food lacks it."""
+        def compute():
+            field = self.fields.get(name)
+            if field is None or field["kind"] not in ("int", "float", "bool"):
+                return np.full(len(self.rows), float(default))
+            return np.where(self.present_mask(name), self.columns[name].astype(np.float64), float(default))
+        return self._cached(("numeric", name, float(default)), compute)
+
+    def nutrient_matrix(self, names: Tuple[str, ...]) -> np.ndarray:
+        """(foods + 1) x len(names) matrix of numeric fields (missing = 0).
+
+        The extra last row is all zeros, so id arrays padded with -1 gather
+        nothing for the padding.
+        """
+        def compute():
+            matrix = np.zeros((len(self.rows) + 1, len(names)))
+            for j, name in enumerate(names):
+                matrix[:-1, j] = self.numeric(name)
+            return matrix
+        return self._cached(("matrix", names), compute)
+
+    def category_bits(self, name: str) -> np.ndarray:
+        """uint64 per food (plus a zero padding row) with the bit of its category code set.
+
+        OR-ing the bits of a set of foods and counting them gives the number
+        of distinct values, e.g. colors, without building a Python set.
+        """
+        def compute():
+            field = self.fields.get(name)
+            bits = np.zeros(len(self.rows) + 1, dtype=np.uint64)
+            if field is not None and field["kind"] == "category":
+                if len(field["vocab"]) > 64:
+                    raise ValueError(f"Field {name!r} has more than 64 categories")
+                codes = self.columns[name].astype(np.uint64)
+                bits[:-1] = np.where(self.present_mask(name), np.left_shift(np.uint64(1), codes), np.uint64(0))
+            return bits
+        return self._cached(("bits", name), compute)
+
+    def decode_bits(self, name: str, bits: int) -> List[str]:
+        vocab = self.fields[name]["vocab"] if name in self.fields else []
+        return [v for i, v in enumerate(vocab) if bits >> i & 1]
+
+    def _cached(self, key: Tuple, compute) -> np.ndarray:
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._masks[key] = compute()
+            mask.flags.writeable = False
+        return mask
+
+
+class FoodView(Mapping):
+    """Read-only dict view of one compiled food.
+
+    Tags come back in vocabulary (alphabetical) order, and fields that were
+    null in the source are absent.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: CatalogStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def id(self) -> int:
+        return self._index
+
+    def __getitem__(self, key: str) -> Any:
+        return self._store.value(self._index, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        store = self._store
+        return store.value(self._index, key) if store.has(self._index, key) else default
+
+    def __contains__(self, key) -> bool:
+        return self._store.has(self._index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        store, index = self._store, self._index
+        return (name for name in store.fields if store.has(index, name))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    def __repr__(self) -> str:
+        return f"FoodView({self._index}, {self.to_dict()!r})"
+
+
+def open_store(directory: str = CATALOG_STORE_DIR, source: Optional[str] = CATALOG_PATH) -> Optional[CatalogStore]:
+    """The compiled catalog, or None when it is missing or older than `source`."""
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        return None
+    store = CatalogStore(directory)
+    if store.meta.get("format") != STORE_FORMAT:
+        print(f"⚠️ Compiled catalog in {directory} has an old format; run `python catalog_store.py build`")
+        return None
+    if source and os.path.exists(source):
+        built_from = store.meta.get("source") or {}
+        current = _source_info(source)
+        if (built_from.get("size"), built_from.get("mtime_ns")) != (current["size"], current["mtime_ns"]):
+            print(f"⚠️ Compiled catalog is older than {source}; run `python catalog_store.py build`")
+            return None
+    return store
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """Number of set bits in each uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    as_bytes = np.ascontiguousarray(bits, dtype=np.uint64).view(np.uint8).reshape(*np.shape(bits), 8)
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Compile or inspect the memory-mapped food catalog.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile the JSON catalog")
+    build.add_argument("--source", default=CATALOG_PATH)
+    build.add_argument("--output", default=CATALOG_STORE_DIR)
+    info = sub.add_parser("info", help="show the compiled catalog's schema")
+    info.add_argument("--dir", default=CATALOG_STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        meta = build_from_file(args.source, args.output)
+        print(f"✅ Compiled {meta['count']} foods from {args.source} into {args.output}/ "
+              f"({meta['record_bytes']} bytes/food, {time.perf_counter() - start:.2f}s)")
+        return
+
+    store = CatalogStore(args.dir)
+    meta = store.meta
+    print(f"{args.dir}: {meta['count']} foods, {meta['record_bytes']} bytes/food, "
+          f"{store.nbytes / 1024:.1f} KiB mapped, built {meta['built_at']}")
+    if meta.get("source"):
+        print(f"source: {meta['source']['path']}")
+    for field in meta["fields"]:
+        vocab = field.get("vocab")
+        detail = f" ({len(vocab)} values)" if vocab is not None else ""
+        print(f"  {field['name']:<16} {field['kind']}{detail}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
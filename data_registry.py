@@ -0,0 +1,359 @@
+"""
+WelFore Health Data Registry
+Hot-reloadable content data with versioned, atomically swapped snapshots.
+
+The meal palettes, color foods and snack lists live in DATA_DIR:
+  cuisines.json      cuisine -> breakfast/lunch/dinner meal lists and palette colors
+  color_foods.json   color -> foods used for color-diversity snack boosts
+  snacks.json        {"proteins": [...], "partners": [...]}
+  ingredients.json   units, ingredients (aisle, purchase unit) and per-serving
+                     ingredients of every meal, snack item and color food
+  allergens.json     allergen/diet tags per ingredient (and extra per item), and
+                     the tags each dietary restriction excludes
+The food catalog comes from catalog_engine.load_catalog() (the compiled store
+when it is up to date, else catalog.json).
+
+`registry.current()` returns the current DataSnapshot. A request should fetch
+it once and use it throughout, so it finishes on the data it started with even
+if a reload happens meanwhile. Engines register derived indexes
+(`register_index`) that are built for each snapshot before it is swapped in.
+
+With DATA_RELOAD_INTERVAL > 0 each worker polls the files' size and mtime. On a
+change, the new snapshot is loaded and indexed in a worker thread and then
+replaces the old one in a single reference assignment. A file that fails to load
+or validate leaves the current snapshot in place. Caches of derived results
+use VersionedCache so entries from older data are never served, without
+clearing the whole cache on reload.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from catalog_engine import CATALOG_PATH, load_catalog
+from logger_utils import log_event
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "5"))
+CATALOG_STORE_META = os.path.join(os.getenv("CATALOG_STORE_DIR", "catalog_store"), "meta.json")
+
+DATA_FILES = {
+    "cuisines": "cuisines.json",
+    "color_foods": "color_foods.json",
+    "snacks": "snacks.json",
+    "ingredients": "ingredients.json",
+    "allergens": "allergens.json",
+}
+MEAL_SLOTS = ("breakfast", "lunch", "dinner")
+
+DATA_RELOADS = metrics.REGISTRY.counter(
+    "welfore_data_reloads_total", "Data snapshot reloads by result", ("result",))
+
+
+# -----------------------------
+# VALIDATION
+# -----------------------------
+def _string_list(value: Any, where: str) -> List[str]:
+    if not isinstance(value, list) or not value or not all(isinstance(v, str) and v for v in value):
+        raise ValueError(f"{where} must be a non-empty list of strings")
+    return value
+
+
+def _validate_cuisines(data: Any) -> Dict[str, Dict[str, List[str]]]:
+    if not isinstance(data, dict) or not data:
+        raise ValueError("cuisines.json must map cuisine names to meal palettes")
+    for cuisine, palette in data.items():
+        if not isinstance(palette, dict):
+            raise ValueError(f"cuisines.json: {cuisine!r} must be an object")
+        for key in MEAL_SLOTS + ("colors",):
+            _string_list(palette.get(key), f"cuisines.json: {cuisine}.{key}")
+    return data
+
+
+def _validate_color_foods(data: Any) -> Dict[str, List[str]]:
+    if not isinstance(data, dict) or not data:
+        raise ValueError("color_foods.json must map colors to food lists")
+    for color, foods in data.items():
+        _string_list(foods, f"color_foods.json: {color}")
+    return data
+
+
+def _validate_snacks(data: Any) -> Dict[str, List[str]]:
+    if not isinstance(data, dict):
+        raise ValueError("snacks.json must be an object")
+    _string_list(data.get("proteins"), "snacks.json: proteins")
+    _string_list(data.get("partners"), "snacks.json: partners")
+    return data
+
+
+def _validate_ingredients(data: Any) -> Dict[str, Dict[str, Any]]:
+    if not isinstance(data, dict):
+        raise ValueError("ingredients.json must be an object")
+    units = data.get("units")
+    if not isinstance(units, dict) or not units:
+        raise ValueError("ingredients.json: units must map unit names to [base unit, factor]")
+    for unit, spec in units.items():
+        if (not isinstance(spec, list) or len(spec) != 2 or spec[0] not in units
+                or not isinstance(spec[1], (int, float)) or spec[1] <= 0):
+            raise ValueError(f"ingredients.json: units.{unit} must be [base unit, positive factor]")
+    ingredients = data.get("ingredients")
+    if not isinstance(ingredients, dict) or not ingredients:
+        raise ValueError("ingredients.json: ingredients must map names to {aisle, unit}")
+    for name, info in ingredients.items():
+        if not isinstance(info, dict) or not isinstance(info.get("aisle"), str) or info.get("unit") not in units:
+            raise ValueError(f"ingredients.json: ingredients.{name} needs an aisle and a known unit")
+    for section in ("meals", "snacks", "color_foods"):
+        items = data.get(section)
+        if not isinstance(items, dict):
+            raise ValueError(f"ingredients.json: {section} must be an object")
+        for item, entries in items.items():
+            if not isinstance(entries, list) or not entries:
+                raise ValueError(f"ingredients.json: {section}.{item} must be a non-empty list")
+            for entry in entries:
+                if (not isinstance(entry, list) or len(entry) != 3 or entry[0] not in ingredients
+                        or not isinstance(entry[1], (int, float)) or entry[1] <= 0 or entry[2] not in units):
+                    raise ValueError(f"ingredients.json: {section}.{item}: bad entry {entry!r}")
+                # Quantities convert only within one dimension (mass, volume, cans, ...)
+                if units[entry[2]][0] != units[ingredients[entry[0]]["unit"]][0]:
+                    raise ValueError(f"ingredients.json: {section}.{item}: {entry[0]} "
+                                     f"cannot be measured in {entry[2]}")
+    return data
+
+
+def _validate_allergens(data: Any) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        raise ValueError("allergens.json must be an object")
+    tags = _string_list(data.get("tags"), "allergens.json: tags")
+    if len(set(tags)) != len(tags):
+        raise ValueError("allergens.json: tags must be unique")
+
+    def tag_list(value: Any, where: str):
+        if not isinstance(value, list) or not all(t in tags for t in value):
+            raise ValueError(f"allergens.json: {where} must be a list of known tags")
+
+    restrictions = data.get("restrictions")
+    if not isinstance(restrictions, dict) or not restrictions:
+        raise ValueError("allergens.json: restrictions must map names to {excludes, keywords}")
+    for name, rule in restrictions.items():
+        if not isinstance(rule, dict):
+            raise ValueError(f"allergens.json: restrictions.{name} must be an object")
+        tag_list(rule.get("excludes"), f"restrictions.{name}.excludes")
+        keywords = rule.get("keywords")
+        if not isinstance(keywords, list) or not all(isinstance(k, str) and k for k in keywords):
+            raise ValueError(f"allergens.json: restrictions.{name}.keywords must be a list of strings")
+    for section in ("ingredients", "items"):
+        entries = data.get(section, {})
+        if not isinstance(entries, dict):
+            raise ValueError(f"allergens.json: {section} must map names to tag lists")
+        for name, value in entries.items():
+            tag_list(value, f"{section}.{name}")
+    return data
+
+
+_VALIDATORS = {"cuisines": _validate_cuisines, "color_foods": _validate_color_foods, "snacks": _validate_snacks,
+               "ingredients": _validate_ingredients, "allergens": _validate_allergens}
+
+
+# -----------------------------
+# SNAPSHOTS
+# -----------------------------
+class DataSnapshot:
+    """One immutable generation of content data plus the indexes derived from it."""
+
+    __slots__ = ("version", "digest", "loaded_at", "cuisine_meals", "color_foods", "proteins",
+                 "snack_partners", "ingredients", "allergens", "catalog", "meal_texts", "meal_ids",
+                 "_indexes", "_builders")
+
+    def __init__(self, version: int, digest: str, files: Dict[str, Any], catalog,
+                 builders: Dict[str, Callable[["DataSnapshot"], Any]]):
+        self.version = version
+        self.digest = digest
+        self.loaded_at = time.time()
+        self.cuisine_meals: Dict[str, Dict[str, List[str]]] = files["cuisines"]
+        self.color_foods: Dict[str, List[str]] = files["color_foods"]
+        self.proteins: List[str] = files["snacks"]["proteins"]
+        self.snack_partners: List[str] = files["snacks"]["partners"]
+        self.ingredients: Dict[str, Dict[str, Any]] = files["ingredients"]
+        self.allergens: Dict[str, Any] = files["allergens"]
+        self.catalog = catalog
+        # Every meal description numbered once; plans and indexes refer to meals
+        # by these ids, and a reload drops the table along with the snapshot
+        self.meal_texts: Tuple[str, ...] = tuple(dict.fromkeys(
+            [meal for palette in self.cuisine_meals.values() for slot in MEAL_SLOTS for meal in palette[slot]]
+            + list(self.ingredients["meals"])))
+        self.meal_ids: Dict[str, int] = {text: i for i, text in enumerate(self.meal_texts)}
+        self._indexes: Dict[str, Any] = {}
+        self._builders = builders
+
+    def index(self, name: str) -> Any:
+        """A registered index for this snapshot (built on first use if it was registered late)."""
+        value = self._indexes.get(name)
+        if value is None:
+            value = self._indexes.setdefault(name, self._builders[name](self))
+        return value
+
+    def build_indexes(self):
+        for name in list(self._builders):
+            self.index(name)
+
+
+class DataRegistry:
+    def __init__(self, data_dir: str = DATA_DIR, catalog_path: str = CATALOG_PATH):
+        self.data_dir = data_dir
+        self.catalog_path = catalog_path
+        self._snapshot: Optional[DataSnapshot] = None
+        self._builders: Dict[str, Callable[[DataSnapshot], Any]] = {}
+        self._fingerprint: Optional[Tuple] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def register_index(self, name: str, builder: Callable[[DataSnapshot], Any]):
+        """Build `builder(snapshot)` for every snapshot before it goes live."""
+        self._builders[name] = builder
+
+    def current(self) -> DataSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._swap(*self._load())
+            snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self.current().version
+
+    def watched_paths(self) -> List[str]:
+        paths = [os.path.join(self.data_dir, name) for name in DATA_FILES.values()]
+        return paths + [self.catalog_path, CATALOG_STORE_META]
+
+    def fingerprint(self) -> Tuple:
+        stats = []
+        for path in self.watched_paths():
+            try:
+                st = os.stat(path)
+                stats.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                stats.append((path, None, None))
+        return tuple(stats)
+
+    def _load(self) -> Tuple[Tuple, Dict[str, Any], Any, str]:
+        fingerprint = self.fingerprint()
+        digest = hashlib.sha256()
+        files = {}
+        for key, name in DATA_FILES.items():
+            path = os.path.join(self.data_dir, name)
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest.update(raw)
+            try:
+                files[key] = _VALIDATORS[key](json.loads(raw))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{name}: {e}") from e
+        for path in (self.catalog_path, CATALOG_STORE_META):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        catalog = load_catalog(self.catalog_path) if os.path.exists(self.catalog_path) else []
+        return fingerprint, files, catalog, digest.hexdigest()[:12]
+
+    def _swap(self, fingerprint: Tuple, files: Dict[str, Any], catalog, digest: str):
+        snapshot = DataSnapshot(self._version + 1, digest, files, catalog, self._builders)
+        snapshot.build_indexes()
+        self._version = snapshot.version
+        self._fingerprint = fingerprint
+        self._snapshot = snapshot   # one reference assignment: readers see the old or the new snapshot
+        return snapshot
+
+    def reload(self, force: bool = False) -> bool:
+        """Load and swap in a new snapshot if the files changed. Returns True on a swap."""
+        with self._lock:
+            if not force and self._snapshot is not None and self.fingerprint() == self._fingerprint:
+                return False
+            previous = self._snapshot
+            try:
+                loaded = self._load()
+            except (OSError, ValueError) as e:
+                # Keep serving the current data; retry when the files change again
+                self._fingerprint = self.fingerprint()
+                DATA_RELOADS.inc("failed")
+                log_event("data_reload_failed", level=logging.ERROR, error=str(e))
+                if previous is None:
+                    raise
+                return False
+            if previous is not None and loaded[3] == previous.digest and not force:
+                self._fingerprint = loaded[0]   # touched but unchanged
+                return False
+            snapshot = self._swap(*loaded)
+        DATA_RELOADS.inc("swapped")
+        log_event("data_reloaded", version=snapshot.version, digest=snapshot.digest,
+                  cuisines=len(snapshot.cuisine_meals), catalog_foods=len(snapshot.catalog))
+        return True
+
+
+registry = DataRegistry()
+
+
+async def watch_loop(interval: float = DATA_RELOAD_INTERVAL):
+    """Poll the data files and swap in a new snapshot when they change."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(registry.reload)
+        except Exception as e:
+            log_event("data_watch_error", level=logging.ERROR, error=str(e))
+
+
+# -----------------------------
+# VERSIONED CACHE
+# -----------------------------
+class VersionedCache:
+    """LRU cache whose entries belong to the data version they were built from.
+
+    Lookups only match entries of the requested version, so a reload
+    invalidates everything derived from older data. Those entries are not
+    cleared; they fall out of the LRU as new entries arrive, and requests
+    still running on the old snapshot can keep using them.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[int, Any], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version: int, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            value = self._entries.get((version, key), _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end((version, key))
+        metrics.record_cache(self.name, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def put(self, version: int, key: Any, value: Any):
+        with self._lock:
+            self._entries[(version, key)] = value
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, version: int, key: Any, build: Callable[[], Any]) -> Any:
+        value = self.get(version, key, _MISSING)
+        if value is _MISSING:
+            value = build()
+            self.put(version, key, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_MISSING = object()
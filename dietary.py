@@ -0,0 +1,189 @@
+"""
+WelFore Health Dietary Restrictions
+Allergen and diet exclusion for the meal plan engine.
+
+data/allergens.json tags every ingredient with what it contains (gluten,
+dairy, egg, poultry, ...) and defines each dietary restriction as the tags it
+excludes. When a data snapshot loads, every meal, snack protein, snack partner
+and color food gets a bitmask: the OR of its ingredients' tags (per
+ingredients.json) and any extra tags listed for the item itself. Dishes with
+both meat and dairy are also tagged meat_dairy. Items or ingredients that
+have no tags are marked untagged and excluded by every restriction, so a gap
+in the data never lets an allergen through.
+
+A profile's restrictions (the quiz checkboxes, plus keywords in the free-text
+"other" answer) become a bitmask over RESTRICTIONS and then a mask of
+excluded tags. Filtering a candidate table is one mask AND per item. The
+filtered tables are cached per (cuisine, GLP-1/bariatric adaptation, excluded
+tags) for each data snapshot, so after the first plan a restricted plan costs
+the engine one dict lookup.
+
+If the restrictions leave a meal slot of the user's cuisine empty, the slot
+uses the compatible meals of the other cuisines instead. If no snack protein
+fits, snacks pair two partners. If nothing fits at all, NoCompatibleMeals is
+raised.
+"""
+
+import logging
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from data_registry import MEAL_SLOTS, DataSnapshot, registry
+from logger_utils import log_event
+from plan_model import MealSlot
+
+# Append-only: a restriction's position is its bit in plan tokens
+RESTRICTIONS = ("gluten-free", "dairy-free", "nut-free", "shellfish-free", "vegetarian", "vegan", "halal",
+                "kosher", "fasting", "egg-free", "fish-free", "soy-free", "sesame-free", "pork-free", "pescatarian")
+_MEAT_TAGS = ("poultry", "red_meat", "pork")
+
+
+class NoCompatibleMeals(ValueError):
+    """The dietary restrictions exclude every option for a meal slot or snack."""
+
+
+class Candidates(NamedTuple):
+    """What build_meal_plan chooses from for one cuisine, adaptation and set of restrictions."""
+    breakfasts: Tuple[MealSlot, ...]
+    lunches: Tuple[MealSlot, ...]
+    dinners: Tuple[MealSlot, ...]
+    proteins: Tuple[str, ...]
+    partners: Tuple[str, ...]
+    color_foods: Dict[str, Tuple[str, ...]]
+    day_colors: Tuple[str, ...]
+    boost_colors: Tuple[str, ...]
+
+
+def restriction_names(bits: int) -> Tuple[str, ...]:
+    """The restrictions in a restriction bitmask, in RESTRICTIONS order."""
+    return tuple(name for i, name in enumerate(RESTRICTIONS) if bits >> i & 1)
+
+
+class DietIndex:
+    """Per-snapshot allergen/diet bitmasks and filtered candidate tables."""
+
+    def __init__(self, data: DataSnapshot):
+        allergens = data.allergens
+        self.tags = {tag: 1 << i for i, tag in enumerate(allergens["tags"])}
+        self.untagged = 1 << len(self.tags)
+
+        rules = allergens["restrictions"]
+        missing = [name for name in RESTRICTIONS if name not in rules]
+        unknown = [name for name in rules if name not in RESTRICTIONS]
+        if missing or unknown:
+            raise ValueError(f"allergens.json: restrictions must match dietary.RESTRICTIONS "
+                             f"(missing {missing}, unknown {unknown})")
+        self.excludes = tuple(self.mask(rules[name]["excludes"]) for name in RESTRICTIONS)
+        self._exact = {name: 1 << i for i, name in enumerate(RESTRICTIONS)}
+        self._keywords = [
+            (1 << i, re.compile(r"\b(?:" + "|".join(re.escape(k) for k in rules[name]["keywords"]) + r")\b", re.I))
+            for i, name in enumerate(RESTRICTIONS) if rules[name]["keywords"]
+        ]
+
+        ingredient_masks = {name: self.mask(tags) for name, tags in allergens["ingredients"].items()}
+        extra = allergens.get("items", {})
+        meat = self.mask(t for t in _MEAT_TAGS if t in self.tags)
+        dairy, meat_dairy = self.tags.get("dairy", 0), self.tags.get("meat_dairy", 0)
+        untagged: List[str] = []
+
+        def item_mask(section: str, name: str) -> int:
+            entries = data.ingredients[section].get(name)
+            if entries is None and name not in extra:
+                untagged.append(f"{section}: {name}")
+                return self.untagged
+            mask = self.mask(extra.get(name, ()))
+            for ingredient, _quantity, _unit in entries or ():
+                if ingredient not in ingredient_masks:
+                    untagged.append(f"ingredient: {ingredient}")
+                mask |= ingredient_masks.get(ingredient, self.untagged)
+            if mask & meat and mask & dairy:
+                mask |= meat_dairy
+            return mask
+
+        self.meal_masks: Dict[int, int] = {
+            data.meal_ids[meal]: item_mask("meals", meal)
+            for palette in data.cuisine_meals.values() for slot in MEAL_SLOTS for meal in palette[slot]
+        }
+        self.snack_masks = {name: item_mask("snacks", name) for name in data.proteins + data.snack_partners}
+        self.food_masks = {food: item_mask("color_foods", food)
+                           for foods in data.color_foods.values() for food in foods}
+        if untagged:
+            log_event("dietary_untagged_items", level=logging.WARNING,
+                      count=len(untagged), items=sorted(set(untagged))[:20])
+        self._candidates: Dict[Tuple[str, bool, int], Candidates] = {}
+
+    def mask(self, tags: Iterable[str]) -> int:
+        mask = 0
+        for tag in tags:
+            mask |= self.tags[tag]
+        return mask
+
+    # -----------------------------
+    # RESTRICTIONS
+    # -----------------------------
+    def parse(self, values: Iterable[Any]) -> int:
+        """Restriction bitmask for quiz values and free-text answers ("no pork, peanut allergy")."""
+        bits = 0
+        for value in values or ():
+            if not isinstance(value, str):
+                continue
+            text = value.strip().lower()
+            bit = self._exact.get(text)
+            if bit is not None:
+                bits |= bit
+                continue
+            for bit, pattern in self._keywords:
+                if pattern.search(text):
+                    bits |= bit
+        return bits
+
+    def excluded(self, bits: int) -> int:
+        """Tag mask a restriction bitmask excludes (0 when nothing is excluded)."""
+        mask = 0
+        for i, excludes in enumerate(self.excludes):
+            if bits >> i & 1:
+                mask |= excludes
+        return mask | self.untagged if mask else 0
+
+    # -----------------------------
+    # CANDIDATE TABLES
+    # -----------------------------
+    def candidates(self, tables: Any, cuisine: str, adapted: bool, excluded: int) -> Candidates:
+        """The engine tables for a cuisine with every item carrying an excluded tag removed (cached)."""
+        key = (cuisine, adapted, excluded)
+        found = self._candidates.get(key)
+        if found is None:
+            found = self._candidates.setdefault(key, self._filter(tables, cuisine, adapted, excluded))
+        return found
+
+    def _filter(self, tables: Any, cuisine: str, adapted: bool, excluded: int) -> Candidates:
+        meal_masks = self.meal_masks
+        slots = {}
+        for slot in MEAL_SLOTS:
+            allowed = tuple(m for m in tables.cuisine_slots[(cuisine, adapted)][slot]
+                            if not meal_masks[m.meal_id] & excluded)
+            if not allowed:
+                # Nothing in this cuisine fits: borrow the compatible meals of the others
+                allowed = tuple(dict.fromkeys(
+                    m for (other, other_adapted), palette in tables.cuisine_slots.items()
+                    if other != cuisine and other_adapted == adapted
+                    for m in palette[slot] if not meal_masks[m.meal_id] & excluded))
+            if not allowed:
+                raise NoCompatibleMeals(f"No {slot} fits these dietary restrictions")
+            slots[slot] = allowed
+
+        partners = tuple(p for p in tables.snack_partners if not self.snack_masks[p] & excluded)
+        if not partners:
+            raise NoCompatibleMeals("No snack fits these dietary restrictions")
+        proteins = tuple(p for p in tables.proteins if not self.snack_masks[p] & excluded) or partners
+
+        colors, boosts = tables.day_colors[cuisine]
+        color_foods = {color: tuple(f for f in tables.color_foods[color] if not self.food_masks[f] & excluded)
+                       for color in boosts}
+        kept = tuple(color for color in boosts if color_foods[color])
+        day_colors = colors[:len(colors) - len(boosts)] + kept
+        return Candidates(slots["breakfast"], slots["lunch"], slots["dinner"], proteins, partners,
+                          color_foods, day_colors, kept)
+
+
+registry.register_index("dietary", DietIndex)
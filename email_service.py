@@ -1,17 +1,33 @@
+import asyncio
 import os
+import time
 from typing import Optional
 from datetime import datetime
-from logger_utils import logger
+from logger_utils import logger, log_event
+from metrics import SMTP_SEND_SECONDS
+from tracing import traced
 
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', '')
 SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
 SMTP_USER = os.getenv('SMTP_USER', '')
 SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() not in ('0', 'false', 'no')
 
+def _send_sync(msg) -> None:
+    import smtplib
+
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USER:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        server.send_message(msg)
+
+@traced("smtp.send_email")
 async def send_email(to_email: str, subject: str, body: str, html: bool = True) -> bool:
+    start = time.perf_counter()
     try:
-        import smtplib
         from email.mime.text import MIMEText
         from email.mime.multipart import MIMEMultipart
         
@@ -25,15 +41,15 @@ async def send_email(to_email: str, subject: str, body: str, html: bool = True)
         else:
             msg.attach(MIMEText(body, 'plain'))
         
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
+        # smtplib blocks on the network; keep it off the event loop
+        await asyncio.to_thread(_send_sync, msg)
         
-        logger.info(f"Email sent to {to_email}")
+        SMTP_SEND_SECONDS.labels("ok").observe(time.perf_counter() - start)
+        log_event("email_sent", email=to_email, subject=subject)
         return True
         
     except Exception as e:
+        SMTP_SEND_SECONDS.labels("error").observe(time.perf_counter() - start)
         logger.error(f"Failed to send email: {str(e)}")
         return False
 
@@ -54,13 +70,19 @@ async def send_admin_notification(user_email: str, plan_type: str, user_status:
     
     await send_email(ADMIN_EMAIL, subject, body, html=True)
 
-def get_free_plan_email(user_name: str = 'there') -> str:
+def get_free_plan_email(user_name: str = 'there', plan_link: Optional[str] = None) -> str:
+    plan_button = ""
+    if plan_link:
+        plan_button = f"""
+        <p><a href="{plan_link}" style="background-color: #4CAF50; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">View Your Meal Plan</a></p>
+        """
     return f"""
     <html>
     <body>
         <h2>Your FREE 3-Day Meal Plan is Ready!</h2>
         <p>Hi {user_name},</p>
         <p>Thank you for completing the WelFore Health quiz! Your personalized 3-day meal plan has been created.</p>
+        {plan_button}
         
         <h3>What's Next?</h3>
         <p>Love your results? Upgrade to get even more value:</p>
@@ -1,15 +1,32 @@
+import asyncio
 import os
+import time
 from typing import Optional, Dict, Any
-from logger_utils import logger
+from logger_utils import logger, log_event
+from metrics import GHL_REQUEST_SECONDS
+from tracing import traced
 
 GHL_API_KEY = os.getenv('GHL_API_KEY', '')
 GHL_LOCATION_ID = os.getenv('GHL_LOCATION_ID', '')
-GHL_API_URL = 'https://rest.gohighlevel.com/v1'
+GHL_API_URL = os.getenv('GHL_API_URL', 'https://rest.gohighlevel.com/v1').rstrip('/')
 
+async def _ghl_request(operation: str, method: str, url: str, **kwargs):
+    """Call the GHL API in a worker thread, recording latency per operation and outcome."""
+    import requests
+
+    start = time.perf_counter()
+    outcome = "exception"
+    try:
+        # requests blocks for up to the timeout; keep it off the event loop
+        response = await asyncio.to_thread(requests.request, method, url, timeout=10, **kwargs)
+        outcome = "ok" if response.status_code < 400 else "error"
+        return response
+    finally:
+        GHL_REQUEST_SECONDS.labels(operation, outcome).observe(time.perf_counter() - start)
+
+@traced("ghl.lookup_contact")
 async def lookup_contact(email: str) -> Optional[Dict[str, Any]]:
     try:
-        import requests
-        
         headers = {
             'Authorization': f'Bearer {GHL_API_KEY}',
             'Content-Type': 'application/json'
@@ -20,21 +37,21 @@ async def lookup_contact(email: str) -> Optional[Dict[str, Any]]:
             'locationId': GHL_LOCATION_ID
         }
         
-        response = requests.get(
+        response = await _ghl_request(
+            'lookup_contact', 'GET',
             f'{GHL_API_URL}/contacts/',
             headers=headers,
-            params=params,
-            timeout=10
+            params=params
         )
         
         if response.status_code == 200:
             data = response.json()
             contacts = data.get('contacts', [])
             if contacts:
-                logger.info(f"Contact found for email: {email}")
+                log_event("ghl_contact_found", email=email)
                 return contacts[0]
             else:
-                logger.info(f"No contact found for email: {email}")
+                log_event("ghl_contact_not_found", email=email)
                 return None
         else:
             logger.error(f"GHL API error: {response.status_code} - {response.text}")
@@ -44,10 +61,9 @@ async def lookup_contact(email: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error looking up contact: {str(e)}")
         return None
 
+@traced("ghl.add_tag_to_contact")
 async def add_tag_to_contact(contact_id: str, tag: str) -> bool:
     try:
-        import requests
-        
         headers = {
             'Authorization': f'Bearer {GHL_API_KEY}',
             'Content-Type': 'application/json'
@@ -57,15 +73,15 @@ async def add_tag_to_contact(contact_id: str, tag: str) -> bool:
             'tags': [tag]
         }
         
-        response = requests.put(
+        response = await _ghl_request(
+            'add_tag', 'PUT',
             f'{GHL_API_URL}/contacts/{contact_id}',
             headers=headers,
-            json=payload,
-            timeout=10
+            json=payload
         )
         
         if response.status_code in [200, 201]:
-            logger.info(f"Tag '{tag}' added to contact {contact_id}")
+            log_event("ghl_tag_added", tag=tag, contact_id=contact_id)
             return True
         else:
             logger.error(f"Failed to add tag: {response.status_code} - {response.text}")
@@ -82,10 +98,9 @@ async def has_freemium_tag(contact: Dict[str, Any]) -> bool:
     tags = contact.get('tags', [])
     return 'Freemium-Used' in tags
 
+@traced("ghl.create_contact")
 async def create_contact(email: str, name: str = '') -> Optional[Dict[str, Any]]:
     try:
-        import requests
-        
         headers = {
             'Authorization': f'Bearer {GHL_API_KEY}',
             'Content-Type': 'application/json'
@@ -99,16 +114,16 @@ async def create_contact(email: str, name: str = '') -> Optional[Dict[str, Any]]
         if name:
             payload['name'] = name
         
-        response = requests.post(
+        response = await _ghl_request(
+            'create_contact', 'POST',
             f'{GHL_API_URL}/contacts/',
             headers=headers,
-            json=payload,
-            timeout=10
+            json=payload
         )
         
         if response.status_code in [200, 201]:
             contact = response.json().get('contact', {})
-            logger.info(f"Contact created for email: {email}")
+            log_event("ghl_contact_created", email=email)
             return contact
         else:
             logger.error(f"Failed to create contact: {response.status_code} - {response.text}")
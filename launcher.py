@@ -0,0 +1,250 @@
+"""
+WelFore Health Production Launcher
+Pre-forking multi-worker server for the AskWelFore app.
+
+The parent process imports `main` once (app, templates, engine tables), freezes
+the heap so copy-on-write pages stay shared, binds the listening socket and
+then forks one uvicorn worker per available core. Workers are recycled after a
+jittered number of requests and replaced when they exit.
+
+Usage:
+    python launcher.py
+
+Signals (sent to the parent):
+    SIGTERM / SIGINT  graceful shutdown of all workers
+    SIGHUP            rolling restart (workers are replaced one at a time)
+"""
+
+import gc
+import importlib.util
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+# -----------------------------
+# CONFIGURATION (environment)
+# -----------------------------
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5000"))
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY", "")          # worker count override
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))  # seconds
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "10000"))        # 0 disables recycling
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))   # seconds
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
+
+HAS_UVLOOP = importlib.util.find_spec("uvloop") is not None
+HAS_HTTPTOOLS = importlib.util.find_spec("httptools") is not None
+
+
+# -----------------------------
+# WORKER SIZING
+# -----------------------------
+def available_cores() -> int:
+    """Cores this process may actually run on (affinity and cgroup quota aware)."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    # Containers (Render, Heroku, Docker) often cap CPU with a cgroup v2 quota
+    try:
+        quota, period = open("/sys/fs/cgroup/cpu.max").read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cores)
+
+
+def worker_count() -> int:
+    """Number of workers to fork: WEB_CONCURRENCY if set, else one per core."""
+    if WEB_CONCURRENCY.strip():
+        return max(1, int(WEB_CONCURRENCY))
+    return max(1, min(available_cores(), MAX_WORKERS))
+
+
+# -----------------------------
+# PRELOAD (runs once in the parent)
+# -----------------------------
+def preload_app():
+    """Import the app and its tables before forking so workers share the pages."""
+    from main import app
+
+    # Objects created during import live forever; moving them to the permanent
+    # generation keeps the collector from touching (and un-sharing) their pages.
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+# -----------------------------
+# WORKER PROCESS
+# -----------------------------
+def run_worker(app, sock: socket.socket) -> int:
+    """Serve requests on the shared socket until recycled or told to stop."""
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+
+    limit = None
+    if MAX_REQUESTS > 0:
+        limit = MAX_REQUESTS + random.randint(0, max(MAX_REQUESTS_JITTER, 0))
+
+    config = uvicorn.Config(
+        app,
+        loop="uvloop" if HAS_UVLOOP else "asyncio",
+        http="httptools" if HAS_HTTPTOOLS else "h11",
+        lifespan="on",
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        backlog=BACKLOG,
+        limit_max_requests=limit,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return 0
+
+
+class Arbiter:
+    """Keeps the configured number of workers alive and relays signals to them."""
+
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, float] = {}   # pid -> start time
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self) -> Optional[int]:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(self.app, self.sock)
+            except BaseException as e:
+                print(f"⚠️ Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+            finally:
+                import logging
+                logging.shutdown()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_hup(self, signum, frame):
+        self.restart_requested = True
+
+    def reap(self):
+        """Collect exited workers; returns pids that exited too soon after start."""
+        fast_exits = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return fast_exits
+            if pid == 0:
+                return fast_exits
+            started = self.children.pop(pid, None)
+            if started is not None and time.monotonic() - started < 1.0 and os.waitstatus_to_exitcode(status) != 0:
+                fast_exits.append(pid)
+
+    def rolling_restart(self):
+        print(f"🔄  Rolling restart of {len(self.children)} workers")
+        for pid in list(self.children):
+            self.spawn()
+            self.terminate(pid)
+
+    def terminate(self, pid: int):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.children.pop(pid, None)
+
+    def shutdown(self):
+        for pid in list(self.children):
+            self.terminate(pid)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_hup)
+
+        backoff = 0.0
+        while not self.stopping:
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+
+            if self.reap():
+                # A worker died during startup; don't fork-bomb a broken deploy
+                backoff = min(max(backoff * 2, 0.5), 30.0)
+                print(f"⚠️ Worker exited during startup, backing off {backoff:.1f}s", file=sys.stderr)
+                time.sleep(backoff)
+            elif len(self.children) >= self.workers:
+                backoff = 0.0
+
+            while len(self.children) < self.workers and not self.stopping:
+                self.spawn()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+
+def main():
+    workers = worker_count()
+    # Per-worker components (e.g. in-memory rate limits) size themselves from this
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Workers publish metric snapshots here so /metrics can report totals for all of them
+    metrics_dir = os.environ.get("METRICS_DIR") or tempfile.mkdtemp(prefix="welfore-metrics-")
+    os.environ["METRICS_DIR"] = metrics_dir
+    app = preload_app()
+    sock = bind_socket()
+
+    print("\n" + "="*70)
+    print(f"🚀  Launcher: {workers} worker(s) on {HOST}:{PORT} (cores available: {available_cores()})")
+    print(f"⚙️   loop={'uvloop' if HAS_UVLOOP else 'asyncio'} http={'httptools' if HAS_HTTPTOOLS else 'h11'} "
+          f"keep-alive={KEEPALIVE_TIMEOUT}s backlog={BACKLOG}")
+    if MAX_REQUESTS > 0:
+        print(f"♻️   Workers recycle after {MAX_REQUESTS}–{MAX_REQUESTS + MAX_REQUESTS_JITTER} requests")
+    print("="*70 + "\n")
+
+    Arbiter(app, sock, workers).run()
+    sock.close()
+    if metrics_dir.startswith(tempfile.gettempdir()):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
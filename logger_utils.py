@@ -1,6 +1,15 @@
+import asyncio
+import atexit
+import contextvars
+import gzip
 import logging
+import logging.handlers
+import queue
 import re
 import os
+import shutil
+import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
@@ -8,73 +17,508 @@ import json
 LOG_DIR = Path("logs")
 LOG_DIR.mkdir(exist_ok=True)
 
-class PIIMaskedFormatter(logging.Formatter):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-        self.phone_pattern = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
-        
-    def mask_name_fields(self, text):
-        def replace_double_quote(match):
-            key = match.group(1)
-            return f'"{key}": "[REDACTED]"'
-        
-        def replace_single_quote(match):
-            key = match.group(1)
-            return f"'{key}': '[REDACTED]'"
-        
-        text = re.sub(r'"(name|firstName|lastName)"\s*:\s*"(?:[^"\\]|\\.)*"', replace_double_quote, text)
-        text = re.sub(r"'(name|firstName|lastName)'\s*:\s*'(?:[^'\\]|\\.)*'", replace_single_quote, text)
-        
+# Records are handed to a background thread through a bounded queue. When it is
+# full, "drop_oldest" discards the oldest pending record and "drop_newest" the
+# incoming one; request handlers never wait on log I/O either way.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop_oldest")
+
+# Daily files are gzipped shortly after midnight and deleted after the retention
+# period; LOG_MAX_TOTAL_MB additionally caps the whole directory (0 = no cap).
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "7"))
+LOG_MAX_TOTAL_MB = int(os.getenv("LOG_MAX_TOTAL_MB", "500"))
+LOG_MAINTENANCE_INTERVAL = int(os.getenv("LOG_MAINTENANCE_INTERVAL", "3600"))  # seconds
+LOG_COMPRESS_DELAY = 60  # seconds after rollover, so slower workers finish their last write
+# Hot routes log 1 in N requests at INFO; warnings and errors are always kept.
+# Health checks and metrics scrapes are sampled too, or their request spans would dominate the log.
+_DEFAULT_SAMPLE_RATES = '{"/webhook/quiz": 10, "/test/webhook": 10, "/health": 100, "/metrics": 100}'
+LOG_SAMPLE_RATES = json.loads(os.getenv("LOG_SAMPLE_RATES", "") or _DEFAULT_SAMPLE_RATES)
+# Structured event fields are capped so one large payload can't dominate a request
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "256"))
+LOG_FIELD_MAX_ITEMS = int(os.getenv("LOG_FIELD_MAX_ITEMS", "25"))
+LOG_FILE_PATTERN = re.compile(r'_(\d{8})\.log(\.gz)?$')
+
+# Single alternation covering every PII shape; the named group that matched
+# tells _mask_match how to rewrite it, so each record is scanned exactly once.
+PII_PATTERN = re.compile(
+    r'(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b)'
+    r'|(?P<phone>\b\d{3}[-.]?\d{3}[-.]?\d{4}\b)'
+    r'|"(?P<dq_name>name|firstName|lastName)"\s*:\s*"(?:[^"\\]|\\.)*"'
+    r"|'(?P<sq_name>name|firstName|lastName)'\s*:\s*'(?:[^'\\]|\\.)*'"
+)
+# Every PII shape needs an '@', a digit or a quote; records without them are skipped
+PII_HINT = re.compile(r'[@\d"\']')
+
+_exception_formatter = logging.Formatter()
+
+
+def mask_email(email):
+    parts = email.split('@')
+    if len(parts) == 2:
+        username = parts[0]
+        domain = parts[1]
+        if len(username) > 2:
+            masked_username = username[0] + '*' * (len(username) - 2) + username[-1]
+        else:
+            masked_username = '*' * len(username)
+        return f"{masked_username}@{domain}"
+    return email
+
+
+def _mask_match(match):
+    kind = match.lastgroup
+    if kind == 'email':
+        return mask_email(match.group())
+    if kind == 'phone':
+        return '***-***-****'
+    if kind == 'dq_name':
+        return f'"{match.group(kind)}": "[REDACTED]"'
+    return f"'{match.group(kind)}': '[REDACTED]'"
+
+
+def mask_pii(text):
+    """Mask emails, phone numbers and name fields in one pass over the text."""
+    if not PII_HINT.search(text):
         return text
-        
-    def format(self, record):
-        original = super().format(record)
-        masked = self.email_pattern.sub(lambda m: self.mask_email(m.group()), original)
-        masked = self.phone_pattern.sub('***-***-****', masked)
-        masked = self.mask_name_fields(masked)
+    return PII_PATTERN.sub(_mask_match, text)
+
+
+def mask_record(record):
+    """Mask a record's message and traceback once; later handlers reuse the result."""
+    record.masked_message = mask_pii(record.getMessage())
+    if record.exc_info and not record.exc_text:
+        record.exc_text = _exception_formatter.formatException(record.exc_info)
+    if record.exc_text:
+        record.exc_text = mask_pii(record.exc_text)
+    if record.stack_info:
+        record.stack_info = mask_pii(record.stack_info)
+
+
+# -----------------------------
+# STRUCTURED EVENTS
+# -----------------------------
+# Keys are compared normalized: lowercase, without spaces, '_' or '-' ("First Name" -> "firstname")
+_NAME_KEYS = {"name", "firstname", "lastname", "fullname", "username"}
+_KEY_SEPARATORS = str.maketrans("", "", " _-")
+
+
+def _mask_value(key, value):
+    normalized = key.lower().translate(_KEY_SEPARATORS)
+    if isinstance(value, dict):
+        items = list(value.items())
+        masked = {k: _mask_value(str(k), v) for k, v in items[:LOG_FIELD_MAX_ITEMS]}
+        if len(items) > LOG_FIELD_MAX_ITEMS:
+            masked["_truncated_keys"] = len(items) - LOG_FIELD_MAX_ITEMS
         return masked
-    
-    def mask_email(self, email):
-        parts = email.split('@')
-        if len(parts) == 2:
-            username = parts[0]
-            domain = parts[1]
-            if len(username) > 2:
-                masked_username = username[0] + '*' * (len(username) - 2) + username[-1]
-            else:
-                masked_username = '*' * len(username)
-            return f"{masked_username}@{domain}"
-        return email
+    if isinstance(value, (list, tuple)):
+        masked = [_mask_value(key, v) for v in value[:LOG_FIELD_MAX_ITEMS]]
+        if len(value) > LOG_FIELD_MAX_ITEMS:
+            masked.append(f"...(+{len(value) - LOG_FIELD_MAX_ITEMS} items)")
+        return masked
+    if value is None or value == "":
+        return value
+    if "email" in normalized:
+        return mask_email(str(value))
+    if "phone" in normalized or "mobile" in normalized:
+        return "***-***-****"
+    if normalized in _NAME_KEYS:
+        return "[REDACTED]"
+    if isinstance(value, str):
+        # Free text under any other key still gets the regex pass, as plain messages do
+        value = mask_pii(value)
+        if len(value) > LOG_FIELD_MAX_CHARS:
+            return f"{value[:LOG_FIELD_MAX_CHARS]}...(+{len(value) - LOG_FIELD_MAX_CHARS} chars)"
+    return value
+
+
+def mask_fields(fields):
+    """Mask PII by key (email, phone/mobile, name fields), regex-mask every other
+    string value, and cap oversized values, recursing into dicts and lists."""
+    return {key: _mask_value(key, value) for key, value in fields.items()}
+
+
+class LogEvent:
+    """A structured log message, serialized to one JSON line by the formatter.
+
+    Fields are masked when the event is created; the JSON string is only built
+    on the listener thread, once, for all handlers.
+    """
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def to_json(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": self.event,
+        }
+        sample_rate = getattr(record, "sample_rate", 1)
+        if sample_rate > 1:
+            data["sample_rate"] = sample_rate
+        data.update(self.fields)
+        return json.dumps(data, default=str, ensure_ascii=False, separators=(",", ":"))
+
+    def __str__(self):
+        return json.dumps({"event": self.event, **self.fields}, default=str, ensure_ascii=False)
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log a structured event, e.g. log_event("quiz_submitted", email=email, plan_duration=7).
+
+    Nothing is masked or formatted when the level is disabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and _request_sample.get() == 0:
+        log_sampler.count_suppressed()
+        return
+    fields = mask_fields(fields)
+    request_id = request_id_var.get()
+    if request_id is not None:
+        fields = {"request_id": request_id, **fields}
+    logger.log(level, LogEvent(event, fields))
+
+
+# Set per request by tracing.TracingMiddleware; stamped onto every structured event
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+
+# -----------------------------
+# PER-ROUTE LOG SAMPLING
+# -----------------------------
+# None: request is not sampled; 0: INFO records suppressed; N: record stands for N requests
+_request_sample = contextvars.ContextVar("log_sample_rate", default=None)
+
+
+class LogSampler:
+    """Deterministic 1-in-N sampling of INFO logs per route, with totals.
+
+    A request's sampling decision is made once when it starts, so either all
+    of its INFO records are written (tagged with sample_rate=N) or none are.
+    """
+
+    def __init__(self, rates):
+        self.rates = {route: int(rate) for route, rate in rates.items() if int(rate) > 1}
+        self.requests = {route: 0 for route in self.rates}
+        self.logged = {route: 0 for route in self.rates}
+        self.suppressed_records = 0
+
+    def start_request(self, route):
+        rate = self.rates.get(route)
+        if rate is None:
+            return None
+        seen = self.requests[route]
+        self.requests[route] = seen + 1
+        if seen % rate == 0:
+            self.logged[route] += 1
+            _request_sample.set(rate)
+            return rate
+        _request_sample.set(0)
+        return 0
+
+    def count_suppressed(self):
+        self.suppressed_records += 1
+
+    def totals(self):
+        return {
+            "requests": dict(self.requests),
+            "logged_requests": dict(self.logged),
+            "suppressed_records": self.suppressed_records,
+        }
+
+
+class SamplingFilter(logging.Filter):
+    """Drops INFO records of requests that were sampled out; counts them instead."""
+
+    def filter(self, record):
+        rate = _request_sample.get()
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if rate == 0:
+            log_sampler.count_suppressed()
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class LogSamplingMiddleware:
+    """ASGI middleware that makes the sampling decision for each request on a sampled route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in log_sampler.rates:
+            token = _request_sample.set(None)
+            log_sampler.start_request(scope["path"])
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _request_sample.reset(token)
+        return await self.app(scope, receive, send)
+
+
+log_sampler = LogSampler(LOG_SAMPLE_RATES)
+
+
+class PIIMaskedFormatter(logging.Formatter):
+    """Formats records with PII masked. The masked message is cached on the
+    record, so the file and console handlers share a single masking pass.
+    Structured LogEvent records are written as JSON lines instead."""
+
+    def format(self, record):
+        if isinstance(record.msg, LogEvent):
+            line = getattr(record, 'event_line', None)
+            if line is None:
+                line = record.event_line = record.msg.to_json(record)
+            return line
+        if not hasattr(record, 'masked_message'):
+            mask_record(record)
+        record.message = record.masked_message
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self.formatMessage(record)
+        if record.exc_text:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + record.exc_text
+        if record.stack_info:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + self.formatStack(record.stack_info)
+        return s
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Non-blocking queue handler with an overflow policy.
+
+    Records are queued as-is: message formatting, PII masking and writes all
+    happen on the listener thread.
+    """
+
+    def __init__(self, log_queue, policy=LOG_OVERFLOW_POLICY):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+        self.reported_dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "drop_oldest":
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+            return
+
+        if self.dropped > self.reported_dropped:
+            lost = self.dropped - self.reported_dropped
+            self.reported_dropped = self.dropped
+            notice = logging.makeLogRecord({
+                "name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"Log queue overflow: {lost} records dropped ({self.policy})",
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                pass
+
+
+_listeners = {}
+
+
+def _start_listener(logger, output_handlers):
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = BoundedQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(queue_handler)
+    _listeners[logger.name] = (listener, queue_handler, output_handlers)
+
+
+def _restart_listeners_after_fork():
+    # The listener thread doesn't survive fork; give each worker its own queue and thread
+    for name, (_, queue_handler, output_handlers) in list(_listeners.items()):
+        logger = logging.getLogger(name)
+        logger.removeHandler(queue_handler)
+        _start_listener(logger, output_handlers)
+
+
+def queue_stats():
+    """Pending and dropped record counts per logger, for the metrics endpoint."""
+    return {
+        name: {"pending": queue_handler.queue.qsize(), "dropped": queue_handler.dropped}
+        for name, (_, queue_handler, _) in _listeners.items()
+    }
+
+
+def stop_logging():
+    """Flush pending records and fall back to writing synchronously.
+
+    Called on app shutdown and at exit, so nothing queued is lost and anything
+    logged afterwards still reaches the files.
+    """
+    for name, (listener, queue_handler, output_handlers) in list(_listeners.items()):
+        logger = logging.getLogger(name)
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in output_handlers:
+            logger.addHandler(handler)
+            handler.flush()
+        del _listeners[name]
+
+
+# -----------------------------
+# DAILY FILES, COMPRESSION & RETENTION
+# -----------------------------
+class DailyFileHandler(logging.FileHandler):
+    """Writes to <prefix>_YYYYMMDD.log and switches to a new file at local midnight.
+
+    Files are never renamed, so every launcher worker can append to the same
+    day's file; yesterday's file is compressed in the background after the switch.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.next_rollover = 0.0
+        super().__init__(self._path_for(time.time()), delay=True)
+        self._schedule_next(time.time())
+
+    def _path_for(self, timestamp):
+        return str(LOG_DIR / f"{self.prefix}_{datetime.fromtimestamp(timestamp).strftime('%Y%m%d')}.log")
+
+    def _schedule_next(self, timestamp):
+        midnight = datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.next_rollover = (midnight + timedelta(days=1)).timestamp()
+
+    def emit(self, record):
+        if record.created >= self.next_rollover:
+            self.rollover(record.created)
+        super().emit(record)
+
+    def rollover(self, timestamp):
+        previous = self.baseFilename
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self._path_for(timestamp))
+        self._schedule_next(timestamp)
+        if previous != self.baseFilename:
+            timer = threading.Timer(LOG_COMPRESS_DELAY, compress_log, args=(Path(previous),))
+            timer.daemon = True
+            timer.start()
+
+
+def compress_log(log_file):
+    """Gzip a finished daily log. Safe to call from several processes at once."""
+    target = log_file.with_name(log_file.name + ".gz")
+    tmp = log_file.with_name(log_file.name + ".gz.tmp")
+    try:
+        fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False  # another worker is already compressing it
+    try:
+        with open(log_file, "rb") as src, os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, target)
+        log_file.unlink()
+        return True
+    except FileNotFoundError:
+        tmp.unlink(missing_ok=True)
+        return False
+
+
+def _log_file_date(log_file):
+    match = LOG_FILE_PATTERN.search(log_file.name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), '%Y%m%d')
+    except ValueError:
+        return None
+
 
 def setup_logger(name):
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
     
-    log_file = LOG_DIR / f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
-    handler = logging.FileHandler(log_file)
+    handler = DailyFileHandler(name)
     handler.setFormatter(PIIMaskedFormatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     ))
     
-    logger.addHandler(handler)
-    
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(PIIMaskedFormatter('%(levelname)s: %(message)s'))
-    logger.addHandler(console_handler)
+
+    logger.addFilter(SamplingFilter())
+    _start_listener(logger, (handler, console_handler))
     
     return logger
 
 def purge_old_logs():
-    cutoff_date = datetime.now() - timedelta(days=7)
-    for log_file in LOG_DIR.glob("*.log"):
-        file_date_str = log_file.stem.split('_')[-1]
+    """Compress finished daily logs, delete expired ones and enforce the size cap."""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff_date = today - timedelta(days=LOG_RETENTION_DAYS)
+
+    for stale_tmp in LOG_DIR.glob("*.gz.tmp"):
+        try:
+            if time.time() - stale_tmp.stat().st_mtime > 3600:
+                stale_tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+    archives = []
+    for log_file in list(LOG_DIR.glob("*.log")) + list(LOG_DIR.glob("*.log.gz")):
+        file_date = _log_file_date(log_file)
+        if file_date is None:
+            continue
         try:
-            file_date = datetime.strptime(file_date_str, '%Y%m%d')
             if file_date < cutoff_date:
                 log_file.unlink()
                 print(f"Purged old log: {log_file}")
-        except (ValueError, IndexError):
-            pass
+                continue
+            if log_file.suffix == ".log" and file_date < today - timedelta(days=1):
+                # Missed by a rollover (e.g. the process restarted overnight)
+                if compress_log(log_file):
+                    log_file = log_file.with_name(log_file.name + ".gz")
+            if log_file.suffix == ".gz":
+                archives.append((file_date, log_file, log_file.stat().st_size))
+        except FileNotFoundError:
+            pass  # handled concurrently by another worker
+
+    if LOG_MAX_TOTAL_MB > 0:
+        total = sum(size for _, _, size in archives)
+        for _, log_file, size in sorted(archives):
+            if total <= LOG_MAX_TOTAL_MB * 1024 * 1024:
+                break
+            log_file.unlink(missing_ok=True)
+            total -= size
+            print(f"Purged log over size cap: {log_file}")
+
+
+async def log_maintenance_loop():
+    """Run purge_old_logs off the event loop now and every LOG_MAINTENANCE_INTERVAL seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(purge_old_logs)
+        except Exception as e:
+            logger.error(f"Log maintenance failed: {e}")
+        if log_sampler.rates:
+            log_event("log_sampling_totals", **log_sampler.totals())
+        await asyncio.sleep(LOG_MAINTENANCE_INTERVAL)
 
 logger = setup_logger('welfor_health')
+
+os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+atexit.register(stop_logging)
@@ -1,26 +1,57 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from typing import Dict, Any, List, Optional, Union
+import asyncio
 import os
+import time
+import logging
 from datetime import datetime
 import importlib.util
 import sys
 
 
 # Import logger utilities (no external dependencies)
-from logger_utils import logger, purge_old_logs
+from logger_utils import logger, log_event, log_maintenance_loop, stop_logging, LogSamplingMiddleware
 
 # Import master engine for meal plan generation
 try:
-    from master_engine import generate_enhanced_meal_plan, get_enhanced_recommended_pdfs, calculate_flavor_balance_index
+    from master_engine import build_meal_plan, get_enhanced_recommended_pdfs, calculate_flavor_balance_index
+    from dietary import NoCompatibleMeals
+    # Engine runs and results-page renders, inline or in the plan executor's process pool
+    import plan_executor
+    import plan_pool
+    import plan_results
     HAS_MASTER_ENGINE = True
     print("✅ Master Engine loaded successfully")
 except Exception as e:
     print(f"⚠️ Warning: Could not load master_engine: {e}")
     HAS_MASTER_ENGINE = False
 
+# Content data (meal palettes, snacks, food catalog), loaded once here so the
+# launcher's workers inherit it, then hot-reloaded per worker
+import data_registry
+try:
+    _data = data_registry.registry.current()
+    mapped = " (memory-mapped store)" if not isinstance(_data.catalog, list) else ""
+    print(f"✅ Data v{_data.version} ({_data.digest}): {len(_data.cuisine_meals)} cuisines, "
+          f"{len(_data.catalog)} catalog foods{mapped}")
+except (OSError, ValueError) as e:
+    print(f"⚠️ Warning: Could not load data files: {e}")
+
+# Generated plans, stored under short IDs for /plan/{id} or encoded in signed /p/{token} links
+import plan_store
+import plan_token
+
+# Shopping lists for multi-day plans (needs numpy)
+try:
+    import shopping_list
+    HAS_SHOPPING_LIST = True
+except ImportError as e:
+    print(f"⚠️ Warning: Shopping lists disabled: {e}")
+    HAS_SHOPPING_LIST = False
+
 # Defer imports that require external packages until after safety checks
 # These will be imported conditionally based on package availability
 ghl_integration = None
@@ -126,18 +157,39 @@ if HAS_REQUESTS:
         print(f"⚠️ Warning: Could not load GHL/email services: {e}")
         HAS_REQUESTS = False
 else:
-    # Create stub functions that return appropriate errors (synchronous to match real functions)
-    def lookup_contact(email): return None
-    def has_freemium_tag(contact): return False
-    def add_tag_to_contact(contact_id, tag): pass
-    def create_contact(email, name): return None
-    def send_admin_notification(email, plan_type, user_status): pass
-    def get_free_plan_email(name): return ""
+    # Create stub functions that return appropriate errors (async where the real functions are)
+    async def lookup_contact(email): return None
+    async def has_freemium_tag(contact): return False
+    async def add_tag_to_contact(contact_id, tag): pass
+    async def create_contact(email, name): return None
+    async def send_admin_notification(email, plan_type, user_status): pass
+    def get_free_plan_email(name, plan_link=None): return ""
     def get_upsell_email(name): return ""
-    def send_email(to, subject, body): pass
+    async def send_email(to, subject, body): pass
     print("⚠️ GHL/email functions stubbed (requests not available)")
 
 app = FastAPI()
+
+# Per-route latency histograms (outermost, so rejected requests are measured too)
+import metrics
+from metrics import MetricsMiddleware, PLAN_GENERATION_SECONDS, TEMPLATE_RENDER_SECONDS
+
+# Token-bucket admission control for the endpoints that call GHL and SMTP
+from rate_limiter import AdmissionControlMiddleware
+app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(MetricsMiddleware)
+# Opt-in cProfile capture (PROFILING_ENABLED + X-Profile admin header or PROFILE_SAMPLE_RATE)
+from profiling import ProfilingMiddleware, is_admin
+app.add_middleware(ProfilingMiddleware)
+# Opt-in per-route retained memory (MEMORY_TRACKING)
+import memory_tracking
+app.add_middleware(memory_tracking.MemoryTrackingMiddleware)
+# Request ID (X-Request-ID) and root span for everything below, including 429s
+from tracing import TracingMiddleware, span
+app.add_middleware(TracingMiddleware)
+# 1-in-N INFO logging on hot routes (LOG_SAMPLE_RATES); errors are always logged.
+# Outside tracing, so a sampled-out request doesn't log its root span either
+app.add_middleware(LogSamplingMiddleware)
 # --- BIRTHDAY → AGE AUTO-CONVERTER (for GHL quiz compatibility) ---
 from datetime import datetime, date
 
@@ -180,13 +232,51 @@ except Exception as e:
 templates = Jinja2Templates(directory="templates")
 print("✅ Templates configured")
 
+def render_template(name: str, context: Dict[str, Any]):
+    """TemplateResponse with render time recorded per template."""
+    start = time.perf_counter()
+    response = templates.TemplateResponse(context["request"], name, context)
+    TEMPLATE_RENDER_SECONDS.labels(name).observe(time.perf_counter() - start)
+    return response
+
 STRIPE_7DAY_LINK = os.getenv('STRIPE_7DAY_LINK', "https://buy.stripe.com/5kQ7sMddybXy8dsfUR7Vm0a")
 STRIPE_14DAY_LINK = os.getenv('STRIPE_14DAY_LINK', "https://buy.stripe.com/14A28s7Te3r251gcIF7Vm0b")
 
 @app.on_event("startup")
 async def startup_event():
-    purge_old_logs()
+    # Daily log compression and retention run in the background, never on a request
+    app.state.log_maintenance = asyncio.create_task(log_maintenance_loop())
+    app.state.loop_lag_monitor = asyncio.create_task(metrics.event_loop_lag_monitor())
+    metrics.start_publisher()
+    app.state.data_watch = None
+    if data_registry.DATA_RELOAD_INTERVAL > 0:
+        app.state.data_watch = asyncio.create_task(data_registry.watch_loop())
+    app.state.plan_store_maintenance = asyncio.create_task(plan_store.maintenance_loop())
+    app.state.plan_pool_refill = None
+    if HAS_MASTER_ENGINE and plan_pool.ENABLED:
+        app.state.plan_pool_refill = asyncio.create_task(plan_pool.refill_loop())
+    app.state.memory_snapshots = None
+    if memory_tracking.MEMORY_TRACKING:
+        memory_tracking.tracker.start()
+        app.state.memory_snapshots = asyncio.create_task(memory_tracking.snapshot_loop())
     logger.info("WelFore Health App started")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("WelFore Health App stopping")
+    app.state.log_maintenance.cancel()
+    app.state.loop_lag_monitor.cancel()
+    if app.state.memory_snapshots:
+        app.state.memory_snapshots.cancel()
+    if app.state.data_watch:
+        app.state.data_watch.cancel()
+    app.state.plan_store_maintenance.cancel()
+    if app.state.plan_pool_refill:
+        app.state.plan_pool_refill.cancel()
+    if HAS_MASTER_ENGINE:
+        plan_executor.executor.shutdown()
+    metrics.publish_snapshot()
+    stop_logging()
 # --- PREFILL HANDLER FOR GHL REDIRECT (Render) ---
 from fastapi.responses import RedirectResponse
 
@@ -225,7 +315,100 @@ async def show_quiz(request: Request):
         </body>
         </html>
         """, status_code=200)
-    return templates.TemplateResponse("plan.html", {"request": request})
+    return render_template("plan.html", {"request": request})
+
+def results_error(request: Request, message: str, status_code: int = 200):
+    response = render_template("results.html", {
+        "request": request,
+        "error": True,
+        "error_message": message,
+        "generated_at": datetime.now().strftime("%B %d, %Y at %I:%M %p")
+    })
+    response.status_code = status_code
+    return response
+
+
+PLAN_SERIES = {name: PLAN_GENERATION_SECONDS.labels(name) for name in ("meal_plan", "shopping_list", "pooled", "total")}
+RESULTS_RENDER_SERIES = TEMPLATE_RENDER_SECONDS.labels(plan_results.RESULTS_TEMPLATE) if HAS_MASTER_ENGINE else None
+BUSY_MESSAGE = "We're building a lot of meal plans right now. Please try again in a moment."
+NO_COMPATIBLE_MEALS_MESSAGE = ("We couldn't find meals that fit all of your dietary restrictions. "
+                               "Please review your answers and try again.")
+
+
+def record_plan_timings(timings: Dict[str, float]):
+    """Record the timings an engine or render task reported, wherever it ran."""
+    for name, seconds in timings.items():
+        if name == "render":
+            RESULTS_RENDER_SERIES.observe(seconds)
+        else:
+            PLAN_SERIES[name].observe(seconds)
+
+
+async def run_plan_task(fn, *args, plan_duration: int, **attrs):
+    """Run a plan_executor task (inline for cheap plans) and record its timings."""
+    inline = plan_executor.executor.inline_for(plan_duration)
+    with span(f"plan_executor.{fn.__name__}", plan_duration=plan_duration, inline=inline, **attrs):
+        result, timings = await plan_executor.executor.run(fn, *args, inline=inline)
+    record_plan_timings(timings)
+    return result
+
+
+@app.get("/plan/{plan_id}", response_class=HTMLResponse)
+async def show_plan(request: Request, plan_id: str):
+    """Render a stored plan without running the engine."""
+    if not HAS_MASTER_ENGINE:
+        return results_error(request, "Meal plans are temporarily unavailable. Please try again later.", 503)
+    payload = await asyncio.to_thread(plan_store.store.load, plan_id)
+    if payload is None:
+        return results_error(
+            request, "This meal plan link has expired or does not exist. Take the quiz for a fresh plan.", 404)
+    try:
+        html = await run_plan_task(plan_executor.render_task, payload, plan_id,
+                                   plan_duration=payload["meal_plan"]["plan_duration"])
+    except (plan_executor.ExecutorBusy, plan_executor.ExecutorTimeout):
+        return results_error(request, BUSY_MESSAGE, 503)
+    return HTMLResponse(html)
+
+
+@app.get("/plan/{plan_id}/shopping-list.{fmt}")
+async def plan_shopping_list(plan_id: str, fmt: str):
+    """A stored plan's shopping list as html, csv or json."""
+    if not HAS_SHOPPING_LIST or fmt not in shopping_list.FORMATS:
+        raise HTTPException(status_code=404, detail="Unknown shopping list format")
+    payload = await asyncio.to_thread(plan_store.store.load, plan_id)
+    if payload is None or not payload.get("shopping_list"):
+        raise HTTPException(status_code=404, detail="Shopping list not found")
+    shopping = shopping_list.ShoppingList.from_dict(payload["shopping_list"])
+    headers = {}
+    if fmt == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="welfore-shopping-list-{plan_id}.csv"'
+    return StreamingResponse(shopping_list.stream(shopping, fmt), media_type=shopping_list.FORMATS[fmt],
+                             headers=headers)
+
+
+@app.get("/p/{token}", response_class=HTMLResponse)
+async def show_token_plan(request: Request, token: str):
+    """Rebuild a plan from a signed plan token, with no storage read."""
+    if not (HAS_MASTER_ENGINE and plan_token.ENABLED):
+        return results_error(request, "Plan links are not available right now. Take the quiz for a fresh plan.", 404)
+    data = data_registry.registry.current()
+    try:
+        inputs, stale = plan_token.decode(token, data)
+    except plan_token.InvalidToken:
+        plan_token.TOKEN_REQUESTS.inc("invalid")
+        return results_error(request, "This meal plan link is not valid. Take the quiz for a fresh plan.", 404)
+    plan_token.TOKEN_REQUESTS.inc("stale" if stale else "ok")
+    if stale:
+        log_event("plan_token_stale", data_digest=data.digest)
+    try:
+        html = await run_plan_task(plan_executor.token_page_task, inputs.profile(), inputs.seed, data.digest, token,
+                                   plan_results.STALE_NOTICE if stale else None,
+                                   plan_duration=inputs.plan_duration, data_version=data.version)
+    except (plan_executor.ExecutorBusy, plan_executor.ExecutorTimeout):
+        return results_error(request, BUSY_MESSAGE, 503)
+    except NoCompatibleMeals:
+        return results_error(request, NO_COMPATIBLE_MEALS_MESSAGE, 422)
+    return HTMLResponse(html)
 
 # Only register form submission endpoint if multipart is available
 if HAS_MULTIPART:
@@ -276,7 +459,7 @@ if HAS_MULTIPART:
     ):
         """Handle 6-step quiz form submission and display personalized meal plan"""
         try:
-            logger.info(f"Quiz submitted: {{'name': '{name}', 'email': '{email}', 'plan_duration': {plan_duration}}}")
+            log_event("quiz_submitted", name=name, email=email, plan_duration=plan_duration)
             
             # Convert family_size from string to int (handle empty string)
             family_size_int = int(family_size) if family_size and family_size.strip() else None
@@ -327,34 +510,39 @@ if HAS_MULTIPART:
                 "challenges": challenges,
                 "plan_duration": plan_duration
             }
-            # Freemium control logic
-            is_premium = plan_duration > 3
-
             # Generate meal plan using master engine
             if HAS_MASTER_ENGINE:
-                meal_plan = generate_enhanced_meal_plan(user_profile)
-                pdf_recommendations = get_enhanced_recommended_pdfs(user_profile)
-                flavor_balance_index = calculate_flavor_balance_index(meal_plan)
-
-                # Add freemium messaging
-                if is_premium:
-                    meal_plan["is_premium"] = True
-                    meal_plan["premium_message"] = "✨ Unlock your full 7-day plan with WelFore Premium!"
-                    meal_plan["stripe_link"] = STRIPE_7DAY_LINK if plan_duration == 7 else STRIPE_14DAY_LINK
+                data = data_registry.registry.current()   # this request's data, even across a reload
+                # A ready plan for this profile's class if the pool has one, else an engine run
+                pooled = plan_pool.pool.take(user_profile, data) if plan_pool.ENABLED else None
+                if pooled is not None:
+                    payload, timings = pooled
+                    record_plan_timings(timings)
                 else:
-                    meal_plan["is_premium"] = False
-
-                return templates.TemplateResponse("results.html", {
-                    "request": request,
-                    "meal_plan": meal_plan,
-                    "pdf_recommendations": pdf_recommendations,
-                    "flavor_balance_index": flavor_balance_index,
-                    "generated_at": datetime.now().strftime("%B %d, %Y at %I:%M %p")
-                })
+                    try:
+                        payload = await run_plan_task(plan_executor.generate_task, user_profile,
+                                                      plan_token.new_seed(), data.digest,
+                                                      plan_duration=plan_duration, data_version=data.version)
+                    except (plan_executor.ExecutorBusy, plan_executor.ExecutorTimeout):
+                        return results_error(request, BUSY_MESSAGE, 503)
+                    except NoCompatibleMeals:
+                        return results_error(request, NO_COMPATIBLE_MEALS_MESSAGE, 422)
+                # Store the plan and redirect to it, so a reload or a revisit renders
+                # the stored plan instead of submitting the quiz again
+                try:
+                    with span("plan_store.save"):
+                        plan_id = await asyncio.to_thread(plan_store.store.save, payload, data.digest)
+                except Exception as e:
+                    log_event("plan_store_save_failed", level=logging.ERROR, error=str(e))
+                    html, seconds = plan_results.render_results(payload)
+                    RESULTS_RENDER_SERIES.observe(seconds)
+                    return HTMLResponse(html)
+                log_event("plan_stored", plan_id=plan_id, plan_duration=plan_duration)
+                return RedirectResponse(url=f"/plan/{plan_id}", status_code=303)
 
             else:
                 # Fallback if master engine not available
-                return templates.TemplateResponse("results.html", {
+                return render_template("results.html", {
                     "request": request,
                     "error": True,
                     "error_message": "Meal plan generation is temporarily unavailable. Please try again later.",
@@ -363,7 +551,7 @@ if HAS_MULTIPART:
 
         except Exception as e:
             logger.error(f"Error processing quiz submission: {str(e)}", exc_info=True)
-            return templates.TemplateResponse("results.html", {
+            return render_template("results.html", {
                 "request": request,
                 "error": True,
                 "error_message": "We encountered an issue processing your request. Please try again.",
@@ -375,17 +563,27 @@ else:
     print("⚠️ Form submission endpoint skipped (python-multipart not installed)")
        
   
+async def stored_plan_link(plan_id: Any) -> Optional[str]:
+    """Email link for a plan ID sent along with a webhook, if that plan is stored."""
+    if not plan_id or not plan_store.PUBLIC_BASE_URL:
+        return None
+    if not await asyncio.to_thread(plan_store.store.exists, str(plan_id)):
+        return None
+    return plan_store.plan_url(str(plan_id))
+
+
 @app.post("/webhook/quiz")
 async def quiz_webhook(request: Request):
+    payload = None
     try:
         payload = await request.json()
-        logger.info(f"Received quiz webhook: {payload}")
+        log_event("quiz_webhook_received", payload=payload)
         
         email = payload.get('email')
         name = payload.get('name', '')
         
         if not email:
-            logger.error("No email provided in webhook payload")
+            log_event("quiz_webhook_missing_email", level=logging.ERROR, payload=payload)
             return JSONResponse(
                 status_code=400,
                 content={"status": "error", "message": "Email is required"}
@@ -404,38 +602,39 @@ async def quiz_webhook(request: Request):
                 }
             )
         
-        contact = lookup_contact(email)
+        contact = await lookup_contact(email)
         
         if contact is None:
-            contact = create_contact(email, name)
+            contact = await create_contact(email, name)
             if contact:
                 user_status = "new"
             else:
-                logger.error(f"Failed to create contact for {email}")
+                log_event("contact_create_failed", level=logging.ERROR, email=email)
                 return JSONResponse(
                     status_code=500,
                     content={"status": "error", "message": "Failed to process request"}
                 )
         else:
-            has_tag = has_freemium_tag(contact)
+            has_tag = await has_freemium_tag(contact)
             if has_tag:
                 user_status = "repeat"
             else:
                 user_status = "returning"
         
-        logger.info(f"User status: {user_status} for email: {email}")
+        log_event("user_status_resolved", user_status=user_status, email=email)
         
         if user_status in ["new", "returning"]:
             contact_id = contact.get('id')
             if contact_id:
-                add_tag_to_contact(contact_id, "Freemium-Used")
+                await add_tag_to_contact(contact_id, "Freemium-Used")
             
-            email_body = get_free_plan_email(name or 'there')
-            send_email(email, "Your FREE 3-Day Meal Plan", email_body)
+            plan_link = await stored_plan_link(payload.get('plan_id'))
+            email_body = get_free_plan_email(name or 'there', plan_link)
+            await send_email(email, "Your FREE 3-Day Meal Plan", email_body)
             
-            send_admin_notification(email, "3-Day Free", user_status)
+            await send_admin_notification(email, "3-Day Free", user_status)
             
-            logger.info(f"Free plan delivered to {user_status} user: {email}")
+            log_event("free_plan_delivered", user_status=user_status, email=email)
             return JSONResponse(
                 content={
                     "status": "delivered",
@@ -447,9 +646,9 @@ async def quiz_webhook(request: Request):
         
         else:
             email_body = get_upsell_email(name or 'there')
-            send_email(email, "Upgrade Your Meal Plan", email_body)
+            await send_email(email, "Upgrade Your Meal Plan", email_body)
             
-            logger.info(f"Upsell sent to repeat user: {email}")
+            log_event("upsell_sent", user_status=user_status, email=email)
             return JSONResponse(
                 content={
                     "status": "blocked",
@@ -463,7 +662,7 @@ async def quiz_webhook(request: Request):
             )
         
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        log_event("quiz_webhook_failed", level=logging.ERROR, error=str(e), payload=payload)
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": "Internal server error"}
@@ -471,12 +670,39 @@ async def quiz_webhook(request: Request):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    data = data_registry.registry.current()
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(),
+            "data_version": data.version, "data_digest": data.digest}
+
+import logger_utils
+metrics.REGISTRY.gauge(
+    "welfore_log_queue_pending", "Log records waiting for the background writer", ("logger",),
+    callback=lambda: {(name, ): stats["pending"] for name, stats in logger_utils.queue_stats().items()})
+metrics.REGISTRY.gauge(
+    "welfore_log_records_dropped", "Log records dropped on queue overflow", ("logger",),
+    callback=lambda: {(name, ): stats["dropped"] for name, stats in logger_utils.queue_stats().items()})
+metrics.REGISTRY.gauge(
+    "welfore_log_records_sampled_out", "INFO records suppressed by per-route log sampling",
+    callback=lambda: {(): logger_utils.log_sampler.suppressed_records})
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition (summed over all launcher workers)"""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/memory")
+async def admin_memory(request: Request, snapshot: bool = False, limit: int = 15):
+    """Memory report for this worker: RSS, per-route retained bytes, top allocation sites and growth"""
+    if not is_admin(request.headers.get("x-admin-token")):
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Admin token required"})
+    if snapshot and memory_tracking.tracker.active:
+        await asyncio.to_thread(memory_tracking.tracker.snapshot)
+    return memory_tracking.tracker.report(limit=max(1, min(limit, 100)))
 
 @app.post("/test/webhook")
 async def test_webhook(request: Request):
     payload = await request.json()
-    logger.info(f"Test webhook received: {payload}")
+    log_event("test_webhook_received", payload=payload)
     return {"status": "test_received", "payload": payload}
 
 # ---- SHUTDOWN LOG HANDLER ----
@@ -501,34 +727,35 @@ async def freemium_check(request: Request):
     data = await request.json()
     email = data.get("email")
     name = data.get("name", "Friend")
+    plan_id = data.get("plan_id")
 
     if not email:
         return JSONResponse(status_code=400, content={"error": "Email required"})
 
     try:
-        contact = lookup_contact(email)
+        contact = await lookup_contact(email)
         if contact is None:
             # new user — create contact and tag
-            new_contact = create_contact(email, name)
+            new_contact = await create_contact(email, name)
             if new_contact:
-                add_tag_to_contact(new_contact["id"], "Freemium-Used")
-                send_admin_notification(email, "3-Day Free", "new")
-                email_body = get_free_plan_email(name)
-                send_email(email, "Your FREE 3-Day Flavor Reset Plan", email_body)
+                await add_tag_to_contact(new_contact["id"], "Freemium-Used")
+                await send_admin_notification(email, "3-Day Free", "new")
+                email_body = get_free_plan_email(name, await stored_plan_link(plan_id))
+                await send_email(email, "Your FREE 3-Day Flavor Reset Plan", email_body)
                 return {"status": "ok", "message": "Free plan granted"}
 
         else:
             # returning user
-            if has_freemium_tag(contact):
+            if await has_freemium_tag(contact):
                 # already used
                 email_body = get_upsell_email(name)
-                send_email(email, "Upgrade Your Flavor Reset Plan", email_body)
+                await send_email(email, "Upgrade Your Flavor Reset Plan", email_body)
                 return {"status": "blocked", "message": "Free plan already used"}
             else:
                 # returning user without tag
-                add_tag_to_contact(contact["id"], "Freemium-Used")
-                email_body = get_free_plan_email(name)
-                send_email(email, "Your FREE 3-Day Flavor Reset Plan", email_body)
+                await add_tag_to_contact(contact["id"], "Freemium-Used")
+                email_body = get_free_plan_email(name, await stored_plan_link(plan_id))
+                await send_email(email, "Your FREE 3-Day Flavor Reset Plan", email_body)
                 return {"status": "ok", "message": "Free plan granted (returning user)"}
 
     except Exception as e:
@@ -4,85 +4,78 @@ Generates culturally attuned, fiber- and color-balanced meal plans with freemium
 Includes GLP-1 / bariatric / breastfeeding adaptations and healthy snack pairings.
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import random
 
+import dietary
+import preferences
+import variety
+from data_registry import DataSnapshot, registry
+from plan_model import DayPlan, MealPlan, boost, meal_slot, snack
+
 # -----------------------------
-# CUISINE MEAL PALETTES
+# ENGINE TABLES
 # -----------------------------
-CUISINE_MEALS = {
-    "African American": {
-        "breakfast": ["Sweet potato hash with collard greens", "Grits bowl with scrambled eggs and greens"],
-        "lunch": ["Black-eyed pea salad with cornbread", "Smoked turkey and kale soup"],
-        "dinner": ["Baked chicken with roasted okra and brown rice", "Turkey meatballs with greens and sweet potato"],
-        "colors": ["orange", "green", "white", "red"]
-    },
-    "Caribbean": {
-        "breakfast": ["Ackee and callaloo scramble", "Plantain and egg bowl"],
-        "lunch": ["Jerk chicken salad with mango", "Rice and peas with steamed vegetables"],
-        "dinner": ["Grilled fish with festival and coleslaw", "Curry chickpea stew with rice"],
-        "colors": ["yellow", "green", "red", "orange"]
-    },
-    "Mexican": {
-        "breakfast": ["Huevos rancheros with black beans", "Breakfast burrito with veggies"],
-        "lunch": ["Chicken fajita bowl with peppers", "Black bean and corn salad"],
-        "dinner": ["Fish tacos with cabbage slaw", "Chicken enchiladas with verde sauce"],
-        "colors": ["red", "green", "yellow", "orange"]
-    },
-    "South Asian": {
-        "breakfast": ["Veggie upma with chutney", "Moong dal cheela with yogurt"],
-        "lunch": ["Chana masala with brown rice", "Palak paneer with roti"],
-        "dinner": ["Tandoori chicken with raita and salad", "Lentil dal with roasted vegetables"],
-        "colors": ["orange", "green", "yellow", "red"]
-    },
-    "East Asian": {
-        "breakfast": ["Congee with vegetables and egg", "Miso soup with tofu and greens"],
-        "lunch": ["Teriyaki salmon with bok choy", "Vegetable stir-fry with brown rice"],
-        "dinner": ["Grilled fish with seaweed salad", "Chicken and broccoli with quinoa"],
-        "colors": ["green", "orange", "white", "red"]
-    },
-    "Mediterranean": {
-        "breakfast": ["Greek yogurt with berries and nuts", "Shakshuka with whole grain bread"],
-        "lunch": ["Greek salad with grilled chicken", "Lentil soup with vegetables"],
-        "dinner": ["Grilled fish with roasted vegetables", "Chicken souvlaki with tabbouleh"],
-        "colors": ["red", "green", "purple", "orange"]
-    },
-    "West African": {
-        "breakfast": ["Millet porridge with fruit", "Bean cakes with pepper sauce"],
-        "lunch": ["Jollof rice with grilled chicken", "Groundnut soup with vegetables"],
-        "dinner": ["Grilled tilapia with plantain and greens", "Black-eyed pea stew with rice"],
-        "colors": ["red", "orange", "green", "yellow"]
-    },
-    "Italian": {
-        "breakfast": ["Frittata with vegetables", "Whole grain toast with tomatoes"],
-        "lunch": ["Minestrone soup with beans", "Caprese salad with grilled chicken"],
-        "dinner": ["Grilled fish with roasted peppers", "Chicken cacciatore with vegetables"],
-        "colors": ["red", "green", "orange", "white"]
-    }
-}
-
-# Color food backup list (for missing color diversity)
-COLOR_FOODS = {
-    "red": ["tomatoes", "strawberries", "red bell peppers", "beets", "watermelon"],
-    "orange": ["carrots", "sweet potatoes", "oranges", "butternut squash", "papaya"],
-    "yellow": ["bananas", "corn", "yellow squash", "pineapple", "lemons"],
-    "green": ["spinach", "broccoli", "avocados", "kale", "collard greens"],
-    "blue-purple": ["blueberries", "eggplant", "purple cabbage", "blackberries", "plums"],
-    "white": ["cauliflower", "onions", "garlic", "mushrooms", "turnips"]
-}
-
-# Snack templates: Protein + one other food group
-PROTEINS = ["Greek yogurt", "boiled egg", "string cheese", "hummus", "almonds", "peanut butter", "turkey slices"]
-SNACK_PARTNERS = ["apple slices", "whole-grain crackers", "carrot sticks", "celery", "berries", "veggie chips", "banana"]
+# Meal palettes, color foods and snack lists come from data/ through the data
+# registry; these tables are rebuilt for every data snapshot.
+DEFAULT_CUISINE = "Mediterranean"
+
+
+def _day_colors(palette_colors: List[str], color_foods: Dict[str, List[str]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """(colors a day achieves, colors a boost snack is added for) - fixed per cuisine."""
+    colors = tuple(dict.fromkeys(palette_colors))
+    boosts: Tuple[str, ...] = ()
+    if len(colors) < 5:
+        boosts = tuple(c for c in color_foods if c not in colors)[:2]
+    return colors + boosts, boosts
+
+
+class EngineTables:
+    """Per-snapshot lookup tables for build_meal_plan."""
+
+    __slots__ = ("cuisine_slots", "day_colors", "color_foods", "proteins", "snack_partners", "default_cuisine")
+
+    def __init__(self, data):
+        # Meals by their snapshot id; plans only hold the slots. Shared MealSlot
+        # objects per (cuisine, GLP-1/bariatric adapted), in palette order.
+        self.cuisine_slots = {
+            (cuisine, adapted): {
+                slot: tuple(meal_slot(slot, data.meal_ids[text], text, adapted) for text in palette[slot])
+                for slot in ("breakfast", "lunch", "dinner")
+            }
+            for cuisine, palette in data.cuisine_meals.items()
+            for adapted in (False, True)
+        }
+        self.day_colors = {cuisine: _day_colors(palette["colors"], data.color_foods)
+                           for cuisine, palette in data.cuisine_meals.items()}
+        self.color_foods = {color: tuple(foods) for color, foods in data.color_foods.items()}
+        self.proteins = tuple(data.proteins)
+        self.snack_partners = tuple(data.snack_partners)
+        self.default_cuisine = DEFAULT_CUISINE if DEFAULT_CUISINE in self.day_colors else next(iter(self.day_colors))
+
+
+registry.register_index("master_engine", EngineTables)
 
 # -----------------------------
 # MEAL PLAN GENERATOR
 # -----------------------------
-def generate_enhanced_meal_plan(user_profile: Dict[str, Any]) -> Dict[str, Any]:
+def build_meal_plan(user_profile: Dict[str, Any], data: Optional[DataSnapshot] = None,
+                    rng: Optional[random.Random] = None) -> MealPlan:
     """
     Generate a culturally attuned, rainbow-balanced meal plan with snack logic.
+    Uses `data` (default: the current data snapshot) for palettes and snacks,
+    and `rng` (default: the global random module) for every choice, so the
+    same profile, data and seeded rng always give the same plan. Meals and
+    snacks excluded by the profile's dietary restrictions are never chosen
+    (see dietary.py). Each slot rotates through its options without serving a
+    dish on consecutive days, and snacks spread over the protein x partner
+    pairings (see variety.py); options with foods from the profile's rainbow
+    preferences lead each rotation (see preferences.py).
     """
+    data = data or registry.current()
+    tables: EngineTables = data.index("master_engine")
+    rng = rng or random
     plan_duration = int(user_profile.get("plan_duration", 3))
     selected_cuisines = user_profile.get("cuisines", ["Mediterranean"])
     health_goal = user_profile.get("health_goal", "general_wellness")
@@ -91,92 +84,73 @@ def generate_enhanced_meal_plan(user_profile: Dict[str, Any]) -> Dict[str, Any]:
     is_glp1 = "glp" in str(special_conditions)
     is_bariatric = "bariatric" in str(special_conditions)
     is_breastfeeding = "breast" in str(special_conditions)
-
-    primary_cuisine = selected_cuisines[0] if selected_cuisines else "Mediterranean"
-    if primary_cuisine not in CUISINE_MEALS:
-        primary_cuisine = "Mediterranean"
-
-    meal_plan = []
-    total_colors = []
-
+    adapted = is_glp1 or is_bariatric
+
+    primary_cuisine = selected_cuisines[0] if selected_cuisines else tables.default_cuisine
+    if primary_cuisine not in tables.day_colors:
+        primary_cuisine = tables.default_cuisine
+
+    restrictions = 0
+    excluded = 0
+    if user_profile.get("dietary_restrictions"):
+        diet: dietary.DietIndex = data.index("dietary")
+        restrictions = diet.parse(user_profile["dietary_restrictions"])
+        excluded = diet.excluded(restrictions)
+
+    if excluded:
+        # Candidate tables with excluded items masked out, cached per restriction set
+        candidates = diet.candidates(tables, primary_cuisine, adapted, excluded)
+        breakfasts, lunches, dinners = candidates.breakfasts, candidates.lunches, candidates.dinners
+        day_colors, boost_colors = candidates.day_colors, candidates.boost_colors
+        proteins, partners, color_foods = candidates.proteins, candidates.partners, candidates.color_foods
+    else:
+        slots = tables.cuisine_slots[(primary_cuisine, adapted)]
+        breakfasts, lunches, dinners = slots["breakfast"], slots["lunch"], slots["dinner"]
+        day_colors, boost_colors = tables.day_colors[primary_cuisine]
+        proteins, partners, color_foods = tables.proteins, tables.snack_partners, tables.color_foods
+
+    # Weights from the cuisine's preference table; groups are breakfast, lunch,
+    # dinner, snack partner, then each boost color
+    weights = [None] * (4 + len(boost_colors))
+    liked = preferences.liked_foods(user_profile)
+    if liked:
+        table = data.index("preferences").table((primary_cuisine, excluded), (breakfasts, lunches, dinners),
+                                                partners, [color_foods[c] for c in boost_colors])
+        weights = table.weights(liked)
+
+    # Every slot's options for the whole plan, in O(days)
+    rotation = variety.rotation
+    meal_days = list(zip(rotation(breakfasts, plan_duration, rng, weights[0]),
+                         rotation(lunches, plan_duration, rng, weights[1]),
+                         rotation(dinners, plan_duration, rng, weights[2])))
+    pairs = variety.snack_pairs(proteins, partners, 2 * plan_duration, rng, weights[3])
+    # Color diversity check: boost snacks for colors the cuisine palette lacks
+    boost_days = [rotation(color_foods[c], plan_duration, rng, weights[4 + i]) for i, c in enumerate(boost_colors)]
+
+    days = []
     for day in range(1, plan_duration + 1):
-        day_colors = set()
-        day_meals = []
-
-        # Breakfast
-        breakfast = random.choice(CUISINE_MEALS[primary_cuisine]["breakfast"])
-        if is_glp1 or is_bariatric:
-            breakfast += " (protein-focused, smaller portion)"
-        day_meals.append(f"Breakfast: {breakfast}")
-
-        # Mid-morning snack
-        protein = random.choice(PROTEINS)
-        partner = random.choice(SNACK_PARTNERS)
-        day_meals.append(f"Mid-morning Snack: {protein} + {partner}")
-
-        # Lunch
-        lunch = random.choice(CUISINE_MEALS[primary_cuisine]["lunch"])
-        if is_glp1 or is_bariatric:
-            lunch += " (reduced portion, lean protein priority)"
-        day_meals.append(f"Lunch: {lunch}")
-
-        # Mid-afternoon snack
-        protein = random.choice(PROTEINS)
-        partner = random.choice(SNACK_PARTNERS)
-        day_meals.append(f"Mid-afternoon Snack: {protein} + {partner}")
-
-        # Dinner
-        dinner = random.choice(CUISINE_MEALS[primary_cuisine]["dinner"])
-        if is_glp1 or is_bariatric:
-            dinner += " (smaller portion, high-protein focus)"
-        day_meals.append(f"Dinner: {dinner}")
-
-        # Color diversity check
-        day_colors.update(CUISINE_MEALS[primary_cuisine]["colors"])
-        if len(day_colors) < 5:
-            missing = [c for c in COLOR_FOODS if c not in day_colors]
-            for c in missing[:2]:
-                extra = random.choice(COLOR_FOODS[c])
-                day_meals.append(f"Snack Boost: add {extra} for extra {c} nutrients")
-                day_colors.add(c)
-
-        # Hydration
-        hydration = "Drink 10-12 glasses water (extra for breastfeeding)" if is_breastfeeding else "Drink 8-10 glasses water"
-        day_meals.append(f"Hydration: {hydration}")
-
-        # Daily nutrition goals
-        fiber_goal = "20-25g fiber"
-        protein_goal = "80-100g protein" if (is_glp1 or is_bariatric) else "60-80g protein"
-        day_meals.append(f"Daily Goals: {fiber_goal}, {protein_goal}")
-
-        meal_plan.append({
-            "day": day,
-            "meals": day_meals,
-            "colors_achieved": len(day_colors),
-            "colors": list(day_colors)
-        })
-        total_colors.append(len(day_colors))
-
-    avg_colors = round(sum(total_colors) / len(total_colors), 1) if total_colors else 0
-
-    return {
-        "user_name": user_profile.get("name", "Friend"),
-        "health_goal": health_goal,
-        "plan_duration": plan_duration,
-        "primary_cuisine": primary_cuisine,
-        "meal_plan": meal_plan,
-        "average_colors_per_day": avg_colors,
-        "nutrition_targets": {
-            "fiber_daily": fiber_goal,
-            "protein_daily": protein_goal,
-            "hydration": hydration
-        },
-        "special_adaptations": {
-            "glp1": is_glp1,
-            "bariatric": is_bariatric,
-            "breastfeeding": is_breastfeeding
-        }
-    }
+        morning = snack("mid_morning", *pairs[2 * day - 2])
+        afternoon = snack("mid_afternoon", *pairs[2 * day - 1])
+        boosts = tuple(boost(c, foods[day - 1]) for c, foods in zip(boost_colors, boost_days))
+        days.append(DayPlan(day, meal_days[day - 1], (morning, afternoon), boosts, day_colors))
+
+    return MealPlan(
+        user_name=user_profile.get("name", "Friend"),
+        health_goal=health_goal,
+        plan_duration=plan_duration,
+        primary_cuisine=primary_cuisine,
+        days=tuple(days),
+        glp1=is_glp1,
+        bariatric=is_bariatric,
+        breastfeeding=is_breastfeeding,
+        restrictions=dietary.restriction_names(restrictions),
+    )
+
+
+def generate_enhanced_meal_plan(user_profile: Dict[str, Any], data: Optional[DataSnapshot] = None,
+                                rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """Dict form of build_meal_plan(), as used by the templates and JSON API."""
+    return build_meal_plan(user_profile, data, rng).to_dict()
 
 # -----------------------------
 # RECOMMENDED PDF GUIDES
@@ -211,9 +185,9 @@ def get_enhanced_recommended_pdfs(user_profile: Dict[str, Any]) -> List[Dict[str
 # -----------------------------
 # FLAVOR BALANCE INDEX
 # -----------------------------
-def calculate_flavor_balance_index(meal_plan: Dict[str, Any]) -> int:
+def calculate_flavor_balance_index(meal_plan: Dict[str, Any], rng: Optional[random.Random] = None) -> int:
     """Generate a positive, motivating score based on variety and color diversity."""
-    base = random.randint(75, 95)
+    base = (rng or random).randint(75, 95)
     if meal_plan.get("plan_duration", 3) > 3:
         base += 3
     color_bonus = int(min(meal_plan.get("average_colors_per_day", 5), 7))
@@ -0,0 +1,175 @@
+"""
+WelFore Health Memory Tracking
+Opt-in tracemalloc accounting to find what makes a long-running worker grow.
+
+With MEMORY_TRACKING=true each worker:
+  - traces allocations (MEMORY_TRACE_FRAMES frames per allocation site)
+  - records, per route, how many traced bytes were still held after each request
+  - takes a snapshot every MEMORY_SNAPSHOT_INTERVAL seconds and keeps the
+    first (baseline), the previous and the latest one
+
+`GET /admin/memory` (X-Admin-Token header) reports RSS, traced memory, the
+per-route figures, the top allocation sites and growth between snapshots.
+Tracing slows allocation-heavy code noticeably; leave it off in normal operation.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Optional
+
+from logger_utils import log_event
+
+MEMORY_TRACKING = os.getenv("MEMORY_TRACKING", "false").lower() in ("1", "true", "yes")
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+MEMORY_SNAPSHOT_INTERVAL = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "300"))
+MEMORY_TOP_SITES = 15
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None where unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RouteMemory:
+    __slots__ = ("requests", "retained", "max_retained")
+
+    def __init__(self):
+        self.requests = 0
+        self.retained = 0
+        self.max_retained = 0
+
+
+class MemoryTracker:
+    """Per-route retained bytes plus baseline/previous/latest snapshots."""
+
+    def __init__(self, frames: int = MEMORY_TRACE_FRAMES):
+        self.frames = frames
+        self.routes: Dict[str, RouteMemory] = {}
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.latest: Optional[tracemalloc.Snapshot] = None
+        self.latest_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            print(f"✅ Memory tracking enabled (tracemalloc, {self.frames} frames)")
+
+    def record(self, route: str, retained: int):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteMemory()
+        stats.requests += 1
+        stats.retained += retained
+        if retained > stats.max_retained:
+            stats.max_retained = retained
+
+    def snapshot(self):
+        """Take a snapshot and rotate latest -> previous (the first one becomes the baseline)."""
+        snap = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self.lock:
+            if self.baseline is None:
+                self.baseline = snap
+            self.previous, self.latest = self.latest, snap
+            self.latest_at = time.time()
+        return snap
+
+    def report(self, limit: int = MEMORY_TOP_SITES) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if self.active else (0, 0)
+        data: Dict[str, Any] = {
+            "tracking": self.active,
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "routes": {
+                route: {
+                    "requests": s.requests,
+                    "retained_bytes": s.retained,
+                    "retained_per_request": round(s.retained / s.requests, 1) if s.requests else 0,
+                    "max_retained_bytes": s.max_retained,
+                }
+                for route, s in sorted(self.routes.items(), key=lambda item: -item[1].retained)
+            },
+        }
+        with self.lock:
+            latest, previous, baseline = self.latest, self.previous, self.baseline
+            data["snapshot_at"] = self.latest_at or None
+        if latest is not None:
+            data["top_sites"] = [_format_stat(s) for s in latest.statistics("lineno")[:limit]]
+            if previous is not None:
+                data["growth_since_previous"] = [_format_diff(d) for d in latest.compare_to(previous, "lineno")[:limit]]
+            if baseline is not None and baseline is not latest:
+                data["growth_since_baseline"] = [_format_diff(d) for d in latest.compare_to(baseline, "lineno")[:limit]]
+        return data
+
+
+def _site(traceback) -> str:
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _format_stat(stat) -> Dict[str, Any]:
+    return {"site": _site(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+
+
+def _format_diff(diff) -> Dict[str, Any]:
+    return {"site": _site(diff.traceback), "size_bytes": diff.size, "size_diff_bytes": diff.size_diff,
+            "count_diff": diff.count_diff}
+
+
+tracker = MemoryTracker()
+
+
+async def snapshot_loop():
+    """Take a baseline snapshot at startup and another every MEMORY_SNAPSHOT_INTERVAL seconds."""
+    while True:
+        await asyncio.to_thread(tracker.snapshot)
+        log_event("memory_snapshot", traced_bytes=tracemalloc.get_traced_memory()[0], rss_bytes=rss_bytes())
+        await asyncio.sleep(MEMORY_SNAPSHOT_INTERVAL)
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+class MemoryTrackingMiddleware:
+    """Records traced bytes still held after each request, per route.
+
+    With concurrent requests the delta also includes whatever the others
+    allocated, so the per-route figures are most precise at low concurrency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not MEMORY_TRACKING or scope["type"] != "http" or not tracemalloc.is_tracing():
+            return await self.app(scope, receive, send)
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            tracker.record(getattr(route, "path", None) or "unmatched", tracemalloc.get_traced_memory()[0] - before)
@@ -0,0 +1,364 @@
+"""
+WelFore Health Metrics
+Low-overhead in-process metrics with a Prometheus text endpoint.
+
+Histograms use fixed buckets: every labelled series owns a preallocated list
+of bucket counts, so an observation is one bisect and three in-place adds.
+
+With the multi-worker launcher each worker keeps its own registry. When
+METRICS_DIR is set (the launcher sets it), workers publish snapshots there and
+/metrics serves the sum over all workers, including ones already recycled.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from logger_utils import log_event
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_LABEL_SEP = "\x1f"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Tuple[str, ...], key: str, extra: str = "") -> str:
+    values = key.split(_LABEL_SEP) if names else []
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+# -----------------------------
+# METRIC TYPES
+# -----------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[str, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = _LABEL_SEP.join(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def snapshot(self):
+        return dict(self.values)
+
+    @staticmethod
+    def merge(into: dict, other: dict):
+        for key, value in other.items():
+            into[key] = into.get(key, 0.0) + value
+
+    def render(self, values: dict) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_fmt(v)}" for key, v in sorted(values.items())]
+
+
+class HistogramSeries:
+    """One labelled histogram series: per-bucket counts (last slot is +Inf), sum, count."""
+
+    __slots__ = ("bounds", "counts", "total")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.series: Dict[str, HistogramSeries] = {}
+
+    def labels(self, *labels: str) -> HistogramSeries:
+        """Series for a label combination; bind it once for hot paths."""
+        key = _LABEL_SEP.join(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = HistogramSeries(self.bounds)
+        return series
+
+    def observe(self, value: float, *labels: str):
+        self.labels(*labels).observe(value)
+
+    def snapshot(self):
+        # Runs on the publisher thread while labels() may add series: copy the
+        # items in one step (atomic under the GIL) before iterating
+        return {key: s.counts + [s.total] for key, s in list(self.series.items())}
+
+    @staticmethod
+    def merge(into: dict, other: dict):
+        for key, values in other.items():
+            current = into.get(key)
+            into[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+
+    def render(self, values: dict) -> List[str]:
+        lines = []
+        for key, data in sorted(values.items()):
+            counts, total = data[:-1], data[-1]
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _fmt(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[str, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str):
+        self.values[_LABEL_SEP.join(labels)] = value
+
+    def snapshot(self):
+        values = dict(self.values)
+        if self.callback is not None:
+            try:
+                for labels, value in self.callback().items():
+                    values[_LABEL_SEP.join(labels)] = float(value)
+            except Exception:
+                pass
+        return values
+
+    merge = staticmethod(Counter.merge)
+    render = Counter.render
+
+
+# -----------------------------
+# REGISTRY
+# -----------------------------
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+    def render(self, snapshot: Optional[dict] = None) -> str:
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(snapshot.get(name, {})))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "welfore_http_request_duration_seconds", "Request latency by route", ("route", "method", "status"))
+PLAN_GENERATION_SECONDS = REGISTRY.histogram(
+    "welfore_plan_generation_seconds", "Meal plan engine time (plan, guides and flavor index)", ("engine",))
+TEMPLATE_RENDER_SECONDS = REGISTRY.histogram(
+    "welfore_template_render_seconds", "Jinja template render time", ("template",))
+GHL_REQUEST_SECONDS = REGISTRY.histogram(
+    "welfore_ghl_request_duration_seconds", "GoHighLevel API call latency", ("operation", "outcome"))
+SMTP_SEND_SECONDS = REGISTRY.histogram(
+    "welfore_smtp_send_duration_seconds", "SMTP send latency", ("outcome",))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "welfore_event_loop_lag_seconds", "Delay of a periodic timer on the event loop", buckets=LAG_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter(
+    "welfore_cache_requests_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result"))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+class MetricsMiddleware:
+    """Records per-route latency. Routes are labelled by their template path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(path, scope.get("method", ""), status[0]).observe(time.perf_counter() - start)
+
+
+async def event_loop_lag_monitor():
+    """Measure how late a short sleep wakes up; sustained lag means blocking work on the loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - EVENT_LOOP_LAG_INTERVAL))
+
+
+# -----------------------------
+# MULTI-WORKER AGGREGATION
+# -----------------------------
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: Path, data: dict):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _merge_into(total: dict, snapshot: dict, include_gauges: bool = True):
+    for name, values in snapshot.items():
+        metric = REGISTRY.metrics.get(name)
+        if metric is None or (metric.kind == "gauge" and not include_gauges):
+            continue
+        metric.merge(total.setdefault(name, {}), values)
+
+
+def publish_snapshot():
+    """Write this worker's snapshot to METRICS_DIR."""
+    if METRICS_DIR:
+        _write_json(Path(METRICS_DIR) / f"worker_{os.getpid()}.json", REGISTRY.snapshot())
+
+
+def _retire_dead_workers(directory: Path):
+    """Fold counters of exited workers into retired.json so totals stay monotonic."""
+    for path in directory.glob("worker_*.json"):
+        try:
+            pid = int(path.stem.split("_")[1])
+        except (IndexError, ValueError):
+            continue
+        if _pid_alive(pid):
+            continue
+        claim = path.with_name(f".retiring-{pid}-{os.getpid()}.json")
+        try:
+            os.rename(path, claim)
+        except FileNotFoundError:
+            continue  # another worker claimed it
+        with open(directory / "retired.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = directory / "retired.json"
+            retired = json.loads(retired_path.read_text()) if retired_path.exists() else {}
+            _merge_into(retired, json.loads(claim.read_text()), include_gauges=False)
+            _write_json(retired_path, retired)
+        claim.unlink(missing_ok=True)
+
+
+def collect() -> dict:
+    """Snapshot for /metrics: this worker's live values plus every other worker's."""
+    total: dict = {}
+    _merge_into(total, REGISTRY.snapshot())
+    if not METRICS_DIR:
+        return total
+
+    directory = Path(METRICS_DIR)
+    _retire_dead_workers(directory)
+    own = f"worker_{os.getpid()}.json"
+    for path in list(directory.glob("worker_*.json")) + [directory / "retired.json"]:
+        if path.name == own:
+            continue
+        try:
+            _merge_into(total, json.loads(path.read_text()))
+        except (FileNotFoundError, ValueError):
+            pass
+    return total
+
+
+def render_metrics() -> str:
+    return REGISTRY.render(collect())
+
+
+def _publisher():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            publish_snapshot()
+        except Exception as e:
+            # Keep publishing: a dead thread would drop this worker from /metrics for good
+            log_event("metrics_publish_failed", level=logging.ERROR, error=str(e))
+
+
+def start_publisher():
+    """Start the snapshot publisher thread (call once per worker, after fork)."""
+    if METRICS_DIR:
+        Path(METRICS_DIR).mkdir(parents=True, exist_ok=True)
+        threading.Thread(target=_publisher, name="metrics-publisher", daemon=True).start()
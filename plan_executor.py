@@ -0,0 +1,219 @@
+"""
+WelFore Health Plan Executor
+Runs the plan engine and results rendering in a bounded process pool, off the event loop.
+
+Each web worker owns a small ProcessPoolExecutor (PLAN_EXECUTOR_PROCESSES
+processes). The pool is created on first use inside the worker, never in the
+launcher parent. Its processes start from a forkserver that has already
+imported this module, and each one builds the data registry's indexes and
+compiles results.html before it takes its first task.
+
+    payload, timings = await executor.run(generate_task, profile, seed, data.digest,
+                                          inline=executor.inline_for(plan_duration))
+
+Cheap work runs inline on the event loop: the free 3-day plan
+(PLAN_INLINE_MAX_DAYS) costs less than the round trip to a pool process.
+Pooled tasks are bounded two ways:
+
+  PLAN_EXECUTOR_MAX_PENDING  tasks queued or running per web worker; above it
+                             run() raises ExecutorBusy instead of queueing
+  PLAN_EXECUTOR_TIMEOUT      seconds a request waits for its task; past it
+                             run() raises ExecutorTimeout
+
+A pool whose process died is replaced, and the task that saw it die runs
+inline. PLAN_EXECUTOR_PROCESSES=0 runs everything inline.
+
+Tasks are module-level functions so they pickle by reference. They take the
+web worker's data digest and reload the registry first if the pool process
+is on different data, so a plan is always built from the snapshot its token
+will name.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+import plan_results
+from data_registry import DataSnapshot, registry
+from logger_utils import log_event
+
+PLAN_EXECUTOR_PROCESSES = int(os.getenv("PLAN_EXECUTOR_PROCESSES", "1"))
+PLAN_EXECUTOR_MAX_PENDING = int(os.getenv("PLAN_EXECUTOR_MAX_PENDING", "16"))
+PLAN_EXECUTOR_TIMEOUT = float(os.getenv("PLAN_EXECUTOR_TIMEOUT", "10"))
+PLAN_INLINE_MAX_DAYS = int(os.getenv("PLAN_INLINE_MAX_DAYS", "3"))
+PLAN_EXECUTOR_START_METHOD = os.getenv("PLAN_EXECUTOR_START_METHOD", "forkserver")
+
+EXECUTOR_TASKS = metrics.REGISTRY.counter(
+    "welfore_plan_executor_tasks_total", "Plan executor tasks by mode (inline, pool) and result "
+    "(ok, error, timeout, rejected)", ("mode", "result"))
+EXECUTOR_SECONDS = metrics.REGISTRY.histogram(
+    "welfore_plan_executor_seconds", "Plan executor task wall time, including queueing", ("mode",))
+
+
+class ExecutorBusy(RuntimeError):
+    """PLAN_EXECUTOR_MAX_PENDING tasks are already queued or running."""
+
+
+class ExecutorTimeout(TimeoutError):
+    """A pooled task did not finish within PLAN_EXECUTOR_TIMEOUT."""
+
+
+# -----------------------------
+# POOL PROCESSES
+# -----------------------------
+def _init_process():
+    """Preload a pool process so its first task is as fast as its hundredth."""
+    # Ctrl-C and SIGTERM go to the whole process group; the web worker shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    registry.current().build_indexes()
+    plan_results.template_environment().get_template(plan_results.RESULTS_TEMPLATE)
+
+
+def _snapshot(digest: str) -> DataSnapshot:
+    """The registry snapshot, reloaded first if the web worker is on different data."""
+    data = registry.current()
+    if digest and data.digest != digest:
+        registry.reload()
+        data = registry.current()
+    return data
+
+
+def generate_task(user_profile: Dict[str, Any], seed: int, digest: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """(payload, timings) for a quiz profile; see plan_results.generate_payload."""
+    return plan_results.generate_payload(user_profile, _snapshot(digest), seed)
+
+
+def render_task(payload: Dict[str, Any], plan_id: Optional[str] = None,
+                notice: Optional[str] = None) -> Tuple[str, Dict[str, float]]:
+    """(results page HTML, timings) for a stored plan payload."""
+    html, seconds = plan_results.render_results(payload, plan_id, notice)
+    return html, {"render": seconds}
+
+
+def token_page_task(user_profile: Dict[str, Any], seed: int, digest: str, token: str,
+                    notice: Optional[str] = None) -> Tuple[str, Dict[str, float]]:
+    """(results page HTML, timings) for a plan rebuilt from a plan token."""
+    payload, timings = generate_task(user_profile, seed, digest)
+    payload["share_token"] = token
+    html, timings["render"] = plan_results.render_results(payload, notice=notice)
+    return html, timings
+
+
+# -----------------------------
+# EXECUTOR (web worker side)
+# -----------------------------
+class PlanExecutor:
+    """A lazily created, bounded process pool with an inline fast path."""
+
+    def __init__(self, processes: int = PLAN_EXECUTOR_PROCESSES, max_pending: int = PLAN_EXECUTOR_MAX_PENDING,
+                 timeout: float = PLAN_EXECUTOR_TIMEOUT, inline_max_days: int = PLAN_INLINE_MAX_DAYS,
+                 start_method: str = PLAN_EXECUTOR_START_METHOD):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.inline_max_days = inline_max_days
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._pending = 0
+        self._lock = threading.Lock()   # done callbacks run on the pool's management thread
+
+    @property
+    def pending(self) -> int:
+        """Pooled tasks queued or running."""
+        return self._pending
+
+    def inline_for(self, plan_duration: int) -> bool:
+        """True when a plan of this many days is cheap enough to build on the event loop."""
+        return self.processes <= 0 or int(plan_duration) <= self.inline_max_days
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            # A pool must not cross a fork; each web worker starts its own
+            context = multiprocessing.get_context(self.start_method)
+            if self.start_method == "forkserver":
+                context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=context, initializer=_init_process)
+            self._pid, self._pending = os.getpid(), 0
+            log_event("plan_executor_started", processes=self.processes, start_method=self.start_method)
+        return self._pool
+
+    def _task_done(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        if self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, inline: bool = False) -> Any:
+        """fn(*args) inline or in the pool; raises ExecutorBusy or ExecutorTimeout for pooled tasks."""
+        if inline or self.processes <= 0:
+            return self._run_inline(fn, *args)
+        if self._pending >= self.max_pending:
+            EXECUTOR_TASKS.inc("pool", "rejected")
+            raise ExecutorBusy(f"{self._pending} plan tasks already pending")
+
+        start = time.perf_counter()
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            return self._run_inline(fn, *args)
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._task_done)
+
+        try:
+            # On timeout wait_for cancels the wrapped future, which cancels the task
+            # if it is still queued; a running task finishes and is discarded
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            EXECUTOR_TASKS.inc("pool", "timeout")
+            log_event("plan_executor_timeout", level=logging.WARNING, task=fn.__name__, timeout=self.timeout)
+            raise ExecutorTimeout(f"{fn.__name__} took longer than {self.timeout}s") from None
+        except BrokenProcessPool:
+            EXECUTOR_TASKS.inc("pool", "error")
+            log_event("plan_executor_broken", level=logging.ERROR, task=fn.__name__)
+            self._discard_pool(pool)
+            return self._run_inline(fn, *args)
+        except Exception:
+            EXECUTOR_TASKS.inc("pool", "error")
+            raise
+        EXECUTOR_TASKS.inc("pool", "ok")
+        EXECUTOR_SECONDS.observe(time.perf_counter() - start, "pool")
+        return result
+
+    def _run_inline(self, fn: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            EXECUTOR_TASKS.inc("inline", "error")
+            raise
+        EXECUTOR_TASKS.inc("inline", "ok")
+        EXECUTOR_SECONDS.observe(time.perf_counter() - start, "inline")
+        return result
+
+    def shutdown(self):
+        """Stop this worker's pool without waiting for running tasks."""
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+
+executor = PlanExecutor()
+
+metrics.REGISTRY.gauge(
+    "welfore_plan_executor_pending", "Plan executor tasks queued or running (queue depth)",
+    callback=lambda: {(): executor.pending})
@@ -0,0 +1,171 @@
+"""
+WelFore Health Plan Model
+Compact, immutable meal plan objects.
+
+Meal slots hold the meal's id in its data snapshot (DataSnapshot.meal_ids) and
+share the snapshot's description string instead of formatting one per day, and
+every class uses __slots__, so a cached or stored plan costs a fraction of the
+equivalent nested dicts. `to_dict()`
+produces the dict the templates and API have always used, and `to_json()`
+encodes it once per plan.
+"""
+
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+SLOT_LABELS = {"breakfast": "Breakfast", "lunch": "Lunch", "dinner": "Dinner"}
+SLOT_ADAPTATIONS = {
+    "breakfast": " (protein-focused, smaller portion)",
+    "lunch": " (reduced portion, lean protein priority)",
+    "dinner": " (smaller portion, high-protein focus)",
+}
+SNACK_LABELS = {"mid_morning": "Mid-morning Snack", "mid_afternoon": "Mid-afternoon Snack"}
+
+
+# -----------------------------
+# PLAN OBJECTS
+# -----------------------------
+@dataclass(frozen=True, slots=True)
+class MealSlot:
+    kind: str            # breakfast | lunch | dinner
+    meal_id: int         # id in the snapshot the plan was built from
+    text: str
+    adapted: bool = False  # GLP-1 / bariatric portion note
+    line: str = field(init=False, compare=False, repr=False)  # display line, formatted once
+
+    def __post_init__(self):
+        text = self.text + (SLOT_ADAPTATIONS[self.kind] if self.adapted else "")
+        object.__setattr__(self, "line", f"{SLOT_LABELS[self.kind]}: {text}")
+
+
+@dataclass(frozen=True, slots=True)
+class Snack:
+    kind: str            # mid_morning | mid_afternoon
+    protein: str
+    partner: str
+    line: str = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "line", f"{SNACK_LABELS[self.kind]}: {self.protein} + {self.partner}")
+
+
+@dataclass(frozen=True, slots=True)
+class DayPlan:
+    day: int
+    meals: Tuple[MealSlot, ...]                 # breakfast, lunch, dinner
+    snacks: Tuple[Snack, ...]                   # mid-morning, mid-afternoon
+    boosts: Tuple[Tuple[str, str], ...] = ()    # (color, food) added for color diversity
+    colors: Tuple[str, ...] = ()
+
+    @property
+    def colors_achieved(self) -> int:
+        return len(self.colors)
+
+    def meal_lines(self, hydration_line: str, goals_line: str) -> List[str]:
+        """The day as the display lines the results template expects."""
+        breakfast, lunch, dinner = self.meals
+        morning, afternoon = self.snacks
+        lines = [breakfast.line, morning.line, lunch.line, afternoon.line, dinner.line]
+        for color, food in self.boosts:
+            lines.append(_boost_line(color, food))
+        lines.append(hydration_line)
+        lines.append(goals_line)
+        return lines
+
+
+@dataclass(frozen=True, slots=True)
+class MealPlan:
+    user_name: str
+    health_goal: str
+    plan_duration: int
+    primary_cuisine: str
+    days: Tuple[DayPlan, ...]
+    glp1: bool = False
+    bariatric: bool = False
+    breastfeeding: bool = False
+    restrictions: Tuple[str, ...] = ()            # dietary restrictions the plan honours
+    _json: Optional[str] = field(default=None, compare=False, repr=False)
+
+    @property
+    def fiber_goal(self) -> str:
+        return "20-25g fiber"
+
+    @property
+    def protein_goal(self) -> str:
+        return "80-100g protein" if (self.glp1 or self.bariatric) else "60-80g protein"
+
+    @property
+    def hydration(self) -> str:
+        if self.breastfeeding:
+            return "Drink 10-12 glasses water (extra for breastfeeding)"
+        return "Drink 8-10 glasses water"
+
+    @property
+    def average_colors_per_day(self) -> float:
+        if not self.days:
+            return 0
+        return round(sum(d.colors_achieved for d in self.days) / len(self.days), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The plan in the dict shape used by results.html and the JSON API (a fresh dict each call)."""
+        hydration = self.hydration
+        hydration_line = f"Hydration: {hydration}"
+        goals_line = f"Daily Goals: {self.fiber_goal}, {self.protein_goal}"
+        return {
+            "user_name": self.user_name,
+            "health_goal": self.health_goal,
+            "plan_duration": self.plan_duration,
+            "primary_cuisine": self.primary_cuisine,
+            "meal_plan": [
+                {
+                    "day": d.day,
+                    "meals": d.meal_lines(hydration_line, goals_line),
+                    "colors_achieved": d.colors_achieved,
+                    "colors": list(d.colors),
+                }
+                for d in self.days
+            ],
+            "average_colors_per_day": self.average_colors_per_day,
+            "nutrition_targets": {
+                "fiber_daily": self.fiber_goal,
+                "protein_daily": self.protein_goal,
+                "hydration": hydration,
+            },
+            "special_adaptations": {
+                "glp1": self.glp1,
+                "bariatric": self.bariatric,
+                "breastfeeding": self.breastfeeding,
+            },
+            "dietary_restrictions": list(self.restrictions),
+        }
+
+    def to_json(self) -> str:
+        """JSON encoding of to_dict(), computed once per plan."""
+        if self._json is None:
+            object.__setattr__(self, "_json", json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")))
+        return self._json
+
+
+# Plans are immutable, so identical slots, snacks and boosts are shared between
+# all plans instead of being allocated per day
+@lru_cache(maxsize=4096)
+def meal_slot(kind: str, meal_id: int, text: str, adapted: bool = False) -> MealSlot:
+    return MealSlot(kind, meal_id, text, adapted)
+
+
+@lru_cache(maxsize=4096)
+def snack(kind: str, protein: str, partner: str) -> Snack:
+    return Snack(kind, protein, partner)
+
+
+@lru_cache(maxsize=1024)
+def boost(color: str, food: str) -> Tuple[str, str]:
+    return (color, food)
+
+
+# Boost lines are shared between all plans that contain the same boost
+@lru_cache(maxsize=1024)
+def _boost_line(color: str, food: str) -> str:
+    return f"Snack Boost: add {food} for extra {color} nutrients"
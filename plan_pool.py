@@ -0,0 +1,219 @@
+"""
+WelFore Health Plan Pool
+Ready-made plans for the profile classes that get the most traffic.
+
+A profile class is everything build_meal_plan's meals depend on: the cuisine
+the engine resolves, the GLP-1 / bariatric / breastfeeding flags, the
+duration, the dietary restrictions and the liked foods. The name and health
+goal only label a plan and the family size only scales its shopping list, so
+a plan built for a class fits every profile in it once those are filled in.
+
+Each web worker counts /submit traffic per class with exponentially decayed
+counts (half-life PLAN_POOL_HALF_LIFE seconds). Every
+PLAN_POOL_REFILL_INTERVAL seconds a background task ranks the classes and
+tops up a pool for each of the PLAN_POOL_MAX_CLASSES hottest ones whose
+count is at least PLAN_POOL_MIN_SCORE. Pool size follows the class's
+recent rate, between PLAN_POOL_SIZE and PLAN_POOL_MAX_SIZE plans. Plans for
+classes that cool off are dropped.
+
+Every pooled plan has its own seed, so a class's pool holds varied plans.
+The seed also goes into the plan's token, so /p/{token} rebuilds exactly the
+plan that was handed out. Plans belong to the data snapshot they were built
+from; a data reload empties the pool.
+
+/submit calls pool.take(). A pooled plan is handed out once, so its display
+dict is built ahead too, and a hit only sets the name and health goal on it
+and adds what depends on the rest of the profile (guides, shopping list,
+token). On a miss the plan is built as before.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+import dietary
+import metrics
+import plan_results
+import plan_token
+from data_registry import DataSnapshot, registry
+from logger_utils import log_event
+from plan_model import MealPlan
+
+PLAN_POOL_SIZE = int(os.getenv("PLAN_POOL_SIZE", "8"))            # 0 disables the pool
+PLAN_POOL_MAX_SIZE = int(os.getenv("PLAN_POOL_MAX_SIZE", "64"))
+PLAN_POOL_MAX_CLASSES = int(os.getenv("PLAN_POOL_MAX_CLASSES", "16"))
+PLAN_POOL_MIN_SCORE = float(os.getenv("PLAN_POOL_MIN_SCORE", "3"))
+PLAN_POOL_HALF_LIFE = float(os.getenv("PLAN_POOL_HALF_LIFE", "900"))
+PLAN_POOL_REFILL_INTERVAL = float(os.getenv("PLAN_POOL_REFILL_INTERVAL", "1"))
+PLAN_POOL_REFILL_BATCH = int(os.getenv("PLAN_POOL_REFILL_BATCH", "64"))  # plans built per refill pass
+ENABLED = PLAN_POOL_SIZE > 0
+
+POOL_REQUESTS = metrics.REGISTRY.counter(
+    "welfore_plan_pool_requests_total", "Plan pool lookups by result (hit, miss, bypass)", ("result",))
+POOL_PLANS_BUILT = metrics.REGISTRY.counter(
+    "welfore_plan_pool_plans_built_total", "Plans built in the background for the plan pool")
+
+
+class PlanClass(NamedTuple):
+    """What a plan's meals depend on; profiles in one class can share plans."""
+    cuisine: str
+    plan_duration: int
+    glp1: bool
+    bariatric: bool
+    breastfeeding: bool
+    restrictions: int = 0          # dietary restriction bits
+    liked: int = 0                 # liked-food bits
+
+    def profile(self) -> Dict[str, Any]:
+        """A neutral profile in this class, for building pooled plans."""
+        return plan_token.PlanInputs(0, self.plan_duration, self.cuisine, "general_wellness", self.glp1,
+                                     self.bariatric, self.breastfeeding, restrictions=self.restrictions,
+                                     liked=self.liked).profile()
+
+
+class PooledPlan(NamedTuple):
+    seed: int
+    plan: MealPlan                 # built for the class's neutral profile
+    meal_plan: Dict[str, Any]      # plan.to_dict(), personalized in place when taken
+    flavor_balance_index: int
+
+
+def plan_class(user_profile: Dict[str, Any], data: DataSnapshot) -> Optional[PlanClass]:
+    """The profile's class, or None for profiles the pool can't serve."""
+    try:
+        inputs = plan_token.normalize(user_profile, data, 0)
+    except (ValueError, TypeError):
+        return None
+    return PlanClass(inputs.cuisine, inputs.plan_duration, inputs.glp1, inputs.bariatric, inputs.breastfeeding,
+                     inputs.restrictions, inputs.liked)
+
+
+class PlanPool:
+    """Per-worker pools of ready plans for the hottest profile classes."""
+
+    def __init__(self, size: int = PLAN_POOL_SIZE, max_size: int = PLAN_POOL_MAX_SIZE,
+                 max_classes: int = PLAN_POOL_MAX_CLASSES, min_score: float = PLAN_POOL_MIN_SCORE,
+                 half_life: float = PLAN_POOL_HALF_LIFE, interval: float = PLAN_POOL_REFILL_INTERVAL):
+        self.size = size
+        self.max_size = max(max_size, size)
+        self.max_classes = max_classes
+        self.min_score = min_score
+        self.half_life = half_life
+        self.interval = interval
+        self._scores: Dict[PlanClass, Tuple[float, float]] = {}   # class -> (decayed count, as of)
+        self._targets: Dict[PlanClass, int] = {}
+        self._plans: Dict[PlanClass, Deque[PooledPlan]] = {}
+        self._digest: Optional[str] = None
+
+    # -----------------------------
+    # TRAFFIC
+    # -----------------------------
+    def _decayed(self, score: float, since: float, now: float) -> float:
+        return score * 0.5 ** ((now - since) / self.half_life)
+
+    def observe(self, cls: PlanClass, now: Optional[float] = None):
+        now = now or time.monotonic()
+        score, since = self._scores.get(cls, (0.0, now))
+        self._scores[cls] = (self._decayed(score, since, now) + 1.0, now)
+
+    def hot_classes(self, now: Optional[float] = None) -> Dict[PlanClass, int]:
+        """{class: target pool size} for the classes worth pooling right now."""
+        now = now or time.monotonic()
+        scores = {cls: self._decayed(score, since, now) for cls, (score, since) in self._scores.items()}
+        # Forget classes whose count has decayed to nothing
+        for cls in [cls for cls, score in scores.items() if score < 0.01]:
+            del self._scores[cls], scores[cls]
+        ranked = sorted((cls for cls, score in scores.items() if score >= self.min_score),
+                        key=scores.__getitem__, reverse=True)[:self.max_classes]
+        # A decayed count is about rate * half_life / ln 2; keep two refill intervals of demand ready
+        targets = {}
+        for cls in ranked:
+            rate = scores[cls] * math.log(2) / self.half_life
+            targets[cls] = min(self.max_size, max(self.size, math.ceil(2 * rate * self.interval)))
+        return targets
+
+    # -----------------------------
+    # TAKE / REFILL
+    # -----------------------------
+    def take(self, user_profile: Dict[str, Any],
+             data: DataSnapshot) -> Optional[Tuple[Dict[str, Any], Dict[str, float]]]:
+        """(payload, timings) from a pooled plan personalized for this profile, or None on a miss."""
+        cls = plan_class(user_profile, data)
+        if cls is None:
+            POOL_REQUESTS.inc("bypass")
+            return None
+        self.observe(cls)
+        ready = self._plans.get(cls)
+        if not ready or self._digest != data.digest:
+            POOL_REQUESTS.inc("miss")
+            return None
+        POOL_REQUESTS.inc("hit")
+
+        start = time.perf_counter()
+        pooled = ready.popleft()
+        meal_plan = pooled.meal_plan
+        meal_plan["user_name"] = user_profile.get("name", "Friend")
+        meal_plan["health_goal"] = user_profile.get("health_goal", "general_wellness")
+        timings = {}
+        # The shopping list is keyed by meals, not by name, so the neutral plan serves for it
+        payload = plan_results.plan_payload(pooled.plan, pooled.flavor_balance_index, user_profile, data,
+                                            pooled.seed, timings, meal_plan)
+        timings["pooled"] = time.perf_counter() - start
+        return payload, timings
+
+    def ready(self) -> int:
+        return sum(len(plans) for plans in self._plans.values())
+
+    def classes(self) -> int:
+        return len(self._targets)
+
+    async def refill(self, data: Optional[DataSnapshot] = None, budget: int = PLAN_POOL_REFILL_BATCH) -> int:
+        """Top up the hot classes' pools, building at most `budget` plans. Returns the number built."""
+        data = data or registry.current()
+        if self._digest != data.digest:
+            self._plans.clear()
+            self._digest = data.digest
+        self._targets = targets = self.hot_classes()
+        for cls in [cls for cls in self._plans if cls not in targets]:
+            del self._plans[cls]
+
+        built = 0
+        # Emptiest pools first, so one busy class can't starve the others
+        for cls in sorted(targets, key=lambda c: len(self._plans.get(c, ())) / targets[c]):
+            ready = self._plans.setdefault(cls, deque())
+            profile = cls.profile()
+            while len(ready) < targets[cls] and built < budget:
+                seed = plan_token.new_seed()
+                try:
+                    plan, flavor_balance_index = plan_results.build_plan(profile, data, seed)
+                except dietary.NoCompatibleMeals:
+                    # Nothing fits these restrictions; every request in the class gets the error page
+                    del self._scores[cls], self._plans[cls]
+                    break
+                ready.append(PooledPlan(seed, plan, plan.to_dict(), flavor_balance_index))
+                built += 1
+                await asyncio.sleep(0)   # one plan at a time between requests
+        POOL_PLANS_BUILT.inc(amount=built)
+        return built
+
+
+pool = PlanPool()
+
+metrics.REGISTRY.gauge(
+    "welfore_plan_pool_ready", "Pooled plans ready to hand out", callback=lambda: {(): pool.ready()})
+metrics.REGISTRY.gauge(
+    "welfore_plan_pool_classes", "Profile classes currently pooled", callback=lambda: {(): pool.classes()})
+
+
+async def refill_loop(interval: float = PLAN_POOL_REFILL_INTERVAL):
+    """Keep the pool topped up for the current hot classes."""
+    while True:
+        try:
+            await pool.refill()
+        except Exception as e:
+            log_event("plan_pool_refill_failed", level=logging.ERROR, error=str(e))
+        await asyncio.sleep(interval)
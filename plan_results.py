@@ -0,0 +1,151 @@
+"""
+WelFore Health Plan Results
+The engine run and results-page render behind /submit, /plan/{id} and /p/{token}.
+
+Nothing here needs FastAPI or the request, so plan executor processes
+(plan_executor.py) run it as well as the web workers. Functions return their
+timings instead of recording them, and the web worker records them, so the
+histograms stay in the process that serves /metrics.
+"""
+
+import os
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import jinja2
+from markupsafe import Markup
+
+import plan_store
+import plan_token
+from data_registry import DataSnapshot
+from master_engine import build_meal_plan, calculate_flavor_balance_index, get_enhanced_recommended_pdfs
+from plan_model import MealPlan
+
+# Shopping lists for multi-day plans (needs numpy)
+try:
+    import shopping_list
+    HAS_SHOPPING_LIST = True
+except ImportError:
+    HAS_SHOPPING_LIST = False
+
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
+STRIPE_7DAY_LINK = os.getenv('STRIPE_7DAY_LINK', "https://buy.stripe.com/5kQ7sMddybXy8dsfUR7Vm0a")
+STRIPE_14DAY_LINK = os.getenv('STRIPE_14DAY_LINK', "https://buy.stripe.com/14A28s7Te3r251gcIF7Vm0b")
+
+RESULTS_TEMPLATE = "results.html"
+STALE_NOTICE = "Our menus have been refreshed since this link was made, so a few meals may differ."
+
+
+# -----------------------------
+# ENGINE
+# -----------------------------
+def build_plan(user_profile: Dict[str, Any], data: DataSnapshot, seed: int) -> Tuple[MealPlan, int]:
+    """(plan, flavor balance index) for a profile, drawn from random.Random(seed).
+
+    Every random choice comes from that generator, so the same profile, data
+    and seed always give the same plan (see plan_token.py).
+    """
+    rng = random.Random(seed)
+    plan = build_meal_plan(user_profile, data, rng)
+    flavor_balance_index = calculate_flavor_balance_index(
+        {"plan_duration": plan.plan_duration, "average_colors_per_day": plan.average_colors_per_day}, rng)
+    return plan, flavor_balance_index
+
+
+def plan_payload(plan: MealPlan, flavor_balance_index: int, user_profile: Dict[str, Any], data: DataSnapshot,
+                 seed: int, timings: Optional[Dict[str, float]] = None,
+                 meal_plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Everything results.html shows for a built plan: guides, premium fields, shopping list and token.
+
+    `meal_plan` is the plan's to_dict() if the caller already has it; it is
+    updated in place.
+    """
+    plan_duration = plan.plan_duration
+    # Freemium control logic
+    is_premium = plan_duration > 3
+    if meal_plan is None:
+        meal_plan = plan.to_dict()
+
+    # Add freemium messaging
+    if is_premium:
+        meal_plan["is_premium"] = True
+        meal_plan["premium_message"] = "✨ Unlock your full 7-day plan with WelFore Premium!"
+        meal_plan["stripe_link"] = STRIPE_7DAY_LINK if plan_duration == 7 else STRIPE_14DAY_LINK
+    else:
+        meal_plan["is_premium"] = False
+
+    # Aggregated shopping list for multi-day plans, scaled to the household
+    shopping = None
+    if is_premium and HAS_SHOPPING_LIST:
+        start = time.perf_counter()
+        shopping = shopping_list.build_shopping_list(plan, user_profile.get("family_size"), data).to_dict()
+        if timings is not None:
+            timings["shopping_list"] = time.perf_counter() - start
+
+    return {
+        "meal_plan": meal_plan,
+        "pdf_recommendations": get_enhanced_recommended_pdfs(user_profile),
+        "flavor_balance_index": flavor_balance_index,
+        "shopping_list": shopping,
+        "share_token": plan_token.token_for(user_profile, data, seed),
+        "generated_at": datetime.now().strftime("%B %d, %Y at %I:%M %p"),
+    }
+
+
+def generate_payload(user_profile: Dict[str, Any], data: DataSnapshot,
+                     seed: int) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run the engine for a profile and collect everything results.html shows.
+
+    Returns (payload, timings in seconds for "meal_plan", "shopping_list", "total").
+    """
+    timings = {}
+    start = time.perf_counter()
+    plan, flavor_balance_index = build_plan(user_profile, data, seed)
+    timings["meal_plan"] = time.perf_counter() - start
+    payload = plan_payload(plan, flavor_balance_index, user_profile, data, seed, timings)
+    timings["total"] = time.perf_counter() - start
+    return payload, timings
+
+
+# -----------------------------
+# RENDERING
+# -----------------------------
+_environment: Optional[jinja2.Environment] = None
+
+
+def template_environment() -> jinja2.Environment:
+    """Jinja environment for the results page, configured like Starlette's Jinja2Templates."""
+    global _environment
+    if _environment is None:
+        _environment = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    return _environment
+
+
+def results_context(payload: Dict[str, Any], plan_id: Optional[str] = None,
+                    notice: Optional[str] = None) -> Dict[str, Any]:
+    """results.html context for a plan payload, as stored by the plan store."""
+    token = payload.get("share_token")
+    shopping_list_html = None
+    if payload.get("shopping_list") and HAS_SHOPPING_LIST:
+        shopping = shopping_list.ShoppingList.from_dict(payload["shopping_list"])
+        shopping_list_html = Markup("".join(shopping_list.iter_html(shopping)))
+    return {
+        "meal_plan": payload["meal_plan"],
+        "shopping_list_html": shopping_list_html,
+        "pdf_recommendations": payload["pdf_recommendations"],
+        "flavor_balance_index": payload["flavor_balance_index"],
+        "generated_at": payload["generated_at"],
+        "plan_id": plan_id,
+        "share_url": f"{plan_store.PUBLIC_BASE_URL}/p/{token}" if token else None,
+        "notice": notice,
+    }
+
+
+def render_results(payload: Dict[str, Any], plan_id: Optional[str] = None,
+                   notice: Optional[str] = None) -> Tuple[str, float]:
+    """(results page HTML, render seconds) for a plan payload."""
+    start = time.perf_counter()
+    html = template_environment().get_template(RESULTS_TEMPLATE).render(results_context(payload, plan_id, notice))
+    return html, time.perf_counter() - start
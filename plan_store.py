@@ -0,0 +1,222 @@
+"""
+WelFore Health Plan Store
+Generated plans persisted under short IDs.
+
+/submit stores everything the results page needs and redirects to
+/plan/{id}, so reloading the page, or following the link from an email,
+renders the stored plan instead of running the engine again.
+
+Plans live in one SQLite database (PLAN_STORE_PATH) in WAL mode, so every
+worker can read while another writes. Each row holds the plan's
+zlib-compressed JSON, about 1-3 KB for a 14-day plan with its shopping list.
+IDs are 8 random URL-safe characters (48 bits), which are not guessable.
+
+Retention: plans older than PLAN_RETENTION_DAYS are not served and are
+deleted by a background pass every PLAN_STORE_MAINTENANCE_INTERVAL seconds.
+The same pass deletes the oldest plans above PLAN_STORE_MAX_PLANS. One
+worker at a time (the holder of a lock file) runs the pass and reports the
+store-wide size gauges.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+import metrics
+from logger_utils import log_event
+
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", "plans.db")
+PLAN_RETENTION_DAYS = float(os.getenv("PLAN_RETENTION_DAYS", "90"))
+PLAN_STORE_MAX_PLANS = int(os.getenv("PLAN_STORE_MAX_PLANS", "200000"))
+PLAN_STORE_MAINTENANCE_INTERVAL = float(os.getenv("PLAN_STORE_MAINTENANCE_INTERVAL", "3600"))
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+ID_BYTES = 6                                  # -> 8 URL-safe characters
+PLAN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8}$")
+COMPRESSION_LEVEL = 6
+
+PLANS_STORED = metrics.REGISTRY.counter("welfore_plans_stored_total", "Plans written to the plan store")
+PLAN_LOOKUPS = metrics.REGISTRY.counter(
+    "welfore_plan_lookups_total", "Plan store reads by result (hit, miss, expired)", ("result",))
+PLANS_PRUNED = metrics.REGISTRY.counter(
+    "welfore_plans_pruned_total", "Plans deleted by retention", ("reason",))
+PLAN_STORED_BYTES = metrics.REGISTRY.histogram(
+    "welfore_plan_stored_bytes", "Compressed size of each stored plan",
+    buckets=(512, 1024, 2048, 4096, 8192, 16384, 65536))
+PLAN_STORE_SIZE = metrics.REGISTRY.gauge(
+    "welfore_plan_store_size", "Plan store totals (plans, payload bytes, file bytes)", ("measure",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    data_digest TEXT NOT NULL DEFAULT '',
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plans_created_at ON plans (created_at);
+"""
+
+
+def new_plan_id() -> str:
+    return secrets.token_urlsafe(ID_BYTES)
+
+
+def plan_url(plan_id: str) -> Optional[str]:
+    """Absolute link to a stored plan for emails (None without PUBLIC_BASE_URL)."""
+    return f"{PUBLIC_BASE_URL}/plan/{plan_id}" if PUBLIC_BASE_URL else None
+
+
+class PlanStore:
+    """SQLite-backed plan storage with one connection per thread and process."""
+
+    def __init__(self, path: str = PLAN_STORE_PATH, retention_days: float = PLAN_RETENTION_DAYS,
+                 max_plans: int = PLAN_STORE_MAX_PLANS):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_plans = max_plans
+        self._local = threading.local()
+        self._lock_fd: Optional[int] = None
+        self._lock_pid: Optional[int] = None
+
+    # -----------------------------
+    # CONNECTIONS
+    # -----------------------------
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # A connection must not cross a fork, so workers open their own
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _cutoff(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.retention_days * 86400
+
+    # -----------------------------
+    # READ / WRITE
+    # -----------------------------
+    def save(self, payload: Dict[str, Any], data_digest: str = "") -> str:
+        """Store a plan payload and return its new ID."""
+        body = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(),
+                             COMPRESSION_LEVEL)
+        conn = self._connection()
+        for _ in range(5):
+            plan_id = new_plan_id()
+            try:
+                conn.execute("INSERT INTO plans (id, created_at, data_digest, body) VALUES (?, ?, ?, ?)",
+                             (plan_id, time.time(), data_digest, body))
+                break
+            except sqlite3.IntegrityError:
+                continue    # ID collision; draw another
+        else:
+            raise RuntimeError("Could not allocate a unique plan ID")
+        PLANS_STORED.inc()
+        PLAN_STORED_BYTES.observe(len(body))
+        return plan_id
+
+    def load(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """The stored payload, or None for an unknown, malformed or expired ID."""
+        if not PLAN_ID_PATTERN.match(plan_id or ""):
+            PLAN_LOOKUPS.inc("miss")
+            return None
+        row = self._connection().execute(
+            "SELECT created_at, body FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        if row is None:
+            PLAN_LOOKUPS.inc("miss")
+            return None
+        if row[0] < self._cutoff():
+            PLAN_LOOKUPS.inc("expired")
+            return None
+        PLAN_LOOKUPS.inc("hit")
+        return json.loads(zlib.decompress(row[1]))
+
+    def exists(self, plan_id: str) -> bool:
+        if not PLAN_ID_PATTERN.match(plan_id or ""):
+            return False
+        row = self._connection().execute(
+            "SELECT 1 FROM plans WHERE id = ? AND created_at >= ?", (plan_id, self._cutoff())).fetchone()
+        return row is not None
+
+    # -----------------------------
+    # RETENTION & SIZE
+    # -----------------------------
+    def prune(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Delete expired plans, then the oldest ones above max_plans."""
+        conn = self._connection()
+        expired = conn.execute("DELETE FROM plans WHERE created_at < ?", (self._cutoff(now),)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0] - self.max_plans
+        overflow = 0
+        if excess > 0:
+            overflow = conn.execute(
+                "DELETE FROM plans WHERE id IN (SELECT id FROM plans ORDER BY created_at LIMIT ?)",
+                (excess,)).rowcount
+        if expired or overflow:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        PLANS_PRUNED.inc("expired", amount=expired)
+        PLANS_PRUNED.inc("max_plans", amount=overflow)
+        return {"expired": expired, "max_plans": overflow}
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connection()
+        plans, payload = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM plans").fetchone()
+        file_bytes = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                file_bytes += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {"plans": plans, "payload_bytes": payload, "file_bytes": file_bytes}
+
+    def _is_maintainer(self) -> bool:
+        """Hold the maintenance lock file for the life of this process, if it is free."""
+        if self._lock_fd is not None and self._lock_pid == os.getpid():
+            return True
+        # maintain() may run before any request has opened (and created) the database
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path + ".maintenance.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd, self._lock_pid = fd, os.getpid()
+        return True
+
+    def maintain(self) -> Optional[Dict[str, int]]:
+        """Prune and refresh the size gauges, in one worker only."""
+        if not self._is_maintainer():
+            return None
+        pruned = self.prune()
+        stats = self.stats()
+        for measure, value in stats.items():
+            PLAN_STORE_SIZE.set(value, measure)
+        log_event("plan_store_maintenance", **stats, pruned_expired=pruned["expired"],
+                  pruned_max_plans=pruned["max_plans"])
+        return stats
+
+
+store = PlanStore()
+
+
+async def maintenance_loop(interval: float = PLAN_STORE_MAINTENANCE_INTERVAL):
+    """Run store.maintain() off the event loop now and every `interval` seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(store.maintain)
+        except Exception as e:
+            log_event("plan_store_maintenance_failed", level=logging.ERROR, error=str(e))
+        await asyncio.sleep(interval)
@@ -0,0 +1,228 @@
+"""
+WelFore Health Plan Tokens
+Stateless, signed plan links: the engine's inputs packed into a short token.
+
+A token carries everything build_meal_plan reads, normalized, plus the seed
+the plan was generated with and the data snapshot it was generated from:
+
+    format   u8   token format version (4)
+    digest   4s   first 4 bytes of the data snapshot digest (same on every worker)
+    seed     u32  seed for the plan's random.Random
+    days     u8   plan duration
+    cuisine  u16  CRC of the engine cuisine the plan used
+    goal     u8   index into HEALTH_GOALS
+    flags    u8   GLP-1 / bariatric / breastfeeding bits
+    family   u8   household size for the shopping list
+    diet     u16  dietary restriction bits (dietary.RESTRICTIONS)
+    liked    u32  liked-food bits (preferences.RAINBOW_FOODS)
+
+These 21 bytes are base64url-encoded and signed with HMAC-SHA256
+(itsdangerous) truncated to 10 bytes, 43 characters in all, so a /p/{token}
+link fits comfortably in an SMS. The user's name and email are never part of
+a token. Older formats still decode: format 1 (without `diet` and `liked`) as
+a plan without restrictions or preferences, format 2 (without `liked`) as one
+without preferences. Formats 1-3 predate the variety scheduler (variety.py),
+which draws different meals from the same seed, so they always decode as
+stale.
+
+GET /p/{token} rebuilds the identical plan on any worker, with no storage
+read. If the content data has changed since the token was issued, the plan is
+rebuilt from the current data instead and flagged as stale.
+
+PLAN_TOKEN_SECRET holds the signing key. Give several comma-separated keys to
+rotate: the last one signs, and all of them verify. Tokens are disabled
+while it is empty.
+"""
+
+import hashlib
+import importlib.util
+import os
+import random
+import secrets
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import dietary
+import metrics
+import preferences
+from data_registry import DataSnapshot
+
+HAS_ITSDANGEROUS = importlib.util.find_spec("itsdangerous") is not None
+if HAS_ITSDANGEROUS:
+    from itsdangerous import BadSignature, Signer
+    from itsdangerous.encoding import base64_decode, base64_encode
+    from itsdangerous.signer import HMACAlgorithm
+
+PLAN_TOKEN_SECRETS = [s.strip() for s in os.getenv("PLAN_TOKEN_SECRET", "").split(",") if s.strip()]
+ENABLED = HAS_ITSDANGEROUS and bool(PLAN_TOKEN_SECRETS)
+
+TOKEN_FORMAT = 4
+_LAYOUTS = {1: struct.Struct(">B4sIBHBBB"), 2: struct.Struct(">B4sIBHBBBH"), 3: struct.Struct(">B4sIBHBBBHI")}
+_LAYOUTS[4] = _LAYOUTS[3]
+SCHEDULER_FORMAT = 4   # first format whose seeds draw through the variety scheduler
+SIGNATURE_BYTES = 10
+SALT = "welfore.plan-token"
+
+# Append-only: a goal's index is part of every token issued for it
+HEALTH_GOALS = ("general_wellness", "weight_loss", "blood_pressure", "blood_sugar", "energy",
+                "digestive", "heart_health", "diabetes_prevention")
+PLAN_DURATIONS = (3, 7, 14)
+MAX_FAMILY_SIZE = 20
+_GLP1, _BARIATRIC, _BREASTFEEDING = 1, 2, 4
+
+TOKEN_REQUESTS = metrics.REGISTRY.counter(
+    "welfore_plan_token_requests_total", "/p/{token} requests by result (ok, stale, invalid)", ("result",))
+
+
+class InvalidToken(ValueError):
+    """Token is malformed, has a bad signature, or holds values the engine cannot use."""
+
+
+@dataclass(frozen=True, slots=True)
+class PlanInputs:
+    """The normalized engine inputs a token carries."""
+    seed: int
+    plan_duration: int
+    cuisine: str
+    health_goal: str
+    glp1: bool = False
+    bariatric: bool = False
+    breastfeeding: bool = False
+    family_size: int = 1
+    restrictions: int = 0          # dietary restriction bits
+    liked: int = 0                 # liked-food bits
+
+    def profile(self) -> Dict[str, Any]:
+        """user_profile for build_meal_plan; the name is deliberately generic."""
+        conditions = [name for name, on in (("glp1", self.glp1), ("bariatric", self.bariatric),
+                                             ("breastfeeding", self.breastfeeding)) if on]
+        return {
+            "name": "Friend",
+            "cuisines": [self.cuisine],
+            "health_goal": self.health_goal,
+            "special_conditions": conditions,
+            "plan_duration": self.plan_duration,
+            "family_size": self.family_size,
+            "dietary_restrictions": list(dietary.restriction_names(self.restrictions)),
+            "rainbow_preferences": preferences.rainbow_preferences(self.liked),
+        }
+
+    def rng(self) -> random.Random:
+        return random.Random(self.seed)
+
+
+def new_seed() -> int:
+    return secrets.randbits(32)
+
+
+def _cuisine_code(cuisine: str) -> int:
+    return zlib.crc32(cuisine.encode()) & 0xFFFF
+
+
+def normalize(user_profile: Dict[str, Any], data: DataSnapshot, seed: int) -> PlanInputs:
+    """PlanInputs for a quiz profile, resolved the way build_meal_plan resolves it.
+
+    The cuisine is the one the engine will actually use (the first selected
+    cuisine if the data has it, else the default), so two profiles that give
+    the same plan give the same token.
+    """
+    tables = data.index("master_engine")
+    selected = user_profile.get("cuisines") or [tables.default_cuisine]
+    cuisine = selected[0] if selected[0] in tables.day_colors else tables.default_cuisine
+    goal = user_profile.get("health_goal", "general_wellness")
+    conditions = str([s.lower() for s in user_profile.get("special_conditions", [])])
+    duration = int(user_profile.get("plan_duration", 3))
+    if duration not in PLAN_DURATIONS:
+        raise ValueError(f"plan_duration must be one of {PLAN_DURATIONS}")
+    return PlanInputs(
+        seed=seed & 0xFFFFFFFF,
+        plan_duration=duration,
+        cuisine=cuisine,
+        health_goal=goal if goal in HEALTH_GOALS else "general_wellness",
+        glp1="glp" in conditions,
+        bariatric="bariatric" in conditions,
+        breastfeeding="breast" in conditions,
+        family_size=min(max(int(user_profile.get("family_size") or 1), 1), MAX_FAMILY_SIZE),
+        restrictions=data.index("dietary").parse(user_profile.get("dietary_restrictions")),
+        liked=preferences.liked_foods(user_profile),
+    )
+
+
+# -----------------------------
+# SIGNING
+# -----------------------------
+if HAS_ITSDANGEROUS:
+    class _TruncatedHMAC(HMACAlgorithm):
+        """HMAC-SHA256 cut to SIGNATURE_BYTES; 80 bits is far out of reach of online guessing."""
+
+        def get_signature(self, key: bytes, value: bytes) -> bytes:
+            return super().get_signature(key, value)[:SIGNATURE_BYTES]
+
+
+_signer = None
+
+
+def _get_signer():
+    global _signer
+    if _signer is None:
+        if not ENABLED:
+            raise RuntimeError("Plan tokens need itsdangerous and PLAN_TOKEN_SECRET")
+        _signer = Signer(PLAN_TOKEN_SECRETS, salt=SALT, key_derivation="hmac",
+                         digest_method=hashlib.sha256, algorithm=_TruncatedHMAC(hashlib.sha256))
+    return _signer
+
+
+def encode(inputs: PlanInputs, data: DataSnapshot) -> str:
+    """Signed token for `inputs`, tied to the data snapshot the plan was built from."""
+    packed = _LAYOUTS[TOKEN_FORMAT].pack(
+        TOKEN_FORMAT, bytes.fromhex(data.digest[:8]), inputs.seed, inputs.plan_duration,
+        _cuisine_code(inputs.cuisine), HEALTH_GOALS.index(inputs.health_goal),
+        (_GLP1 if inputs.glp1 else 0) | (_BARIATRIC if inputs.bariatric else 0)
+        | (_BREASTFEEDING if inputs.breastfeeding else 0),
+        inputs.family_size, inputs.restrictions, inputs.liked)
+    return _get_signer().sign(base64_encode(packed)).decode("ascii")
+
+
+def decode(token: str, data: DataSnapshot) -> Tuple[PlanInputs, bool]:
+    """(inputs, stale) for a token; stale means it was issued for different data or an older engine."""
+    try:
+        packed = base64_decode(_get_signer().unsign(token.encode("ascii")))
+        layout = _LAYOUTS.get(packed[0]) if packed else None
+        if layout is None:
+            raise InvalidToken("Unsupported plan token")
+        fmt, digest, seed, duration, cuisine_code, goal, flags, family, *rest = layout.unpack(packed)
+    except (BadSignature, UnicodeEncodeError, struct.error) as e:
+        raise InvalidToken("Invalid plan token") from e
+    restrictions, liked = (rest + [0, 0])[:2]
+    if duration not in PLAN_DURATIONS or goal >= len(HEALTH_GOALS) or not 1 <= family <= MAX_FAMILY_SIZE \
+            or restrictions >> len(dietary.RESTRICTIONS) or liked >> len(preferences.RAINBOW_FOODS):
+        raise InvalidToken("Unsupported plan token")
+
+    tables = data.index("master_engine")
+    cuisine = next((c for c in tables.day_colors if _cuisine_code(c) == cuisine_code), None)
+    stale = digest.hex() != data.digest[:8] or cuisine is None or fmt < SCHEDULER_FORMAT
+    inputs = PlanInputs(
+        seed=seed,
+        plan_duration=duration,
+        cuisine=cuisine or tables.default_cuisine,
+        health_goal=HEALTH_GOALS[goal],
+        glp1=bool(flags & _GLP1),
+        bariatric=bool(flags & _BARIATRIC),
+        breastfeeding=bool(flags & _BREASTFEEDING),
+        family_size=family,
+        restrictions=restrictions,
+        liked=liked,
+    )
+    return inputs, stale
+
+
+def token_for(user_profile: Dict[str, Any], data: DataSnapshot, seed: int) -> Optional[str]:
+    """Token for a quiz profile, or None when tokens are disabled or the profile can't be encoded."""
+    if not ENABLED:
+        return None
+    try:
+        return encode(normalize(user_profile, data, seed), data)
+    except (ValueError, struct.error):
+        return None
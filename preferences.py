@@ -0,0 +1,175 @@
+"""
+WelFore Health Rainbow Preferences
+Weighted meal, snack and boost choices from the foods a user says they like.
+
+The quiz asks which foods of each color the user likes (RAINBOW_FOODS, the
+checkbox values in templates/plan.html, plus a free-text "other" answer per
+color). A profile's answers become a bitmask over RAINBOW_FOODS.
+
+When a data snapshot loads, every meal, snack partner and color food gets a
+row in a membership matrix: column j is 1 when the item's name or one of its
+ingredients (per ingredients.json) is liked food j ("sweet_potatoes" matches
+the sweet potato in a hash, "strawberries" matches a snack of berries). The
+rows a cuisine's plan chooses from are gathered into one table per cuisine and
+restriction set, the first time it is used, with an offset per choice group
+(breakfast, lunch, dinner, snack partner, each boost color).
+
+For a profile, the table times the liked-food vector gives every candidate's
+weight in one matrix product: 1 plus LIKE_WEIGHT for each liked food it
+contains. build_meal_plan uses the weights to order each slot's rotation
+(variety.py): a weighted shuffle puts liked options at the front of every
+cycle, and a plan shorter than a rotation gets the liked ones first. Profiles
+without preferences get a uniform shuffle.
+"""
+
+import importlib.util
+import re
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+from data_registry import MEAL_SLOTS, DataSnapshot, registry
+from plan_model import MealSlot
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+if HAS_NUMPY:
+    import numpy as np
+
+# Append-only: a food's position is its bit in plan tokens
+RAINBOW_FOODS = (
+    ("red", "tomatoes"), ("red", "strawberries"), ("red", "red_peppers"), ("red", "beets"), ("red", "watermelon"),
+    ("orange", "carrots"), ("orange", "sweet_potatoes"), ("orange", "oranges"), ("orange", "butternut_squash"),
+    ("orange", "papaya"),
+    ("yellow", "bananas"), ("yellow", "corn"), ("yellow", "yellow_squash"), ("yellow", "pineapple"),
+    ("yellow", "lemons"),
+    ("green", "spinach"), ("green", "broccoli"), ("green", "avocados"), ("green", "kale"), ("green", "green_beans"),
+    ("purple", "blueberries"), ("purple", "eggplant"), ("purple", "purple_cabbage"), ("purple", "blackberries"),
+    ("purple", "plums"),
+    ("white", "cauliflower"), ("white", "onions"), ("white", "garlic"), ("white", "mushrooms"), ("white", "turnips"),
+)
+# Names a food goes by in the content data besides its own singular and plural
+_ALIASES = {
+    "red_peppers": ("bell pepper", "bell peppers"),
+    "strawberries": ("berries",),
+    "blueberries": ("berries",),
+    "blackberries": ("berries",),
+}
+LIKE_WEIGHT = 2.0   # added to an item's weight (base 1) per liked food it contains
+
+
+def _terms(value: str) -> Tuple[str, ...]:
+    name = value.replace("_", " ")
+    if name.endswith("ies"):
+        singular = name[:-3] + "y"
+    elif name.endswith("oes"):
+        singular = name[:-2]
+    elif name.endswith("s"):
+        singular = name[:-1]
+    else:
+        singular = name
+    return tuple(dict.fromkeys((name, singular) + _ALIASES.get(value, ())))
+
+
+_BITS = {value: 1 << i for i, (_color, value) in enumerate(RAINBOW_FOODS)}
+_TERM_BITS: Dict[str, int] = {}
+for _i, (_color, _value) in enumerate(RAINBOW_FOODS):
+    for _term in _terms(_value):
+        _TERM_BITS[_term] = _TERM_BITS.get(_term, 0) | 1 << _i
+# One scan finds every liked food in a text
+_TERMS = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(_TERM_BITS, key=len, reverse=True)) + r")\b",
+                    re.I)
+
+
+def _text_bits(text: str) -> int:
+    bits = 0
+    for match in _TERMS.finditer(text):
+        bits |= _TERM_BITS[match.group(1).lower()]
+    return bits
+
+
+def parse(rainbow_preferences: Any) -> int:
+    """Liked-food bitmask for the quiz's {color: {"foods": [...], "other": "..."}} answers."""
+    bits = 0
+    if not isinstance(rainbow_preferences, dict):
+        return bits
+    for answer in rainbow_preferences.values():
+        if not isinstance(answer, dict):
+            continue
+        for value in answer.get("foods") or ():
+            if isinstance(value, str):
+                bits |= _BITS.get(value.strip().lower().replace(" ", "_"), 0)
+        other = answer.get("other")
+        if isinstance(other, str):
+            bits |= _text_bits(other)
+    return bits
+
+
+def liked_foods(user_profile: Dict[str, Any]) -> int:
+    """The liked-food bits build_meal_plan weighs for a profile (none without numpy)."""
+    return parse(user_profile.get("rainbow_preferences")) if HAS_NUMPY else 0
+
+
+def rainbow_preferences(bits: int) -> Dict[str, Dict[str, Any]]:
+    """Quiz-shaped answers for a liked-food bitmask; parse() of the result gives `bits` back."""
+    answers: Dict[str, Dict[str, Any]] = {}
+    for i, (color, value) in enumerate(RAINBOW_FOODS):
+        if bits >> i & 1:
+            answers.setdefault(color, {"foods": [], "other": None})["foods"].append(value)
+    return answers
+
+
+class PreferenceTable:
+    """Membership rows for one cuisine's candidates, stacked by choice group."""
+
+    __slots__ = ("matrix", "bounds")
+
+    def __init__(self, matrix, bounds: List[Tuple[int, int]]):
+        self.matrix = matrix          # (candidates, len(RAINBOW_FOODS)), groups back to back
+        self.bounds = bounds          # (start, end) rows of each group
+
+    def weights(self, liked: int) -> List[List[float]]:
+        """Every candidate's weight from one matrix product, split into the groups."""
+        weights = (1.0 + LIKE_WEIGHT * (self.matrix @ ((liked >> _SHIFTS) & 1))).tolist()
+        return [weights[start:end] for start, end in self.bounds]
+
+
+class PreferenceIndex:
+    """Per-snapshot liked-food membership of every meal, snack partner and color food."""
+
+    def __init__(self, data: DataSnapshot):
+        def row(section: str, name: str) -> List[int]:
+            text = "; ".join([name] + [ingredient for ingredient, _quantity, _unit
+                                       in data.ingredients[section].get(name) or ()])
+            bits = _text_bits(text)
+            return [bits >> i & 1 for i in range(len(RAINBOW_FOODS))]
+
+        meals = {data.meal_ids[meal]: meal
+                 for palette in data.cuisine_meals.values() for slot in MEAL_SLOTS for meal in palette[slot]}
+        foods = list(dict.fromkeys(food for foods in data.color_foods.values() for food in foods))
+        rows = ([row("meals", meal) for meal in meals.values()]
+                + [row("snacks", partner) for partner in data.snack_partners]
+                + [row("color_foods", food) for food in foods])
+        self.matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(RAINBOW_FOODS))
+        self.meal_rows = {meal_id: i for i, meal_id in enumerate(meals)}
+        self.partner_rows = {partner: len(meals) + i for i, partner in enumerate(data.snack_partners)}
+        self.food_rows = {food: len(meals) + len(data.snack_partners) + i for i, food in enumerate(foods)}
+        self._tables: Dict[Hashable, PreferenceTable] = {}
+
+    def table(self, key: Hashable, meals: Sequence[Sequence[MealSlot]], partners: Sequence[str],
+              boost_foods: Sequence[Sequence[str]]) -> PreferenceTable:
+        """The stacked table for these choice groups (cached under `key`, which must determine them)."""
+        found = self._tables.get(key)
+        if found is None:
+            groups = ([[self.meal_rows[m.meal_id] for m in options] for options in meals]
+                      + [[self.partner_rows[p] for p in partners]]
+                      + [[self.food_rows[f] for f in foods] for foods in boost_foods])
+            bounds, start = [], 0
+            for rows in groups:
+                bounds.append((start, start + len(rows)))
+                start += len(rows)
+            found = PreferenceTable(self.matrix[[i for rows in groups for i in rows]], bounds)
+            found = self._tables.setdefault(key, found)
+        return found
+
+
+if HAS_NUMPY:
+    _SHIFTS = np.arange(len(RAINBOW_FOODS))
+    registry.register_index("preferences", PreferenceIndex)
@@ -0,0 +1,132 @@
+"""
+WelFore Health Request Profiling
+Opt-in cProfile capture of individual requests.
+
+Nothing is profiled unless PROFILING_ENABLED is set. A request is then
+profiled when it carries `X-Profile: <ADMIN_TOKEN>`, or when it is picked by
+PROFILE_SAMPLE_RATE (fraction of requests to matching routes, for
+production-shaped traffic). Profiles are written to PROFILE_DIR as
+`<request_id>.prof`, and only the newest PROFILE_MAX_FILES are kept.
+
+cProfile sees everything the event loop thread runs while the request is
+in flight, so only one request is profiled at a time per worker.
+
+Usage:
+    python profiling.py show profiles/<request_id>.prof [--sort cumulative] [--top 30]
+    python profiling.py list
+"""
+
+import asyncio
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from logger_utils import log_event, request_id_var
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ROUTES = [r.strip() for r in os.getenv("PROFILE_ROUTES", "/submit,/webhook/quiz").split(",") if r.strip()]
+
+PROFILE_HEADER = b"x-profile"
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Constant-time check of an admin token; always False when ADMIN_TOKEN is unset."""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def prune_profiles(directory: Path = PROFILE_DIR, keep: int = PROFILE_MAX_FILES):
+    """Delete all but the newest `keep` profiles."""
+    files = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[keep:]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def list_profiles(directory: Path = PROFILE_DIR) -> List[Path]:
+    return sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def save_profile(profiler: cProfile.Profile, request_id: str) -> Path:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{request_id}.prof"
+    profiler.dump_stats(str(path))
+    prune_profiles()
+    return path
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+class ProfilingMiddleware:
+    """Profiles admin-requested or sampled requests with cProfile."""
+
+    def __init__(self, app):
+        self.app = app
+        self.active = False
+        self.captured = 0
+
+    def wanted(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return is_admin(value.decode("latin-1"))
+        return (PROFILE_SAMPLE_RATE > 0 and scope["path"] in PROFILE_ROUTES
+                and random.random() < PROFILE_SAMPLE_RATE)
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ENABLED or scope["type"] != "http" or self.active or not self.wanted(scope):
+            return await self.app(scope, receive, send)
+
+        request_id = request_id_var.get() or f"{int(time.time() * 1000)}-{os.getpid()}"
+        profile_header = f"{request_id}.prof".encode()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_header)]
+            await send(message)
+
+        self.active = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            self.active = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            path = await asyncio.to_thread(save_profile, profiler, request_id)
+            self.captured += 1
+            log_event("request_profiled", path=scope["path"], profile=str(path), duration_ms=round(elapsed_ms, 2))
+
+
+# -----------------------------
+# COMMAND LINE
+# -----------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect request profiles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print the top functions of a profile")
+    show.add_argument("profile")
+    show.add_argument("--sort", default="cumulative", help="cumulative, tottime, ncalls, ...")
+    show.add_argument("--top", type=int, default=30)
+    sub.add_parser("list", help="list stored profiles, newest first")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for p in list_profiles():
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(p.stat().st_mtime))}  {p}")
+    else:
+        pstats.Stats(args.profile).strip_dirs().sort_stats(args.sort).print_stats(args.top)
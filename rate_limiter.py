@@ -0,0 +1,286 @@
+"""
+WelFore Health Admission Control
+Token-bucket rate limiting for the endpoints that fan out to GHL and SMTP.
+
+Each limited route can have three buckets, checked in this order:
+  - per client IP
+  - per email address (read from the JSON or form body)
+  - global for the route (protects the GHL location-wide API limit)
+
+Buckets live in process memory by default. Set RATE_LIMIT_REDIS_URL (and install
+`redis`) to share them between workers and instances.
+"""
+
+import importlib.util
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from logger_utils import logger
+from metrics import REGISTRY
+
+RATE_LIMITED = REGISTRY.counter("welfore_rate_limited_total", "Requests rejected with 429", ("route", "bucket"))
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))   # proxies that append X-Forwarded-For
+MAX_TRACKED_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+MAX_BODY_BYTES = 64 * 1024
+
+HAS_REDIS = importlib.util.find_spec("redis") is not None
+
+# Limits are "<requests>/<sec|min|hour>"; the request count is also the burst size.
+# Override with RATE_LIMITS='{"/webhook/quiz": {"ip": "10/min", "email": "2/min", "global": "100/min"}}'
+DEFAULT_ROUTE_LIMITS = {
+    "/webhook/quiz": {"ip": "20/min", "email": "3/min", "global": "300/min"},
+    "/freemium-check": {"ip": "20/min", "email": "3/min", "global": "300/min"},
+}
+
+_PERIODS = {"s": 1, "sec": 1, "second": 1, "m": 60, "min": 60, "minute": 60, "h": 3600, "hour": 3600}
+
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """Turn '20/min' into (capacity, tokens per second)."""
+    count, _, period = spec.partition("/")
+    seconds = _PERIODS.get(period.strip().lower() or "s")
+    if seconds is None:
+        raise ValueError(f"Unknown rate period in {spec!r}")
+    capacity = float(count)
+    return capacity, capacity / seconds
+
+
+def load_route_limits() -> Dict[str, Dict[str, Tuple[float, float]]]:
+    limits = DEFAULT_ROUTE_LIMITS
+    override = os.getenv("RATE_LIMITS", "").strip()
+    if override:
+        try:
+            limits = json.loads(override)
+        except ValueError as e:
+            logger.error(f"Ignoring invalid RATE_LIMITS setting: {e}")
+    return {
+        route: {scope: parse_rate(spec) for scope, spec in scopes.items() if spec}
+        for route, scopes in limits.items()
+    }
+
+
+# -----------------------------
+# BUCKET STORES
+# -----------------------------
+class MemoryBucketStore:
+    """Token buckets in a dict of key -> [tokens, last_refill], least recently used first."""
+
+    def __init__(self, max_keys: int = MAX_TRACKED_KEYS):
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.max_keys = max_keys
+
+    async def consume(self, key: str, capacity: float, rate: float) -> float:
+        """Take one token. Returns 0 when admitted, else seconds until a token is available."""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._evict(now)
+            bucket = self.buckets[key] = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / rate
+
+    def _evict(self, now: float):
+        # A bucket idle long enough to have refilled is indistinguishable from a new one
+        while self.buckets:
+            key, (_, last) = next(iter(self.buckets.items()))
+            if now - last <= 3600:
+                break
+            del self.buckets[key]
+        # Still full: drop the least recently used tenth, not every client's bucket at once
+        if len(self.buckets) >= self.max_keys:
+            for _ in range(max(1, self.max_keys // 10)):
+                self.buckets.popitem(last=False)
+
+
+class RedisBucketStore:
+    """Token buckets shared through Redis; refill and take happen atomically in Lua."""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+        self.client = redis_asyncio.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def consume(self, key: str, capacity: float, rate: float) -> float:
+        wait = await self.script(keys=[f"welfore:rl:{key}"], args=[capacity, rate, time.time()])
+        return float(wait)
+
+
+def create_bucket_store():
+    if RATE_LIMIT_REDIS_URL and HAS_REDIS:
+        print("✅ Rate limiter using shared Redis buckets")
+        return RedisBucketStore(RATE_LIMIT_REDIS_URL), True
+    if RATE_LIMIT_REDIS_URL:
+        print("⚠️ RATE_LIMIT_REDIS_URL set but redis is not installed - using in-memory buckets")
+    return MemoryBucketStore(), False
+
+
+# -----------------------------
+# REQUEST INSPECTION
+# -----------------------------
+def client_ip(scope: Dict[str, Any]) -> str:
+    """Client address; with TRUSTED_PROXY_HOPS set, the X-Forwarded-For entry our proxy appended.
+
+    Without a proxy that appends to the header, a client could pick its own
+    bucket key by sending one, so the header is ignored by default.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                hops = [h.strip() for h in value.decode("latin-1").split(",") if h.strip()]
+                if hops:
+                    return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def extract_email(body: bytes, content_type: str) -> Optional[str]:
+    try:
+        if "application/json" in content_type:
+            data = json.loads(body or b"{}")
+            email = data.get("email") if isinstance(data, dict) else None
+        elif "application/x-www-form-urlencoded" in content_type:
+            email = (parse_qs(body.decode("utf-8", "replace")).get("email") or [None])[0]
+        else:
+            return None
+    except ValueError:
+        return None
+    if isinstance(email, str) and email.strip():
+        return email.strip().lower()
+    return None
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+class AdmissionControlMiddleware:
+    """Rejects over-limit requests with 429 + Retry-After before the route runs."""
+
+    def __init__(self, app, route_limits: Optional[Dict[str, Dict[str, Tuple[float, float]]]] = None,
+                 store=None, workers: Optional[int] = None):
+        self.app = app
+        self.route_limits = route_limits if route_limits is not None else load_route_limits()
+        shared = store is not None
+        if store is None:
+            store, shared = create_bucket_store()
+        self.store = store
+        self.rejected = 0
+
+        # In-memory buckets are per worker, so split each limit between the workers
+        # to keep the effective total close to the configured one.
+        if not shared:
+            workers = workers or int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+            if workers > 1:
+                self.route_limits = {
+                    route: {s: (max(1.0, cap / workers), rate / workers) for s, (cap, rate) in scopes.items()}
+                    for route, scopes in self.route_limits.items()
+                }
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope.get("method") != "POST":
+            return await self.app(scope, receive, send)
+        limits = self.route_limits.get(scope["path"])
+        if not limits:
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if "ip" in limits:
+            wait = await self.store.consume(f"ip:{path}:{client_ip(scope)}", *limits["ip"])
+            if wait:
+                return await self.reject(send, wait, path, "ip")
+
+        if "email" in limits:
+            messages, body = await self.read_body(receive)
+            content_type = ""
+            for name, value in scope.get("headers", []):
+                if name == b"content-type":
+                    content_type = value.decode("latin-1").lower()
+                    break
+            email = extract_email(body, content_type)
+            if email:
+                wait = await self.store.consume(f"email:{path}:{email}", *limits["email"])
+                if wait:
+                    return await self.reject(send, wait, path, "email")
+            receive = self.replay(messages, receive)
+
+        if "global" in limits:
+            wait = await self.store.consume(f"global:{path}", *limits["global"])
+            if wait:
+                return await self.reject(send, wait, path, "global")
+
+        return await self.app(scope, receive, send)
+
+    async def read_body(self, receive):
+        messages, chunks, size = [], [], 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size <= MAX_BODY_BYTES:
+                chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks) if size <= MAX_BODY_BYTES else b""
+        return messages, body
+
+    @staticmethod
+    def replay(messages, receive):
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+        return replay_receive
+
+    async def reject(self, send, wait: float, path: str, scope_name: str):
+        self.rejected += 1
+        RATE_LIMITED.inc(path, scope_name)
+        retry_after = max(1, math.ceil(wait))
+        logger.warning(f"Rate limit ({scope_name}) exceeded on {path}; retry after {retry_after}s")
+        body = json.dumps({"status": "error", "message": "Too many requests", "retry_after": retry_after}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,329 @@
+"""
+WelFore Health Shopping List
+Aggregated, family-scaled shopping lists for multi-day meal plans.
+
+data/ingredients.json gives the per-serving ingredients of every meal, snack
+item and color-boost food. For each data snapshot they are compiled into an
+IngredientTable: one row per plan item, one column per ingredient in base
+units (g, ml, or a count such as cans), with columns ordered by aisle and
+name. A plan's list is then one bincount of the items it contains, one
+matrix-vector product scaled by family size, and a vectorized conversion to
+purchase units, whatever the number of days or line items.
+
+Lists are cached per data version by plan key (a hash of the plan's meals,
+snacks and boosts) and family size. A ShoppingList is built once and any of
+its formats is streamed from it with iter_html / iter_csv / iter_json.
+
+CLI (for content editors):
+    python shopping_list.py check
+    python shopping_list.py sample --cuisine Caribbean --days 7 --family-size 4 --format csv
+"""
+
+import argparse
+import csv
+import hashlib
+import html
+import io
+import json
+import logging
+import random
+import sys
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from data_registry import DataSnapshot, VersionedCache, registry
+from logger_utils import log_event
+from plan_model import MealPlan
+
+MAX_FAMILY_SIZE = 20
+OTHER_AISLE = "Other"
+
+# Purchase units promoted to a larger unit once the amount reaches one of it
+LARGER_UNITS = {"oz": "lb", "tsp": "tbsp", "tbsp": "cup", "g": "kg", "ml": "l"}
+# Rounding step per purchase unit; counts (cans, bunches, ...) round up to whole items
+FRACTIONAL_STEPS = {"lb": 0.25, "kg": 0.25, "cup": 0.25, "l": 0.25}
+PLURAL_UNITS = {"can": "cans", "bunch": "bunches", "head": "heads", "slice": "slices", "cup": "cups",
+                "lb": "lb", "oz": "oz", "tsp": "tsp", "tbsp": "tbsp"}
+
+FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+}
+
+
+# -----------------------------
+# LIST OBJECTS
+# -----------------------------
+@dataclass(frozen=True, slots=True)
+class ShoppingItem:
+    name: str
+    aisle: str
+    quantity: float     # in `unit`, rounded up to what can be bought
+    unit: str
+
+    @property
+    def amount(self) -> str:
+        """Quantity and unit for display, e.g. "2 cans", "1.5 lb", "3"."""
+        if self.unit == "each":
+            return f"{self.quantity:g}"
+        unit = PLURAL_UNITS.get(self.unit, self.unit) if self.quantity > 1 else self.unit
+        return f"{self.quantity:g} {unit}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "aisle": self.aisle, "quantity": self.quantity, "unit": self.unit}
+
+
+@dataclass(frozen=True, slots=True)
+class ShoppingList:
+    plan_key: str
+    family_size: int
+    days: int
+    items: Tuple[ShoppingItem, ...]     # grouped by aisle, then by name
+
+    def aisles(self) -> Iterator[Tuple[str, List[ShoppingItem]]]:
+        for aisle, items in groupby(self.items, key=lambda item: item.aisle):
+            yield aisle, list(items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as iter_json() produces."""
+        return {"plan_key": self.plan_key, "family_size": self.family_size, "days": self.days,
+                "items": [item.to_dict() for item in self.items]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ShoppingList":
+        items = tuple(ShoppingItem(i["name"], i["aisle"], i["quantity"], i["unit"]) for i in data["items"])
+        return cls(data["plan_key"], data["family_size"], data["days"], items)
+
+
+# -----------------------------
+# INGREDIENT TABLE
+# -----------------------------
+class IngredientTable:
+    """Per-snapshot item × ingredient matrix and purchase-unit conversions."""
+
+    __slots__ = ("names", "aisles", "matrix", "meal_rows", "snack_rows", "boost_rows", "uncovered",
+                 "_to_unit", "_unit", "_larger_factor", "_larger_unit", "_step", "_larger_step")
+
+    def __init__(self, data: DataSnapshot):
+        spec = data.ingredients
+        units: Dict[str, List] = spec["units"]
+        ingredients: Dict[str, Dict[str, str]] = dict(spec["ingredients"])
+
+        # Items without ingredient entries are listed as themselves so nothing
+        # silently drops off the list
+        items: List[Tuple[str, str, List[List]]] = []
+        self.uncovered: List[str] = []
+
+        def add(section: str, name: str):
+            entries = spec[section].get(name)
+            if entries is None:
+                self.uncovered.append(f"{section}: {name}")
+                ingredients.setdefault(name, {"aisle": OTHER_AISLE, "unit": "each"})
+                entries = [[name, 1, "each"]]
+            items.append((section, name, entries))
+
+        meals = dict.fromkeys(m for palette in data.cuisine_meals.values()
+                              for slot in ("breakfast", "lunch", "dinner") for m in palette[slot])
+        for meal in meals:
+            add("meals", meal)
+        for name in dict.fromkeys(data.proteins + data.snack_partners):
+            add("snacks", name)
+        for food in dict.fromkeys(f for foods in data.color_foods.values() for f in foods):
+            add("color_foods", food)
+        if self.uncovered:
+            log_event("shopping_list_uncovered_items", level=logging.WARNING,
+                      count=len(self.uncovered), items=self.uncovered[:20])
+
+        # Columns in display order: aisles as first listed in the file, then name
+        aisle_rank = {aisle: i for i, aisle in enumerate(dict.fromkeys(i["aisle"] for i in ingredients.values()))}
+        self.names = sorted(ingredients, key=lambda n: (aisle_rank[ingredients[n]["aisle"]], n.lower()))
+        column = {name: i for i, name in enumerate(self.names)}
+        self.aisles = [ingredients[n]["aisle"] for n in self.names]
+
+        def base(unit: str) -> float:
+            return float(units[unit][1]) if unit in units else 1.0
+
+        self.matrix = np.zeros((len(items), len(self.names)), dtype=np.float64)
+        self.meal_rows: Dict[int, int] = {}
+        self.snack_rows: Dict[str, int] = {}
+        self.boost_rows: Dict[str, int] = {}
+        rows = {"meals": self.meal_rows, "snacks": self.snack_rows, "color_foods": self.boost_rows}
+        for row, (section, name, entries) in enumerate(items):
+            rows[section][data.meal_ids[name] if section == "meals" else name] = row
+            for ingredient, quantity, unit in entries:
+                self.matrix[row, column[ingredient]] += quantity * base(unit)
+
+        # Base units -> purchase unit, and the larger unit it is promoted to
+        purchase = [ingredients[n]["unit"] for n in self.names]
+        larger = [LARGER_UNITS.get(u) if LARGER_UNITS.get(u) in units else None for u in purchase]
+        self._unit = purchase
+        self._to_unit = np.array([1.0 / base(u) for u in purchase])
+        self._larger_unit = [lu or u for u, lu in zip(purchase, larger)]
+        self._larger_factor = np.array([base(lu) / base(u) if lu else np.inf for u, lu in zip(purchase, larger)])
+        self._step = np.array([FRACTIONAL_STEPS.get(u, 1.0) for u in purchase])
+        self._larger_step = np.array([FRACTIONAL_STEPS.get(u, 1.0) for u in self._larger_unit])
+
+    def item_counts(self, plan: MealPlan) -> np.ndarray:
+        """How many servings of each table row the plan contains."""
+        rows: List[int] = []
+        append = rows.append
+        meal_rows, snack_rows, boost_rows = self.meal_rows, self.snack_rows, self.boost_rows
+        for day in plan.days:
+            for meal in day.meals:
+                append(meal_rows[meal.meal_id])
+            for s in day.snacks:
+                append(snack_rows[s.protein])
+                append(snack_rows[s.partner])
+            for _color, food in day.boosts:
+                append(boost_rows[food])
+        return np.bincount(rows, minlength=self.matrix.shape[0])
+
+    def aggregate(self, plan: MealPlan, family_size: int = 1, key: Optional[str] = None) -> ShoppingList:
+        """The plan's deduplicated shopping list for `family_size` people."""
+        totals = (self.item_counts(plan) @ self.matrix) * family_size
+        columns = np.flatnonzero(totals)
+        quantity = totals[columns] * self._to_unit[columns]
+        promote = quantity >= self._larger_factor[columns]
+        quantity = np.where(promote, quantity / np.where(promote, self._larger_factor[columns], 1.0), quantity)
+        step = np.where(promote, self._larger_step[columns], self._step[columns])
+        # Round up to what can be bought; the epsilon keeps 2.0000001 cans at 2
+        quantity = np.ceil(quantity / step - 1e-9) * step
+        items = tuple(
+            ShoppingItem(self.names[c], self.aisles[c], float(q),
+                         self._larger_unit[c] if p else self._unit[c])
+            for c, q, p in zip(columns.tolist(), quantity.tolist(), promote.tolist())
+        )
+        return ShoppingList(key or plan_key(plan), family_size, len(plan.days), items)
+
+
+registry.register_index("shopping_list", IngredientTable)
+
+
+# -----------------------------
+# AGGREGATION
+# -----------------------------
+_lists = VersionedCache("shopping_list", maxsize=1024)
+
+
+def plan_key(plan: MealPlan) -> str:
+    """Stable hash of what a plan's shopping list depends on (not the user's name)."""
+    h = hashlib.blake2b(digest_size=8)
+    for day in plan.days:
+        parts = [m.text for m in day.meals]
+        parts.extend(f"{s.protein}+{s.partner}" for s in day.snacks)
+        parts.extend(food for _color, food in day.boosts)
+        h.update("\x1f".join(parts).encode())
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def family_servings(family_size: Optional[int]) -> int:
+    """Servings per meal for a quiz family size (blank or out of range -> 1..MAX_FAMILY_SIZE)."""
+    return min(max(int(family_size or 1), 1), MAX_FAMILY_SIZE)
+
+
+def build_shopping_list(plan: MealPlan, family_size: Optional[int] = 1,
+                        data: Optional[DataSnapshot] = None) -> ShoppingList:
+    """The aggregated list for `plan`, cached by plan key and family size.
+
+    `data` must be the snapshot the plan was built from (default: current).
+    """
+    data = data or registry.current()
+    servings = family_servings(family_size)
+    key = plan_key(plan)
+    return _lists.get_or_build(
+        data.version, (key, servings),
+        lambda: data.index("shopping_list").aggregate(plan, servings, key))
+
+
+# -----------------------------
+# STREAMING FORMATS
+# -----------------------------
+def iter_html(shopping_list: ShoppingList) -> Iterator[str]:
+    """HTML fragment for the results page or an HTML download."""
+    people = "person" if shopping_list.family_size == 1 else "people"
+    yield (f'<div class="shopping-list"><h3>🛒 Shopping List</h3>'
+           f'<p class="note">{shopping_list.days} days • {shopping_list.family_size} {people}</p>')
+    for aisle, items in shopping_list.aisles():
+        yield f"<h4>{html.escape(aisle)}</h4><ul>"
+        for item in items:
+            yield f"<li>{html.escape(item.name)} <strong>{html.escape(item.amount)}</strong></li>"
+        yield "</ul>"
+    yield "</div>"
+
+
+def iter_csv(shopping_list: ShoppingList) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("aisle", "item", "quantity", "unit"))
+    yield buffer.getvalue()
+    for item in shopping_list.items:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow((item.aisle, item.name, f"{item.quantity:g}", item.unit))
+        yield buffer.getvalue()
+
+
+def iter_json(shopping_list: ShoppingList) -> Iterator[str]:
+    yield (f'{{"plan_key":{json.dumps(shopping_list.plan_key)},"family_size":{shopping_list.family_size},'
+           f'"days":{shopping_list.days},"items":[')
+    separator = ""
+    for item in shopping_list.items:
+        yield separator + json.dumps(item.to_dict(), ensure_ascii=False, separators=(",", ":"))
+        separator = ","
+    yield "]}"
+
+
+_RENDERERS = {"html": iter_html, "csv": iter_csv, "json": iter_json}
+
+
+def stream(shopping_list: ShoppingList, fmt: str) -> Iterator[str]:
+    """Chunks of the list in `fmt` (html, csv or json); media type is FORMATS[fmt]."""
+    try:
+        renderer = _RENDERERS[fmt]
+    except KeyError:
+        raise ValueError(f"Unknown shopping list format {fmt!r} (choose from {', '.join(FORMATS)})") from None
+    return renderer(shopping_list)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check ingredient coverage or print a sample shopping list.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("check", help="list meals, snacks and boost foods without ingredients")
+    sample = sub.add_parser("sample", help="print the shopping list of a generated plan")
+    sample.add_argument("--cuisine", default="Mediterranean")
+    sample.add_argument("--days", type=int, default=7)
+    sample.add_argument("--family-size", type=int, default=1)
+    sample.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    sample.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    data = registry.current()
+    table: IngredientTable = data.index("shopping_list")
+    if args.command == "check":
+        for item in table.uncovered:
+            print(f"⚠️ no ingredients: {item}")
+        print(f"{len(table.names)} ingredients, {table.matrix.shape[0]} items, {len(table.uncovered)} uncovered")
+        return 1 if table.uncovered else 0
+
+    from master_engine import build_meal_plan
+    random.seed(args.seed)
+    plan = build_meal_plan({"cuisines": [args.cuisine], "plan_duration": args.days}, data)
+    for chunk in stream(build_shopping_list(plan, args.family_size, data), args.format):
+        sys.stdout.write(chunk)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
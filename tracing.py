@@ -0,0 +1,293 @@
+"""
+WelFore Health Request Tracing
+Request IDs carried in a contextvar, plus lightweight timing spans.
+
+Every request gets an ID (the incoming X-Request-ID header when valid, else a
+new one) that is returned in the X-Request-ID response header and attached to
+every structured log event. Spans record how long the engine, GHL and SMTP
+calls took and are written as `span` log events. Set OTLP_ENDPOINT to also
+export them in OTLP/HTTP JSON; `python tracing.py collector` runs a local
+stand-in collector that prints what it receives.
+"""
+
+import collections
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from logger_utils import log_event, request_id_var
+
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "").rstrip("/")   # e.g. http://localhost:4318
+OTLP_SERVICE_NAME = os.getenv("OTLP_SERVICE_NAME", "askwelfore-app")
+OTLP_FLUSH_INTERVAL = float(os.getenv("OTLP_FLUSH_INTERVAL", "2"))
+OTLP_MAX_QUEUE = int(os.getenv("OTLP_MAX_QUEUE", "5000"))
+OTLP_BATCH_SIZE = 512
+
+REQUEST_ID_HEADER = b"x-request-id"
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9_.-]{8,64}$")
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+class span:
+    """Time a block of work as a child of the current span.
+
+        with span("engine.generate_plan", plan_duration=7):
+            ...
+    """
+
+    __slots__ = ("name", "attributes", "span", "token")
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        parent = _current_span.get()
+        if parent is not None:
+            self.span = Span(self.name, parent.trace_id, parent.span_id, self.attributes)
+        else:
+            self.span = Span(self.name, _trace_id.get() or secrets.token_hex(16), None, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        finish_span(self.span)
+        return False
+
+
+def traced(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def finish_span(s: Span):
+    fields = {
+        "span": s.name,
+        "trace_id": s.trace_id,
+        "span_id": s.span_id,
+        "parent_id": s.parent_id,
+        "duration_ms": round(s.duration_ms, 3),
+    }
+    if s.error:
+        fields["error"] = s.error
+    fields.update(s.attributes)
+    # Failed spans are warnings, so they survive log sampling (logger_utils.LogSampler)
+    failed = s.error or s.attributes.get("status", 0) >= 500
+    log_event("span", level=logging.WARNING if failed else logging.INFO, **fields)
+    if OTLP_ENDPOINT:
+        exporter.add(s)
+
+
+# -----------------------------
+# OTLP/HTTP JSON EXPORT
+# -----------------------------
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span) -> dict:
+    data = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 2 if s.parent_id is None else 1,   # SERVER for the request, INTERNAL below it
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        data["parentSpanId"] = s.parent_id
+    return data
+
+
+class OTLPExporter:
+    """Batches finished spans and posts them from a background thread."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = f"{endpoint}/v1/traces"
+        self.queue = collections.deque(maxlen=OTLP_MAX_QUEUE)
+        self.thread: Optional[threading.Thread] = None
+        self.pid = 0
+        self.failures = 0
+
+    def add(self, s: Span):
+        self.queue.append(s)
+        if self.pid != os.getpid():   # first span in this (possibly forked) process
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(OTLP_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        while self.queue:
+            batch = [self.queue.popleft() for _ in range(min(OTLP_BATCH_SIZE, len(self.queue)))]
+            body = json.dumps({"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": OTLP_SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "welfore.tracing"}, "spans": [_otlp_span(s) for s in batch]}],
+            }]}).encode()
+            request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError:
+                self.failures += 1
+                return
+
+
+exporter = OTLPExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+class TracingMiddleware:
+    """Assigns the request ID, opens the root span and echoes X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER:
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        trace_id = request_id if request_id and _HEX32.match(request_id) else secrets.token_hex(16)
+        request_id = request_id or trace_id
+        header_value = request_id.encode()
+
+        status = [0]
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER, header_value)]
+            await send(message)
+
+        rid_token = request_id_var.set(request_id)
+        trace_token = _trace_id.set(trace_id)
+        try:
+            with span("http.request", method=scope.get("method", ""), path=scope["path"]) as root:
+                await self.app(scope, receive, send_with_request_id)
+                route = scope.get("route")
+                root.attributes["route"] = getattr(route, "path", None) or "unmatched"
+                root.attributes["status"] = status[0]
+        finally:
+            _trace_id.reset(trace_token)
+            request_id_var.reset(rid_token)
+
+
+# -----------------------------
+# LOCAL COLLECTOR STAND-IN
+# -----------------------------
+def run_collector(port: int = 4318, output: Optional[str] = None):
+    """Minimal OTLP/HTTP JSON receiver: prints one line per span, optionally appends JSON lines to a file."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            for resource in payload.get("resourceSpans", []):
+                for scope_spans in resource.get("scopeSpans", []):
+                    for s in scope_spans.get("spans", []):
+                        ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+                        indent = "  " if s.get("parentSpanId") else ""
+                        print(f"{s['traceId'][:8]} {indent}{s['name']:<32} {ms:9.2f} ms")
+                        if output:
+                            with open(output, "a") as f:
+                                f.write(json.dumps(s) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    print(f"🛰️  OTLP collector stand-in listening on http://localhost:{port}/v1/traces")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="WelFore tracing utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    collector = sub.add_parser("collector", help="run a local OTLP/HTTP collector stand-in")
+    collector.add_argument("--port", type=int, default=4318)
+    collector.add_argument("--output", help="append received spans to this JSON lines file")
+    args = parser.parse_args()
+    run_collector(args.port, args.output)
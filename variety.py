@@ -0,0 +1,136 @@
+"""
+WelFore Health Variety Scheduler
+No-repeat rotations of meals, snacks and boosts across a plan.
+
+A cuisine has only a few options per meal slot, so picking each day
+independently serves the same dish on consecutive days. Instead every slot
+(breakfast, lunch, dinner, and the boost food of each boost color) follows a
+rotation:
+
+  - The days run through the options in cycles: every option once per cycle,
+    so over a plan each option is served equally often (give or take one).
+  - Between cycles the order may change, but a dish never comes back sooner
+    than min(MIN_GAP, options) days after it was last served. Two options
+    alternate; five options never repeat within three days.
+
+The rotation patterns (sequences of option indexes) depend only on the
+number of options and the plan length, so they are generated once per size
+and cached. A plan picks one of the VARIANTS patterns and relabels it with a
+shuffle of its options, which costs O(options + days) per slot: a 14-day plan
+is as cheap to schedule as a 3-day one. With rainbow preferences the shuffle
+is weighted (preferences.py), so liked options lead each cycle and are the
+ones a plan shorter than the rotation gets.
+
+Snacks walk the proteins x partners grid like a Latin square: snack k pairs
+protein k mod P with partner (k mod P + k div P) mod Q. Proteins rotate
+through every protein, and no pairing repeats until the whole grid has been
+served.
+
+Everything is drawn from the plan's rng, so a seed still fixes the plan.
+"""
+
+import random
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple, TypeVar
+
+MIN_GAP = 3       # days before a dish may return, when the slot has that many options
+VARIANTS = 16     # rotation patterns generated per (options, days)
+_ATTEMPTS = 32    # reorderings tried per cycle before repeating the previous order
+
+T = TypeVar("T")
+
+
+# -----------------------------
+# PRECOMPUTED PATTERNS
+# -----------------------------
+@lru_cache(maxsize=256)
+def rotations(size: int, days: int) -> Tuple[Tuple[int, ...], ...]:
+    """Distinct rotation patterns of `days` option indexes over `size` options.
+
+    Each pattern starts with 0..size-1 (the shuffle decides what those are)
+    and continues in cycles that keep every repeat at least
+    min(MIN_GAP, size) days apart. Generated from a fixed seed, so every
+    worker has the same patterns. No options give no patterns.
+    """
+    if size <= 0:
+        return ()
+    gap = min(MIN_GAP, size)
+    generator = random.Random(size * 1009 + days)
+    patterns = []
+    for _ in range(VARIANTS):
+        order = list(range(size))
+        pattern = list(order)
+        while len(pattern) < days:
+            # An option at position p of this cycle returns (size - p) + q days later at position q of the next
+            last = {option: size - p for p, option in enumerate(order)}
+            for _attempt in range(_ATTEMPTS):
+                candidate = generator.sample(range(size), size)
+                if all(last[option] + q >= gap for q, option in enumerate(candidate)):
+                    order = candidate
+                    break
+            pattern.extend(order)
+        patterns.append(tuple(pattern[:days]))
+    return tuple(dict.fromkeys(patterns))
+
+
+@lru_cache(maxsize=256)
+def pairings(proteins: int, partners: int, count: int, shared: bool = False) -> Tuple[Tuple[int, int], ...]:
+    """(protein index, partner index) for `count` snacks, walking the grid like a Latin square.
+
+    `shared` means proteins and partners are the same list (no protein fits
+    the restrictions), so the walk skips the diagonal rather than pair an
+    item with itself. A single shared item can only pair with itself.
+    """
+    walk = []
+    for k in range(count):
+        protein, shift = k % proteins, k // proteins
+        if shared and partners > 1:
+            shift = 1 + shift % (partners - 1)
+        walk.append((protein, (protein + shift) % partners))
+    return tuple(walk)
+
+
+# -----------------------------
+# PER-PLAN SCHEDULES
+# -----------------------------
+def shuffled(options: Sequence[T], rng: Any = random, weights: Optional[Sequence[float]] = None) -> List[T]:
+    """The options in random order; with weights, heavier options tend to come first.
+
+    Weighted order uses Efraimidis-Spirakis keys (u ** (1 / w)), which is
+    sampling without replacement in proportion to the weights.
+    """
+    if weights is None:
+        order = list(options)
+        rng.shuffle(order)
+        return order
+    draw = rng.random
+    keys = [draw() ** (1.0 / w) for w in weights]
+    return [options[i] for i in sorted(range(len(options)), key=keys.__getitem__, reverse=True)]
+
+
+def rotation(options: Sequence[T], days: int, rng: Any = random,
+             weights: Optional[Sequence[float]] = None) -> List[T]:
+    """The option for each of `days` days: balanced cycles with no repeat sooner than min(MIN_GAP, options)."""
+    if days <= 0 or not options:
+        return []
+    patterns = rotations(len(options), days)
+    pattern = patterns[rng.randrange(len(patterns))] if len(patterns) > 1 else patterns[0]
+    labels = shuffled(options, rng, weights)
+    return [labels[i] for i in pattern]
+
+
+def snack_pairs(proteins: Sequence[str], partners: Sequence[str], count: int, rng: Any = random,
+                weights: Optional[Sequence[float]] = None) -> List[Tuple[str, str]]:
+    """(protein, partner) for `count` snacks, spread over the proteins x partners grid.
+
+    `weights` apply to the partners. When proteins and partners are the same
+    list, one shuffle labels both so the walk never pairs an item with itself,
+    unless the list has only that one item.
+    """
+    if count <= 0:
+        return []
+    shared = proteins is partners
+    partner_labels = shuffled(partners, rng, weights)
+    protein_labels = partner_labels if shared else shuffled(proteins, rng)
+    return [(protein_labels[p], partner_labels[q])
+            for p, q in pairings(len(proteins), len(partners), count, shared)]